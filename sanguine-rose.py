@@ -22,7 +22,7 @@ from sanguine.commands.togithub import togithub
 def _usage() -> None:
     thisscriptcall = os.path.split(sys.argv[0])[0]
     info('usage:')
-    info('-> {} <ProjectConfig.json5>'.format(thisscriptcall))
+    info('-> {} [--parallel-start=spawn|fork|forkserver] [--log-jsonl] <ProjectConfig.json5>'.format(thisscriptcall))
 
 
 if __name__ == '__main__':
@@ -30,6 +30,22 @@ if __name__ == '__main__':
     if len(sys.argv) == 2 and sys.argv[1] == 'test':
         argv = ['../../local-sanguine-project.json5']
 
+    _PARALLEL_START_OPTION = '--parallel-start='
+    for arg in [a for a in argv if a.startswith(_PARALLEL_START_OPTION)]:
+        argv.remove(arg)
+        startmodes = {'spawn': tasks.ParallelStartMode.Spawn, 'fork': tasks.ParallelStartMode.Fork,
+                      'forkserver': tasks.ParallelStartMode.Forkserver}
+        startmode = startmodes.get(arg[len(_PARALLEL_START_OPTION):])
+        if startmode is None:
+            _usage()
+            sys.exit(1)
+        tasks.set_default_parallel_start_mode(startmode)
+
+    _LOG_JSONL_OPTION = '--log-jsonl'
+    logjsonl = _LOG_JSONL_OPTION in argv
+    if logjsonl:
+        argv.remove(_LOG_JSONL_OPTION)
+
     if len(argv) != 1:
         _usage()
         sys.exit(1)
@@ -41,7 +57,14 @@ if __name__ == '__main__':
     raise_if_not(os.path.isfile(cfgfname))
     cfgfname = normalize_file_path(cfgfname)
     cfg = LocalProjectConfig(ui, cfgfname)
-    add_file_logging(cfg.tmp_dir + 'sanguine.log.html')
+    # --log-jsonl is for long debug runs which log a lot: compact rotating log, to be converted to HTML later
+    if logjsonl:
+        jsonlfname = cfg.tmp_dir + 'sanguine.log.jsonl'
+        add_file_logging(jsonlfname)
+        info('Logging to {}, to convert it to HTML, run: python -m sanguine.install.install_logging tohtml {} {}'.format(
+            jsonlfname, jsonlfname, cfg.tmp_dir + 'sanguine.log.html'))
+    else:
+        add_file_logging(cfg.tmp_dir + 'sanguine.log.html')
     enable_ex_logging()
 
     with TmpPath(cfg.tmp_dir) as tmp:
@@ -77,12 +100,25 @@ if __name__ == '__main__':
                 case 'togithub':
                     togithub(cfg, wcache)
 
+                case 'profile.imports':
+                    from sanguine.helpers.import_profile import (log_import_profile, check_import_budgets,
+                                                                 MASTER_STARTUP_MODULES, WORKER_STARTUP_MODULES)
+
+                    if len(command) >= 2 and command[1] == 'bench':
+                        if not check_import_budgets():  # same as import_profile's __main__, for scripted runs
+                            alert('profile.imports bench: import budget exceeded, exiting with error')
+                            sys.exit(1)
+                    else:
+                        log_import_profile('Import profile for master', MASTER_STARTUP_MODULES)
+                        log_import_profile('Import profile for worker', WORKER_STARTUP_MODULES)
+
                 case 'h' | 'help' | '' | _:
                     info('commands:')
                     info('-> h|help')
                     info('-> x|exit')
                     info('-> github.install <author> <project>')
                     info('-> togithub')
+                    info('-> profile.imports [bench]')
 
         except Exception as e:
             alert('Exception {}: {!r}'.format(type(e), e.args))
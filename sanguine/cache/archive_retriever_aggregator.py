@@ -1,15 +1,21 @@
 import os.path
+import shutil
 
+import sanguine.tasks as tasks
+from sanguine.cache.extracted_blob_cache import ExtractedBlobCache
 from sanguine.common import *
-from sanguine.helpers.archives import archive_plugin_for
+from sanguine.helpers.archives import archive_plugin_for, extract_with_listing
 from sanguine.helpers.file_retriever import FileRetriever, ArchiveFileRetriever
+from sanguine.helpers.materialize import Materializer, materialize_file
 
 
 class ArchiveRetrieverAggregator:
     archives: dict[bytes, list[ArchiveFileRetriever]]  # all items in the list must have the same archive_hash()
+    _blob_cache: ExtractedBlobCache | None  # see extracted_blob_cache_for()
 
-    def __init__(self) -> None:
+    def __init__(self, blobcache: ExtractedBlobCache | None = None) -> None:
         self.archives = {}
+        self._blob_cache = blobcache
 
     @staticmethod
     def is_my_retriever(fr: FileRetriever) -> bool:
@@ -28,45 +34,259 @@ class ArchiveRetrieverAggregator:
     def all_archives_needed(self) -> list[bytes]:
         return list(self.archives.keys())
 
-    def extract_all_from_one_archive(self, tmpdir: str, arh: bytes, arpath: str) -> dict[bytes, str]:
-        # returning file_hash -> temp_path
-        assert is_normalized_dir_path(tmpdir)
-        assert is_normalized_file_path(arpath)
+    def extract_all_from_one_archive(self, tmpdir: str, arh: bytes, arpath: str,
+                                     listingcachedir: str | None = None) -> dict[bytes, str]:
+        # returning file_hash -> temp_path; listingcachedir: see archive_listing()
+        # blob cache is not trimmed here, as we may be running in a worker process; it is up to the master
+        #   to call trim() when it is done
         assert arh in self.archives
+        return self._extract(tmpdir, {arh: arpath}, listingcachedir, True)
 
-        tmpdir0 = tmpdir + '0\\'
-        plugin = archive_plugin_for(arpath)
-        assert plugin is not None
-        flist: list[str] = [aretr.single_archive_retrievers[0].file_in_archive.intra_path for aretr in
-                            self.archives[arh]]
-        plugin.extract(arpath, flist, tmpdir0)
+    def extract_all_archives(self, tmpdir: str, arpaths: dict[bytes, str],
+                             listingcachedir: str | None = None) -> dict[bytes, str]:
+        # same as extract_all_from_one_archive() for all of all_archives_needed() at once,
+        #   with archives extracted concurrently in Parallel workers
+        assert all(arh in arpaths for arh in self.archives)
+        return self._extract(tmpdir, arpaths, listingcachedir, False)
 
+    def _extract(self, tmpdir: str, arpaths: dict[bytes, str], listingcachedir: str | None,
+                 inprocess: bool) -> dict[bytes, str]:
+        # extraction itself, including nested archives, is done by ArchiveExtractionScheduler
+        assert is_normalized_dir_path(tmpdir)
+        scheduler = ArchiveExtractionScheduler(tmpdir, listingcachedir=listingcachedir, blobcache=self._blob_cache)
+        outdir = tmpdir + 'out\\'
         out: dict[bytes, str] = {}
-        nextagg = ArchiveRetrieverAggregator()
-        existingars: dict[bytes, str] = {}
-        for aretr in self.archives[arh]:
-            a0 = aretr.single_archive_retrievers[0]
-            ipath = a0.file_in_archive.intra_path
-            fpath = tmpdir0 + ipath
-            assert os.path.isfile(fpath)
-            if len(aretr.single_archive_retrievers) == 1:  # final one
-                assert a0.file_hash not in out
-                out[a0.file_hash] = fpath
-            else:  # nested
-                nextagg.add_retriever(
-                    ArchiveFileRetriever((a0.file_hash, a0.file_size), aretr.constructor_parameter_removing_parent()))
-                assert a0.file_hash not in existingars
-                existingars[a0.file_hash] = fpath
-
-        assert len(existingars) == len(nextagg.archives)
-        if not nextagg.is_empty():
-            tmpi = 1
-            for arh1 in nextagg.all_archives_needed():
-                assert arh1 in existingars
-                arpath = existingars[arh1]
-                tmpdir1 = tmpdir + str(tmpi) + '\\'
-                tmpi += 1
-                out |= nextagg.extract_all_from_one_archive(tmpdir1, arh1, arpath)
-
-        assert len(out) == len(self.archives)
+        for arh in arpaths:
+            assert is_normalized_file_path(arpaths[arh])
+            for aretr in self.archives[arh]:
+                if aretr.file_hash in out:  # same file in several places, any will do
+                    continue
+                target = outdir + aretr.file_hash.hex()
+                out[aretr.file_hash] = target
+                scheduler.add_retriever(aretr, target)
+        missing = scheduler.extract_all(arpaths, inprocess)
+        raise_if_not(len(missing) == 0, lambda: 'cannot extract {}'.format(missing))
         return out
+
+
+### ArchiveExtractionScheduler: batch extraction of a whole set of retrievers directly into target files
+
+class _ExtractionJob:
+    archive_path: str
+    archive_hash: bytes
+    delete_archive: bool  # nested archives live in tmp, and are removed as soon as they're extracted
+    final: dict[str, list[str]]  # intra_path -> target paths
+    final_hashes: dict[str, bytes]  # intra_path -> file_hash, for final ones
+    nested: dict[str, list[tuple[ArchiveFileRetriever, str]]]  # intra_path -> (retriever with parent removed, target)
+    tmp_bytes: int  # estimate of tmp space which the job occupies while in flight
+
+    def __init__(self, arpath: str, arhash: bytes, deletearchive: bool) -> None:
+        self.archive_path = arpath
+        self.archive_hash = arhash
+        self.delete_archive = deletearchive
+        self.final = {}
+        self.final_hashes = {}
+        self.nested = {}
+        self.tmp_bytes = 0
+
+    def add(self, retr: ArchiveFileRetriever, target: str) -> None:
+        a0 = retr.single_archive_retrievers[0]
+        ipath = a0.file_in_archive.intra_path
+        if ipath not in self.final and ipath not in self.nested:
+            self.tmp_bytes += a0.file_size
+        if len(retr.single_archive_retrievers) == 1:
+            if ipath not in self.final:
+                self.final[ipath] = []
+                self.final_hashes[ipath] = retr.file_hash
+            self.final[ipath].append(target)
+        else:
+            if ipath not in self.nested:
+                self.nested[ipath] = []
+            self.nested[ipath].append(
+                (ArchiveFileRetriever((retr.file_hash, retr.file_size), retr.constructor_parameter_removing_parent()),
+                 target))
+
+
+def _extraction_task_func(
+        param: tuple[_ExtractionJob, str, str, bool, str | None, ExtractedBlobCache | None]) -> tuple[
+    dict[str, str], list[str]]:
+    # returns nested intra_path -> path of extracted nested archive, and list of targets which were not produced
+    (job, tmpdir, nesteddir, allowhardlinks, listingcachedir, blobcache) = param
+    os.makedirs(tmpdir, exist_ok=True)
+    plugin = archive_plugin_for(job.archive_path)
+    assert plugin is not None
+    ipaths = sorted(set(job.final.keys()) | set(job.nested.keys()))
+    extracted = extract_with_listing(plugin, job.archive_path, job.archive_hash, ipaths, tmpdir, listingcachedir)
+    assert len(extracted) == len(ipaths)
+
+    nestedout: dict[str, str] = {}
+    missing: list[str] = []
+    for i in range(len(ipaths)):
+        ipath = ipaths[i]
+        src = extracted[i]
+        if src is not None and blobcache is not None and ipath in job.final:
+            blobcache.put(job.final_hashes[ipath], src)
+        for target in job.final.get(ipath, []):
+            if src is None:
+                missing.append(target)
+            else:
+                # src is in tmpdir which is removed below, so linking to it is safe; several targets of the same
+                #   file may end up sharing bytes though, hence allowhardlinks
+                materialize_file(src, target, allowhardlinks)
+        if ipath in job.nested:
+            if src is None:
+                missing += [t for _, t in job.nested[ipath]]
+            else:
+                # moving out of tmpdir, so the rest of tmpdir can be removed right away
+                nestedpath = (nesteddir + os.path.split(tmpdir[:-1])[1] + '.' + str(len(nestedout)) + '.'
+                              + os.path.split(src)[1])  # tmpdir name is unique per job
+                os.replace(src, nestedpath)
+                nestedout[ipath] = nestedpath
+
+    shutil.rmtree(tmpdir)
+    if job.delete_archive:
+        os.remove(job.archive_path)
+    return nestedout, missing
+
+
+class ArchiveExtractionScheduler:
+    """
+    Extracts a whole set of ArchiveFileRetrievers into their target paths:
+      - top-level archives are extracted in the order of their paths, for mostly-sequential disk reads
+      - independent archives are extracted concurrently by Parallel workers, while estimated tmp space
+        in use stays within max_tmp_bytes (at least one job is always allowed, to avoid getting stuck)
+      - nested archives are scheduled (ahead of not-yet-started top-level ones) as soon as their outer
+        archive is extracted
+    """
+    _tmpdir: str
+    _max_tmp_bytes: int
+    _materializer: Materializer | None
+    _listing_cache_dir: str | None
+    _blob_cache: ExtractedBlobCache | None
+    _by_archive: dict[bytes, list[tuple[ArchiveFileRetriever, str]]]
+    _parallel: tasks.Parallel | None
+    _pending: list[_ExtractionJob]
+    _tmp_bytes_in_flight: int
+    _njobs: int
+    missing: list[str]
+
+    def __init__(self, tmpdir: str, maxtmpbytes: int = 4 * 1024 * 1024 * 1024,
+                 materializer: Materializer | None = None, listingcachedir: str | None = None,
+                 blobcache: ExtractedBlobCache | None = None) -> None:
+        assert is_normalized_dir_path(tmpdir)
+        self._tmpdir = tmpdir
+        self._max_tmp_bytes = maxtmpbytes
+        self._materializer = materializer
+        self._listing_cache_dir = listingcachedir
+        self._blob_cache = blobcache
+        self._by_archive = {}
+        self._parallel = None
+        self._pending = []
+        self._tmp_bytes_in_flight = 0
+        self._njobs = 0
+        self.missing = []
+
+    def add_retriever(self, fr: ArchiveFileRetriever, target: str) -> None:
+        assert ArchiveRetrieverAggregator.is_my_retriever(fr)
+        if self._materializer is not None and self._materializer.from_known(fr.file_hash, target):
+            return  # same bytes already exist on disk, no need to extract
+        if self._blob_cache is not None and self._blob_cache.fetch(fr.file_hash, fr.file_size, target):
+            if self._materializer is not None:
+                self._materializer.add_produced(fr.file_hash, target)
+            return  # extracted before, by this or earlier run
+        arh = fr.archive_hash()
+        if arh not in self._by_archive:
+            self._by_archive[arh] = []
+        self._by_archive[arh].append((fr, target))
+
+    def all_archives_needed(self) -> list[bytes]:
+        return list(self._by_archive.keys())
+
+    def extract_all(self, arpaths: dict[bytes, str], inprocess: bool = False) -> list[str]:
+        # arpaths: archive_hash -> path, for all of all_archives_needed(); returns targets which were not produced
+        # inprocess: jobs are run one by one in the current process, for callers which are already running
+        #            within a Parallel worker (or which need just one archive anyway)
+        assert self._parallel is None
+        jobs: list[_ExtractionJob] = []
+        for arh, retrs in self._by_archive.items():
+            arpath = arpaths[arh]
+            assert is_normalized_file_path(arpath)
+            job = _ExtractionJob(arpath, arh, False)
+            for fr, target in retrs:
+                job.add(fr, target)
+            jobs.append(job)
+        if len(jobs) == 0:
+            return []
+        self._pending = sorted(jobs, key=lambda j: j.archive_path)
+        os.makedirs(self._nested_dir(), exist_ok=True)
+
+        if inprocess:
+            while len(self._pending) > 0:
+                job = self._pending[0]
+                self._pending = self._pending[1:]
+                self._tmp_bytes_in_flight += job.tmp_bytes
+                self._job_done(job, _extraction_task_func(self._new_job_param(job)))
+        else:
+            with tasks.Parallel(None, taskstatsofinterest=['sanguine.extract.']) as parallel:
+                self._parallel = parallel
+                self._schedule()
+                parallel.run([])
+            self._parallel = None
+            if self._blob_cache is not None:
+                self._blob_cache.trim()  # no workers anymore
+        assert len(self._pending) == 0
+        assert self._tmp_bytes_in_flight == 0
+        return self.missing
+
+    ### private functions
+
+    def _nested_dir(self) -> str:
+        return self._tmpdir + 'nested\\'
+
+    def _schedule(self) -> None:
+        while len(self._pending) > 0:
+            job = self._pending[0]
+            if self._tmp_bytes_in_flight > 0 and self._tmp_bytes_in_flight + job.tmp_bytes > self._max_tmp_bytes:
+                return  # will be called again when some of the in-flight jobs is done
+            self._pending = self._pending[1:]
+            self._start_job(job)
+
+    def _new_job_param(self, job: _ExtractionJob) -> tuple[
+        _ExtractionJob, str, str, bool, str | None, ExtractedBlobCache | None]:
+        jobtmpdir = self._tmpdir + str(self._njobs) + '\\'
+        self._njobs += 1
+        allowhardlinks = self._materializer.allow_hardlinks if self._materializer is not None else True
+        return job, jobtmpdir, self._nested_dir(), allowhardlinks, self._listing_cache_dir, self._blob_cache
+
+    def _start_job(self, job: _ExtractionJob) -> None:
+        self._tmp_bytes_in_flight += job.tmp_bytes
+        taskname = 'sanguine.extract.{}'.format(self._njobs)
+        task = tasks.Task(taskname, _extraction_task_func, self._new_job_param(job), [])
+        self._parallel.add_task(task)
+        owntask = tasks.OwnTask(taskname + '.own', lambda _, out: self._job_done_own_task_func(job, out), None,
+                                [taskname])
+        self._parallel.add_task(owntask)
+
+    def _job_done_own_task_func(self, job: _ExtractionJob, out: tuple[dict[str, str], list[str]]) -> None:
+        self._job_done(job, out)
+        self._schedule()
+
+    def _job_done(self, job: _ExtractionJob, out: tuple[dict[str, str], list[str]]) -> None:
+        (nestedout, missing) = out
+        self.missing += missing
+        if self._materializer is not None:  # so that further targets with the same bytes can be linked to these
+            missingset = set(missing)
+            for ipath, targets in job.final.items():
+                for target in targets:
+                    if target not in missingset:
+                        self._materializer.add_produced(job.final_hashes[ipath], target)
+        self._tmp_bytes_in_flight -= job.tmp_bytes
+        nestedjobs: list[_ExtractionJob] = []
+        for ipath, nestedpath in nestedout.items():
+            nestedretrs = job.nested[ipath]
+            nestedjob = _ExtractionJob(nestedpath, nestedretrs[0][0].archive_hash(), True)
+            for fr, target in nestedretrs:
+                nestedjob.add(fr, target)
+            nestedjob.tmp_bytes += os.path.getsize(nestedpath)  # nested archive itself is in tmp until it is done
+            nestedjobs.append(nestedjob)
+        self._pending = nestedjobs + self._pending  # pipelining: nested ones go first, they also free tmp space
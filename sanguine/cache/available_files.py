@@ -1,6 +1,9 @@
 import os.path
+import time
 
 import sanguine.tasks as tasks
+from sanguine.cache.archive_retriever_aggregator import ArchiveRetrieverAggregator
+from sanguine.cache.extracted_blob_cache import ExtractedBlobCache
 from sanguine.cache.folder_cache import FolderCache
 from sanguine.cache.root_git_data import RootGitData
 from sanguine.common import *
@@ -8,25 +11,42 @@ from sanguine.gitdata.file_origin import file_origins_for_file, FileOrigin, file
 from sanguine.helpers.archives import all_archive_plugins_extensions, Archive
 from sanguine.helpers.file_retriever import (FileRetriever, ZeroFileRetriever, GithubFileRetriever,
                                              ArchiveFileRetriever, ArchiveFileRetrieverHelper)
+from sanguine.helpers.materialize import Materializer
 from sanguine.helpers.tmp_path import TmpPath
 from sanguine.install.install_github import GithubFolder
 from sanguine.install.install_ui import InstallUI
 
 
-def _file_origins_task_func(param: tuple[list[bytes, str]]) -> tuple[
-    list[tuple[bytes, list[FileOrigin]]], list[tuple[bytes, str]]]:
-    (filtered_downloads,) = param
-    allorigins: list[tuple[bytes, list[FileOrigin]]] = []
-    alltentativefiles: list[tuple[bytes, str]] = []
-    for fhash, fpath in filtered_downloads:
-        # TODO/PERFORMANCE: multi-picklecache for file origins
-        origins = file_origins_for_file(fpath)
-        if origins is None:
-            warn('Available: file without known origin {}'.format(fpath))
-        else:
-            allorigins.append((fhash, origins))
-            alltentativefiles.append((fhash, os.path.split(fpath)[1]))
-    return allorigins, alltentativefiles
+### file origins memo: .meta path -> (size, mtime, origins), only new or modified .meta files are re-parsed
+
+_FILE_ORIGINS_MEMO_FNAME = 'available.fileorigins.pickle'
+_FILE_ORIGINS_PER_TASK = 200  # .meta files per parsing task
+
+type _FileOriginsMemo = dict[str, tuple[int, float, list[FileOrigin] | None]]
+
+
+def _file_origins_memo_plugins() -> list[str]:  # memo is invalidated if the set of file origin plugins changes
+    return sorted(plugin.name() for plugin in file_origin_plugins())
+
+
+def _load_file_origins_memo_task_func(param: tuple[str]) -> _FileOriginsMemo:
+    (cachedir,) = param
+    memo = read_dict_from_pickled_file(cachedir + _FILE_ORIGINS_MEMO_FNAME)
+    if memo.get('plugins') != _file_origins_memo_plugins():
+        return {}
+    return memo.get('metas', {})
+
+
+def _save_file_origins_memo_task_func(param: tuple[str, _FileOriginsMemo]) -> None:
+    (cachedir, metas) = param
+    with open(cachedir + _FILE_ORIGINS_MEMO_FNAME, 'wb') as wf:
+        # noinspection PyTypeChecker
+        pickle.dump({'plugins': _file_origins_memo_plugins(), 'metas': metas}, wf)
+
+
+def _file_origins_task_func(param: tuple[list[str]]) -> list[tuple[str, list[FileOrigin] | None]]:
+    (fpaths,) = param
+    return [(fpath, file_origins_for_file(fpath)) for fpath in fpaths]
 
 
 class AvailableFiles:
@@ -40,10 +60,33 @@ class AvailableFiles:
     _READYOWNTASKNAME = 'sanguine.available.ownready'
     _is_ready: bool
     _hash_remapping_plugins: list[FileOriginPluginBase]
+    _cache_dir: str
+    _new_file_origins_memo: _FileOriginsMemo | None  # only .meta files which are still there
+    _file_origins_memo_dirty: bool
+    _filtered_downloads: list[tuple[bytes, str]] | None
+    _archived_retrievers_cache: dict[bytes, list[ArchiveFileRetriever]]  # file_hash -> retrievers, populated lazily
+    _precompute_archived_retrievers: bool  # on ready()
+    _archived_retrievers_precomputed: bool
+    _tmp_dir: str
+    _blob_cache: ExtractedBlobCache | None
+    _materializer: Materializer | None
+    _nfetches: int
 
     def __init__(self, by: str, cachedir: str, tmpdir: str, rootgitdir: str, rootmodpackdir: str, downloads: list[str],
-                 github_folders: list[GithubFolder], cache_data: ConfigData) -> None:
+                 github_folders: list[GithubFolder], cache_data: ConfigData,
+                 precomputeretrievers: bool = False, blobcache: ExtractedBlobCache | None = None) -> None:
         self._root_git_dir = rootgitdir
+        self._cache_dir = cachedir
+        self._tmp_dir = tmpdir
+        self._blob_cache = blobcache
+        self._materializer = None
+        self._nfetches = 0
+        self._new_file_origins_memo = None
+        self._file_origins_memo_dirty = False
+        self._filtered_downloads = None
+        self._archived_retrievers_cache = {}
+        self._precompute_archived_retrievers = precomputeretrievers
+        self._archived_retrievers_precomputed = False
         self._hash_remapping_plugins = []
         extrahashfactories = []
         for plugin in file_origin_plugins():
@@ -80,10 +123,16 @@ class AvailableFiles:
                                             datadeps=self._starthashing_owntask_datadeps())
         parallel.add_task(starthashingowntask)
 
+        loadoriginstaskname = 'sanguine.available.loadfileorigins'
+        loadoriginstask = tasks.Task(loadoriginstaskname, _load_file_origins_memo_task_func,
+                                     (self._cache_dir,), [])
+        parallel.add_task(loadoriginstask)
+
         startoriginsowntaskname = 'sanguine.available.ownstartfileorigins'
         startoriginsowntask = tasks.OwnTask(startoriginsowntaskname,
-                                            lambda _, _1: self._start_origins_own_task_func(parallel), None,
-                                            [self._downloads_cache.ready_task_name()],
+                                            lambda _, _1, memo: self._start_origins_own_task_func(parallel, memo),
+                                            None,
+                                            [self._downloads_cache.ready_task_name(), loadoriginstaskname],
                                             datadeps=self._startorigins_owntask_datadeps())
         parallel.add_task(startoriginsowntask)
 
@@ -103,6 +152,8 @@ class AvailableFiles:
         return AvailableFiles._READYOWNTASKNAME
 
     def file_retrievers_by_hash(self, h: bytes) -> list[FileRetriever]:
+        # returned list may be shared memo state (same list for all callers asking for the same hash),
+        #   so it MUST NOT be modified; copy it if you need to
         zero = ZeroFileRetriever.make_retriever_if(h)
         if zero is not None:
             return [zero]  # if it is zero file, we won't even try looking elsewhere
@@ -111,6 +162,44 @@ class AvailableFiles:
             return github
         return self._archived_file_retrievers_by_hash(h)
 
+    def precompute_retrievers(self) -> None:
+        # for callers which are going to look up retrievers for most of the files (such as togithub);
+        #   otherwise, retrievers are memoized lazily, on first lookup
+        assert self._is_ready
+        if not self._archived_retrievers_precomputed:
+            self._precompute_nested_archive_retrievers()
+
+    def materializer(self) -> Materializer:
+        # shared by all fetches from this AvailableFiles, so that duplicate targets can share bytes
+        assert self._is_ready
+        if self._materializer is None:
+            self._materializer = Materializer(self._known_files_by_hash)
+        return self._materializer
+
+    def fetch_archived_file(self, retr: ArchiveFileRetriever, targetfpath: str) -> None:
+        # one file at a time; for many files, ArchiveRetrieverAggregator.extract_all_archives() is much faster
+        materializer = self.materializer()
+        if materializer.from_known(retr.file_hash, targetfpath):
+            return
+        arh = retr.archive_hash()
+        arfiles = self.downloaded_file_by_hash(arh)
+        raise_if_not(arfiles is not None, lambda: 'Available: archive {} is not available'.format(to_json_hash(arh)))
+        tmpdir = TmpPath.tmp_in_tmp(self._tmp_dir, 'fetch.', self._nfetches)
+        self._nfetches += 1
+        agg = ArchiveRetrieverAggregator(self._blob_cache)
+        agg.add_retriever(retr)
+        extracted = agg.extract_all_from_one_archive(tmpdir, arh, arfiles[0].file_path)
+        # extracted file is in tmpdir, which is removed right away, so linking to it is safe
+        materializer.from_file(extracted[retr.file_hash], targetfpath, retr.file_size, allowhardlinks=True)
+        materializer.add_produced(retr.file_hash, targetfpath)
+        TmpPath.rm_tmp_tree(tmpdir)
+
+    def done(self) -> None:
+        if self._materializer is not None:
+            self._materializer.log_stats()
+        if self._blob_cache is not None:
+            self._blob_cache.trim()
+
     def archive_stats(self) -> dict[bytes, tuple[int, int]]:  # hash -> (n,total_size)
         return self._root_data.archive_stats()
 
@@ -126,7 +215,8 @@ class AvailableFiles:
     def stats_of_interest(self) -> list[str]:
         return (self._downloads_cache.stats_of_interest() + self._github_cache.stats_of_interest()
                 + self._root_data.stats_of_interest()
-                + ['sanguine.available.own', 'sanguine.available.fileorigins', 'sanguine.available.'])
+                + ['sanguine.available.own', 'sanguine.available.loadfileorigins', 'sanguine.available.fileorigins.',
+                   'sanguine.available.savefileorigins', 'sanguine.available.'])
 
     ### private functions
     # lists of file retrievers
@@ -146,19 +236,39 @@ class AvailableFiles:
             found2 = self._archived_file_retrievers_by_hash(r.archive_hash)
             for r2 in found2:
                 out.append(
-                    ArchiveFileRetriever((r2.file_hash, r2.file_size), r2.constructor_parameter_appending_child(r)))
+                    ArchiveFileRetriever((r.file_hash, r.file_size), r2.constructor_parameter_appending_child(r)))
 
-    def _archived_file_retrievers_by_hash(self, h: bytes) -> list[ArchiveFileRetriever]:  # recursive
+    def _archived_file_retrievers_by_hash(self, h: bytes) -> list[ArchiveFileRetriever]:  # recursive, memoized
+        # returned list is shared between callers, and MUST NOT be modified
+        cached = self._archived_retrievers_cache.get(h)
+        if cached is not None:
+            return cached
         singles = self._single_archive_retrievers(h)
         if len(singles) == 0:
+            self._archived_retrievers_cache[h] = []
             return []
         assert len(singles) > 0
 
         out = []
         self._add_nested_archives(out, singles)
         assert len(out) > 0
+        self._archived_retrievers_cache[h] = out
         return out
 
+    def _precompute_nested_archive_retrievers(self) -> None:
+        # chains for archives are exactly those needed by nested lookups, so after this
+        #   each file lookup is at most one level deep
+        t0 = time.perf_counter()
+        for arh in self._root_data.all_archive_hashes():
+            self._archived_file_retrievers_by_hash(arh)
+        self._archived_retrievers_precomputed = True
+        info('Available: precomputed retrievers for {} archive(s) in {:.2f}s'.format(
+            len(self._archived_retrievers_cache), time.perf_counter() - t0))
+
+    def _known_files_by_hash(self, h: bytes) -> list[FileOnDisk] | None:  # for Materializer
+        known = self._github_cache_by_hash.get(h, []) + (self._downloads_cache.file_by_hash(h) or [])
+        return known if len(known) > 0 else None
+
     def _github_file_retrievers_by_hash(self, h: bytes) -> list[GithubFileRetriever]:
         ghlist = self._github_cache_by_hash.get(h)
         if ghlist is None:
@@ -217,28 +327,57 @@ class AvailableFiles:
             [],
             ['sanguine.available.start_origins()'])
 
-    def _start_origins_own_task_func(self, parallel: tasks.Parallel) -> None:
-        filtered_downloads: list[tuple[bytes, str]] = []
+    def _start_origins_own_task_func(self, parallel: tasks.Parallel, memo: _FileOriginsMemo) -> None:
+        assert self._new_file_origins_memo is None
+        self._new_file_origins_memo = {}
+        self._filtered_downloads = []
+        toparse: list[str] = []
         for ar in self._downloads_cache.all_files():
             ext = os.path.splitext(ar.file_path)[1]
             if ext == '.meta':
                 continue
 
-            filtered_downloads.append((ar.file_hash, ar.file_path))
+            self._filtered_downloads.append((ar.file_hash, ar.file_path))
+            meta = self._downloads_cache.file_by_path(ar.file_path + '.meta')
+            if meta is None:
+                continue
+            memoized = memo.get(meta.file_path)
+            if memoized is not None and memoized[0] == meta.file_size and memoized[1] == meta.file_modified:
+                self._new_file_origins_memo[meta.file_path] = memoized
+            else:
+                toparse.append(ar.file_path)
+
+        info('Available: {} .meta files memoized, {} to be parsed'.format(len(self._new_file_origins_memo),
+                                                                           len(toparse)))
+        if len(toparse) > 0 or len(self._new_file_origins_memo) != len(memo):
+            self._file_origins_memo_dirty = True
+
+        for i in range(0, len(toparse), _FILE_ORIGINS_PER_TASK):
+            chunk = toparse[i:i + _FILE_ORIGINS_PER_TASK]
+            originstaskname = 'sanguine.available.fileorigins.{}'.format(i)
+            originstask = tasks.Task(originstaskname, _file_origins_task_func, (chunk,), [])
+            parallel.add_task(originstask)
+            ownoriginstaskname = 'sanguine.available.ownparsedorigins.{}'.format(i)
+            ownoriginstask = tasks.OwnTask(ownoriginstaskname,
+                                           lambda _, out: self._parsed_origins_own_task_func(out), None,
+                                           [originstaskname])
+            parallel.add_task(ownoriginstask)
 
-        originstaskname = 'sanguine.available.fileorigins'
-        originstask = tasks.Task(originstaskname, _file_origins_task_func,
-                                 (filtered_downloads,), [])
-        parallel.add_task(originstask)
         startoriginsowntaskname = 'sanguine.available.ownfileorigins'
         originsowntask = tasks.OwnTask(startoriginsowntaskname,
-                                       lambda _, out, _1, _2: self._file_origins_own_task_func(parallel, out), None,
-                                       [originstaskname,
+                                       lambda _, _1, _2: self._file_origins_own_task_func(parallel), None,
+                                       ['sanguine.available.ownparsedorigins.*',
                                         RootGitData.ready_to_start_adding_file_origins_task_name(),
                                         RootGitData.archives_ready_task_name()],
                                        datadeps=self._fileorigins_owntask_datadeps())
         parallel.add_task(originsowntask)
 
+    def _parsed_origins_own_task_func(self, out: list[tuple[str, list[FileOrigin] | None]]) -> None:
+        for fpath, origins in out:
+            meta = self._downloads_cache.file_by_path(fpath + '.meta')
+            assert meta is not None
+            self._new_file_origins_memo[meta.file_path] = (meta.file_size, meta.file_modified, origins)
+
     def _fileorigins_owntask_datadeps(self) -> tasks.TaskDataDependencies:
         return tasks.TaskDataDependencies(
             ['sanguine.rootgit._tentative_archive_names',
@@ -247,14 +386,21 @@ class AvailableFiles:
             [],
             ['sanguine.available.file_origins()'])
 
-    def _file_origins_own_task_func(self, parallel: tasks.Parallel,
-                                    out: tuple[list[tuple[bytes, list[FileOrigin]]], list[tuple[bytes, str]]]) -> None:
-        (origins, tentativefiles) = out
-        for fox in origins:
-            for fo in fox[1]:
-                self._root_data.add_file_origin(fox[0], fo)
-        for tf in tentativefiles:
-            self._root_data.add_tentative_name(tf[0], tf[1])
+    def _file_origins_own_task_func(self, parallel: tasks.Parallel) -> None:
+        for fhash, fpath in self._filtered_downloads:
+            memoized = self._new_file_origins_memo.get(fpath + '.meta')
+            origins = memoized[2] if memoized is not None else None
+            if origins is None:
+                warn('Available: file without known origin {}'.format(fpath))
+                continue
+            for fo in origins:
+                self._root_data.add_file_origin(fhash, fo)
+            self._root_data.add_tentative_name(fhash, os.path.split(fpath)[1])
+        if self._file_origins_memo_dirty:
+            savetaskname = 'sanguine.available.savefileorigins'
+            savetask = tasks.Task(savetaskname, _save_file_origins_memo_task_func,
+                                  (self._cache_dir, self._new_file_origins_memo), [])
+            parallel.add_task(savetask)
         self._root_data.start_done_adding_file_origins_task(parallel)  # no need to wait for it
 
         gitarchivesdonehashingtaskname: str = self._root_data.start_done_hashing_task(parallel)
@@ -282,6 +428,9 @@ class AvailableFiles:
         self._github_cache_by_hash = {}
         for f in self._github_cache.all_files():
             add_to_dict_of_lists(self._github_cache_by_hash, f.file_hash, f)
+        assert len(self._archived_retrievers_cache) == 0
+        if self._precompute_archived_retrievers:
+            self._precompute_nested_archive_retrievers()
         self._is_ready = True
 
 
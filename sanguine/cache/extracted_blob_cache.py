@@ -0,0 +1,104 @@
+"""
+Content-addressed cache of files extracted from archives, keyed by (truncated) file hash, same as
+FileInArchive.file_hash. Lets install, patch detection etc. get archive members without decompressing archive again.
+
+Safe to use from several processes at once: blobs are written via tmp file + os.replace(), and are never
+modified in place. LRU is by mtime (which we touch on every hit, as atime is often disabled);
+trim() is to be called by master process when nobody else is using the cache.
+"""
+from sanguine.common import *
+from sanguine.helpers.materialize import materialize_file
+from sanguine.helpers.project_config import LocalProjectConfig
+
+
+class ExtractedBlobCache:
+    blob_dir: str
+    max_bytes: int
+
+    def __init__(self, cachedir: str, maxbytes: int) -> None:
+        assert is_normalized_dir_path(cachedir)
+        self.blob_dir = cachedir + 'blobs\\'
+        self.max_bytes = maxbytes
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def get(self, filehash: bytes, filesize: int) -> str | None:  # returns path of cached blob
+        fpath = self._blob_path(filehash)
+        try:
+            st = os.lstat(fpath)
+        except OSError:
+            return None
+        if st.st_size != filesize:
+            return None
+        try:
+            os.utime(fpath)
+        except OSError:
+            pass  # e.g. being removed by trim(); still fine for LRU purposes
+        return fpath
+
+    def fetch(self, filehash: bytes, filesize: int, target: str) -> bool:
+        # returns False if not cached, it is up to caller to extract target then
+        fpath = self.get(filehash, filesize)
+        if fpath is None:
+            return False
+        try:
+            # no hardlinks, as target may be modified later, and blob must stay intact
+            materialize_file(fpath, target, allowhardlinks=False)
+        except OSError as e:
+            warn('ExtractedBlobCache: cannot fetch {}: {}'.format(fpath, e))
+            return False
+        return True
+
+    def put(self, filehash: bytes, src: str) -> None:
+        fpath = self._blob_path(filehash)
+        if os.path.isfile(fpath):
+            return
+        tmppath = fpath + '.tmp.' + str(os.getpid())
+        try:
+            # no hardlinks: caller may have hardlinked src to a target which may be modified later
+            materialize_file(src, tmppath, allowhardlinks=False)
+            os.replace(tmppath, fpath)
+        except OSError as e:
+            warn('ExtractedBlobCache: cannot cache {}: {}'.format(src, e))
+            if os.path.isfile(tmppath):
+                os.remove(tmppath)
+
+    def trim(self) -> None:
+        blobs: list[tuple[float, int, str]] = []
+        total = 0
+        for root, dirs, files in os.walk(self.blob_dir):
+            for f in files:
+                fpath = os.path.join(root, f)
+                try:
+                    st = os.lstat(fpath)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, fpath))
+                total += st.st_size
+        if total <= self.max_bytes:
+            debug('ExtractedBlobCache: {:.1f}M in {} blob(s), within {:.1f}M', total / 1048576, len(blobs),
+                  self.max_bytes / 1048576)
+            return
+        nremoved = 0
+        removedbytes = 0
+        for mtime, size, fpath in sorted(blobs):  # least recently used first
+            if total - removedbytes <= self.max_bytes:
+                break
+            try:
+                os.remove(fpath)
+            except OSError:
+                continue
+            nremoved += 1
+            removedbytes += size
+        info('ExtractedBlobCache: evicted {} blob(s), {:.1f}M'.format(nremoved, removedbytes / 1048576))
+
+    def _blob_path(self, filehash: bytes) -> str:
+        # first byte as subdir, to avoid too many files in one dir
+        hx = (truncate_file_hash(filehash) if len(filehash) == 32 else filehash).hex()
+        return self.blob_dir + hx[:2] + '\\' + hx
+
+
+def extracted_blob_cache_for(cfg: LocalProjectConfig) -> ExtractedBlobCache | None:
+    # None if disabled ('extractedcachemb' is 0 or missing in project config)
+    if cfg.extracted_cache_max_bytes <= 0:
+        return None
+    return ExtractedBlobCache(cfg.cache_dir + 'extracted\\', cfg.extracted_cache_max_bytes)
@@ -531,7 +531,7 @@ class FolderCache:  # folder cache; can handle multiple folders, each folder wit
                                         fpath))
                                 matched = False
                 else:
-                    debug('FolderCache: not found {}'.format(fpath))
+                    debug('FolderCache: not found {}', fpath)
                 if not matched:
                     sdout.requested_files.append((fpath, tstamp, st.st_size))
             elif stat.S_ISDIR(fmode):
@@ -635,8 +635,7 @@ class FolderCache:  # folder cache; can handle multiple folders, each folder wit
         (f, xtra) = out
         scannedfiles[f.file_path] = f
         self._files_by_path[f.file_path] = f
-        debug(
-            'FolderCache.{}: _own_calc_hash_task_func(): {} _files_by_path'.format(self.name, len(self._files_by_path)))
+        debug('FolderCache.{}: _own_calc_hash_task_func(): {} _files_by_path', self.name, len(self._files_by_path))
         assert len(xtra) == len(self._extra_hash_factories)
         if __debug__:
             if f.file_hash in self.extra_hashes:
@@ -712,8 +711,7 @@ class FolderCache:  # folder cache; can handle multiple folders, each folder wit
         else:
             self._new_all_scan_stats[sdout.root] = sdout.scan_stats
 
-        debug('FolderCache.{}: _scan_folder_own_task_func(): {} _files_by_path'.format(self.name,
-                                                                                       len(self._files_by_path)))
+        debug('FolderCache.{}: _scan_folder_own_task_func(): {} _files_by_path', self.name, len(self._files_by_path))
 
         # new hashing tasks
         for f in sdout.requested_files:
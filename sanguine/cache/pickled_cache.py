@@ -1,62 +1,178 @@
+import hashlib
+import time
+
 from sanguine.common import *
 
 
+### helpers
+
+def _file_entry(fpath: str) -> list:  # [fpath, size, mtime, content_hash], JSON-friendly as it goes to cachedata
+    st = os.lstat(fpath)
+    s, h = calculate_file_hash(fpath)
+    return [fpath, st.st_size, st.st_mtime, to_json_hash(h)]
+
+
+def _is_file_entry_valid(rd: list, fpath: str) -> bool:
+    # rd comes from cachedata, i.e. after a round trip via JSON; floats survive such a round trip exactly
+    assert isinstance(rd, list)
+    assert is_normalized_file_path(rd[0])
+    assert is_normalized_file_path(fpath)
+    if len(rd) != 4 or rd[0] != fpath:
+        return False
+    st = os.lstat(fpath)
+    if rd[1] != st.st_size:
+        return False
+    if rd[2] == st.st_mtime:
+        return True
+    # same size, different mtime (git checkout, copying etc.) - the content may still be the same
+    s, h = calculate_file_hash(fpath)
+    if to_json_hash(h) != rd[3]:
+        return False
+    rd[2] = st.st_mtime  # mtime is updated in-place, caller has to return rd as a part of cachedata overrides
+    return True
+
+
+def _cache_key_hash(x: Any) -> str:
+    # for both keys and params; hashing JSON (and not comparing objects) is important, as whatever we compare with,
+    #   has been through a JSON round trip in cachedata
+    return hashlib.sha256(as_json(x).encode('utf-8')).hexdigest()[:32]
+
+
+def _same_params(cachedata: ConfigData, key: str, params: Any) -> bool:
+    if params is None:
+        return True
+    return cachedata.get(key) == _cache_key_hash(params)
+
+
+def _load_pickle(fpath: str) -> tuple[bool, Any]:
+    try:
+        with open(fpath, 'rb') as rf:
+            return True, pickle.load(rf)
+    except Exception as e:
+        warn('pickledCache(): error loading {}: {}, will recalculate'.format(fpath, e))
+        return False, None
+
+
+def _atomic_pickle_dump(fpath: str, data: Any) -> None:
+    # so that an interrupted write never leaves a truncated pickle which looks valid as far as cachedata is concerned
+    tmpfpath = fpath + '.tmp'
+    with open(tmpfpath, 'wb') as wf:
+        # noinspection PyTypeChecker
+        pickle.dump(data, wf)
+    os.replace(tmpfpath, fpath)
+
+
+def _check_unchanged(files: list[list]) -> None:
+    for f in files:
+        st = os.lstat(f[0])
+        raise_if_not(f[1] == st.st_size and f[
+            2] == st.st_mtime)  # if any of the files we depend on, has changed while calc() was calculated - something is really weird is going on here
+
+
+### pickled_cache(): single pickled blob, recalculated if any of origfiles changes
+
 def pickled_cache(cachedir: str, cachedata: ConfigData, prefix: str, origfiles: list[str],
                   calc: Callable[[Any], Any], params: Any = None) -> tuple[Any, dict[str:str]]:
     assert isinstance(origfiles, list)
     readpaths = cachedata.get(prefix + '.files')
-
-    if params is not None:
-        # comparing as JSONs is important
-        readparams = as_json(cachedata.get(prefix + '.params'))
-        jparams = as_json(params)
-        sameparams = (readparams == jparams)
-    else:
-        sameparams = True
+    sameparams = _same_params(cachedata, prefix + '.paramshash', params)
 
     samefiles = readpaths is not None and len(readpaths) == len(origfiles)
+    mtimeupdated = False
     if sameparams and samefiles:
         readpaths = sorted(readpaths)
         origfiles = sorted(origfiles)
         for i in range(len(readpaths)):
-            rd = readpaths[i]
-            st = os.lstat(origfiles[i])
-            of = (origfiles[i], st.st_size, st.st_mtime)
-            assert isinstance(rd, list)
-            assert is_normalized_file_path(rd[0])
-            assert is_normalized_file_path(of[0])
-
-            jrd = as_json(rd)
-            jof = as_json(of)
-
-            if jrd != jof:  # lists are sorted, there should be exact match here
+            oldmtime = readpaths[i][2]
+            if not _is_file_entry_valid(readpaths[i], origfiles[i]):  # lists are sorted, there should be exact match
                 samefiles = False
                 break
+            if readpaths[i][2] != oldmtime:
+                mtimeupdated = True
 
     pfname = cachedir + prefix + '.pickle'
     if sameparams and samefiles and os.path.isfile(pfname):
-        info('pickledCache(): Yahoo! Can use cache for ' + prefix)
-        with open(pfname, 'rb') as rf:
-            return pickle.load(rf), {}
+        ok, out = _load_pickle(pfname)
+        if ok:
+            info('pickledCache(): Yahoo! Can use cache for ' + prefix)
+            return out, {prefix + '.files': readpaths} if mtimeupdated else {}
 
     cachedataoverwrites = {}
-    files = []
-    for of in origfiles:
-        st = os.lstat(of)
-        files.append((of, st.st_size, st.st_mtime))
+    files = [_file_entry(of) for of in origfiles]
     assert len(files) == len(origfiles)
 
     out = calc(params)
 
-    for f in files:
-        st = os.lstat(f[0])
-        raise_if_not(f[1] == st.st_size and f[
-            2] == st.st_mtime)  # if any of the files we depend on, has changed while calc() was calculated - something is really weird is going on here
-
-    with open(cachedir + prefix + '.pickle', 'wb') as wf:
-        # noinspection PyTypeChecker
-        pickle.dump(out, wf)
+    _check_unchanged(files)
+    _atomic_pickle_dump(pfname, out)
     cachedataoverwrites[prefix + '.files'] = files
     if params is not None:
-        cachedataoverwrites[prefix + '.params'] = params
+        cachedataoverwrites[prefix + '.paramshash'] = _cache_key_hash(params)
     return out, cachedataoverwrites
+
+
+### pickled_keyed_cache(): several pickled blobs under the same prefix, one per key, each validated against its own
+#                         origfiles and params; least recently used entries above maxentries are evicted.
+#                         All calls for the same prefix MUST come from one place (such as one task), as eviction
+#                         relies on seeing all the entries of the prefix
+
+def _keyed_cache_entry_fname(cachedir: str, prefix: str, keyhash: str) -> str:
+    return cachedir + prefix + '.' + keyhash + '.pickle'
+
+
+def _is_keyed_entry_valid(entry: list, origfiles: list[str], paramshash: str | None) -> bool:
+    # entry is [files, paramshash, lastused]; files may get mtime updated in-place, see _is_file_entry_valid()
+    if entry[1] != paramshash:
+        return False
+    files = entry[0]
+    if len(files) != len(origfiles):
+        return False
+    files.sort()
+    for rd, of in zip(files, sorted(origfiles)):  # lists are sorted, there should be exact match
+        if not _is_file_entry_valid(rd, of):
+            return False
+    return True
+
+
+def pickled_keyed_cache(cachedir: str, cachedata: ConfigData, prefix: str, key: str, origfiles: list[str],
+                        calc: Callable[[Any], Any], params: Any = None,
+                        maxentries: int = 4) -> tuple[Any, dict[str:str]]:
+    assert isinstance(origfiles, list)
+    assert maxentries >= 1
+    keyhash = _cache_key_hash(key)
+    paramshash = _cache_key_hash(params) if params is not None else None
+    # copying, as cachedata may be shared with other users, and we're modifying entries in-place
+    entries: dict[str, list] = {kh: [[list(rd) for rd in e[0]], e[1], e[2]]
+                                for kh, e in cachedata.get(prefix + '.entries', {}).items() if len(e) == 3}
+
+    pfname = _keyed_cache_entry_fname(cachedir, prefix, keyhash)
+    entry = entries.get(keyhash)
+    out = None
+    found = False
+    if entry is not None and _is_keyed_entry_valid(entry, origfiles, paramshash) and os.path.isfile(pfname):
+        found, out = _load_pickle(pfname)
+        if found:
+            info('pickledKeyedCache(): Yahoo! Can use cache for {} ({})', prefix, key)
+
+    if not found:
+        files = [_file_entry(of) for of in origfiles]
+        assert len(files) == len(origfiles)
+        out = calc(params)
+        _check_unchanged(files)
+        _atomic_pickle_dump(pfname, out)
+        entry = [files, paramshash, 0.]
+        entries[keyhash] = entry
+    entry[2] = time.time()
+
+    nevicted = 0
+    while len(entries) > maxentries:
+        lru = min(entries.keys(), key=lambda kh: entries[kh][2])
+        assert lru != keyhash
+        del entries[lru]
+        evictedfname = _keyed_cache_entry_fname(cachedir, prefix, lru)
+        if os.path.isfile(evictedfname):
+            os.remove(evictedfname)
+        nevicted += 1
+    if nevicted > 0:
+        info('pickledKeyedCache(): {}: evicted {} entries'.format(prefix, nevicted))
+    return out, {prefix + '.entries': entries}
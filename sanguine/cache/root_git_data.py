@@ -1,6 +1,9 @@
+import sys
+import time
+
 import sanguine.gitdata.git_data_file as gitdatafile
 import sanguine.tasks as tasks
-from sanguine.cache.pickled_cache import pickled_cache
+from sanguine.cache.pickled_cache import pickled_cache, pickled_keyed_cache
 from sanguine.common import *
 from sanguine.gitdata.file_origin import (FileOrigin, GitTentativeArchiveNames,
                                           file_origin_plugins, file_origin_plugin_by_name, FileOriginPluginBase)
@@ -16,6 +19,8 @@ from sanguine.helpers.tmp_path import TmpPath
 
 _KNOWN_ARCHIVES_FNAME = 'known-archives.json5'
 _KNOWN_TENTATIVE_ARCHIVE_NAMES_FNAME = 'known-tentative-archive-names.json5'
+_KNOWN_ARCHIVES_CACHE_MAX_ENTRIES = 3  # catalog is the largest thing we read, so catalogs of several
+#                                        recently used root modpacks are kept, to avoid re-parsing when switching
 
 
 def _known_fo_plugin_fname(name: str) -> str:
@@ -42,8 +47,8 @@ def _read_cached_git_archives(rootgitdir: str, cachedir: str,
                               cachedata: ConfigData) -> tuple[list[Archive], ConfigData]:
     assert is_normalized_dir_path(rootgitdir)
     rootgitfile = rootgitdir + _KNOWN_ARCHIVES_FNAME
-    return pickled_cache(cachedir, cachedata, 'known-archives', [rootgitfile],
-                         _read_git_archives, (rootgitfile,))
+    return pickled_keyed_cache(cachedir, cachedata, 'known-archives', rootgitfile, [rootgitfile],
+                               _read_git_archives, (rootgitfile,), _KNOWN_ARCHIVES_CACHE_MAX_ENTRIES)
 
 
 def _write_git_archives(rootgitdir: str, archives: list[Archive]) -> None:
@@ -57,16 +62,29 @@ def _hash_archive(archives: list[Archive], extradata: dict[str, dict[bytes, Any]
                   plugin: ArchivePluginBase,
                   archivepath: str, arhash: bytes, arsize: int, extrafactories: list[ExtraArchiveDataFactory]) -> None:
     assert os.path.isdir(tmppath)
-    plugin.extract_all(archivepath, tmppath)
     pluginexts = all_archive_plugins_extensions()  # for nested archives
     ar = Archive(arhash, arsize, by)
     archives.append(ar)
+
+    streamed = plugin.hash_all(archivepath)
+    if streamed is not None and not any(os.path.splitext(intra)[1].lower() in pluginexts for intra, _, _ in streamed):
+        # nothing to extract; extra data factories will see an empty dir, which is ok as long as
+        #   only archive formats without installers (such as .bsa) support hash_all()
+        for intra, s, h in streamed:
+            ar.files.append(FileInArchive(truncate_file_hash(h), s, normalize_archive_intra_path(intra)))
+        hashed = None
+    else:
+        hashed = plugin.extract_all_and_hash(archivepath, tmppath)
+        if hashed is None:
+            plugin.extract_all(archivepath, tmppath)
+
     for root, dirs, files in os.walk(tmppath):
         nf = 0
         for f in files:
             nf += 1
             fpath = os.path.join(root, f)
-            s, h = calculate_file_hash(fpath)
+            known = hashed.get(os.path.normcase(fpath)) if hashed is not None else None
+            s, h = known if known is not None else calculate_file_hash(fpath)
             assert fpath.startswith(tmppath)
             ar.files.append(
                 FileInArchive(truncate_file_hash(h), s, normalize_archive_intra_path(fpath[len(tmppath):])))
@@ -147,7 +165,7 @@ def _write_some_plugin_data(rootgitdir: str, fname: str, wrfunc: Callable[[typin
 
 ### RootGitData Tasks
 
-def _append_archive(archives_by_hash, archived_files_by_hash, archived_files_by_name, ar: Archive) -> None:
+def _append_archive(archives_by_hash, archived_files_by_hash, ar: Archive) -> None:
     # warn(str(len(ar.files)))
     assert ar.archive_hash not in archives_by_hash
     archives_by_hash[ar.archive_hash] = ar
@@ -156,21 +174,23 @@ def _append_archive(archives_by_hash, archived_files_by_hash, archived_files_by_
             archived_files_by_hash[fi.file_hash] = []
         archived_files_by_hash[fi.file_hash].append((ar, fi))
 
+
+def _append_archive_by_name(archived_files_by_name, ar: Archive) -> None:
+    for fi in ar.files:
         fname = os.path.split(fi.intra_path)[1]
         if fname not in archived_files_by_name:
             archived_files_by_name[fname] = []
         archived_files_by_name[fname].append((ar, fi))
 
 
-def _load_archives_task_func(param: tuple[str, str, dict[str, Any]]) -> tuple[dict, dict, dict, dict[str, Any]]:
+def _load_archives_task_func(param: tuple[str, str, dict[str, Any]]) -> tuple[dict, dict, dict[str, Any]]:
     (rootgitdir, cachedir, cachedata) = param
     (archives, cacheoverrides) = _read_cached_git_archives(rootgitdir, cachedir, cachedata)
     archives_by_hash = {}
     archived_files_by_hash = {}
-    archived_files_by_name = {}
     for ar in archives:
-        _append_archive(archives_by_hash, archived_files_by_hash, archived_files_by_name, ar)
-    return archives_by_hash, archived_files_by_hash, archived_files_by_name, cacheoverrides
+        _append_archive(archives_by_hash, archived_files_by_hash, ar)
+    return archives_by_hash, archived_files_by_hash, cacheoverrides
 
 
 def _archive_hashing_task_func(param: tuple[str, str, bytes, int, str, list[ExtraArchiveDataFactory]]) -> tuple[
@@ -263,7 +283,7 @@ class RootGitData:
     _cache_data: ConfigData
     _archives_by_hash: dict[bytes, Archive] | None
     _archived_files_by_hash: dict[bytes, list[tuple[Archive, FileInArchive]]] | None  # all (ar,fi) pairs for given hash
-    _archived_files_by_name: dict[str, list[tuple[Archive, FileInArchive]]] | None
+    _archived_files_by_name: dict[str, list[tuple[Archive, FileInArchive]]] | None  # lazy, see archived_files_by_name()
     _tentative_archive_names: dict[bytes, list[str]] | None
     _nhashes_requested: int  # number of hashes already requested; used to make name of tmp dir
     _new_hashes_by: str
@@ -443,6 +463,16 @@ class RootGitData:
         assert self._ar_is_ready == 2
         return self._archived_files_by_hash.get(truncate_file_hash(h))
 
+    def archived_files_by_name(self, fname: str) -> list[tuple[Archive, FileInArchive]]:
+        assert self._ar_is_ready == 2
+        if self._archived_files_by_name is None:
+            self._build_archived_files_by_name()
+        return self._archived_files_by_name.get(fname, [])
+
+    def all_archive_hashes(self) -> Iterable[bytes]:
+        assert self._ar_is_ready == 2
+        return self._archives_by_hash.keys()
+
     def archive_by_hash(self, arh: bytes, partialok: bool = False) -> Archive | None:
         assert (self._ar_is_ready >= 1) if partialok else (self._ar_is_ready >= 2)
         return self._archives_by_hash.get(arh)
@@ -482,16 +512,14 @@ class RootGitData:
             [],
             ['sanguine.rootgit.done_hashing()'],
             ['sanguine.rootgit._archives_by_hash',
-             'sanguine.rootgit._archived_files_by_hash',
-             'sanguine.rootgit._archived_files_by_name'])
+             'sanguine.rootgit._archived_files_by_hash'])
 
-    def _load_archives_own_task_func(self, out: tuple[dict, dict, dict, dict[str, Any]]) -> None:
-        (archives_by_hash, archived_files_by_hash, archived_files_by_name, cacheoverrides) = out
+    def _load_archives_own_task_func(self, out: tuple[dict, dict, dict[str, Any]]) -> None:
+        (archives_by_hash, archived_files_by_hash, cacheoverrides) = out
         assert self._archives_by_hash is None
         assert self._archived_files_by_hash is None
         self._archives_by_hash = archives_by_hash
         self._archived_files_by_hash = archived_files_by_hash
-        self._archived_files_by_name = archived_files_by_name
         self._cache_data |= cacheoverrides
         assert self._ar_is_ready == 0
         self._ar_is_ready = 1
@@ -499,8 +527,7 @@ class RootGitData:
     def _arhashing_owntask_datadeps(self) -> tasks.TaskDataDependencies:
         return tasks.TaskDataDependencies(
             ['sanguine.rootgit._archives_by_hash',
-             'sanguine.rootgit._archived_files_by_hash',
-             'sanguine.rootgit._archived_files_by_name'],
+             'sanguine.rootgit._archived_files_by_hash'],
             ['sanguine.rootgit.done_hashing()'],
             [])
 
@@ -508,7 +535,7 @@ class RootGitData:
         assert self._ar_is_ready == 1
         (archives, extradata) = out
         for ar in archives:
-            _append_archive(self._archives_by_hash, self._archived_files_by_hash, self._archived_files_by_name, ar)
+            _append_archive(self._archives_by_hash, self._archived_files_by_hash, ar)
         for pluginname, data0 in extradata.items():
             for arh, data in data0.items():
                 arinstaller_plugin_add_extra_data(pluginname, arh, data)
@@ -517,8 +544,7 @@ class RootGitData:
     def _done_hashing_owntask_datadeps(self) -> tasks.TaskDataDependencies:
         return tasks.TaskDataDependencies(
             ['sanguine.rootgit._archives_by_hash',
-             'sanguine.rootgit._archived_files_by_hash',
-             'sanguine.rootgit._archived_files_by_name'],
+             'sanguine.rootgit._archived_files_by_hash'],
             [],
             ['sanguine.rootgit.done_hashing()'])
 
@@ -541,6 +567,22 @@ class RootGitData:
                                             [])
                 parallel.add_task(savearinsttask)
 
+    # lazy secondary indexes
+
+    def _build_archived_files_by_name(self) -> None:
+        assert self._archived_files_by_name is None
+        t0 = time.perf_counter()
+        self._archived_files_by_name = {}
+        for ar in self._archives_by_hash.values():
+            _append_archive_by_name(self._archived_files_by_name, ar)
+        dt = time.perf_counter() - t0
+        nentries = sum(len(lst) for lst in self._archived_files_by_name.values())
+        approxsize = sys.getsizeof(self._archived_files_by_name) + sum(
+            sys.getsizeof(lst) for lst in self._archived_files_by_name.values())
+        info_or_perf_warn(dt > 0.5,
+                          'RootGitData: lazily built by-name index: {} names, {} entries, ~{:.1f}M, took {:.2f}s'.format(
+                              len(self._archived_files_by_name), nentries, approxsize / 1048576., dt))
+
     def _loadtan_owntask_datadeps(self) -> tasks.TaskDataDependencies:
         return tasks.TaskDataDependencies(
             [],
@@ -1,5 +1,6 @@
 import sanguine.tasks as tasks
 from sanguine.cache.available_files import FileRetriever, AvailableFiles
+from sanguine.cache.extracted_blob_cache import extracted_blob_cache_for
 from sanguine.cache.folder_cache import FolderCache
 from sanguine.common import *
 from sanguine.common import SanguineJsonEncoder
@@ -17,7 +18,8 @@ class WholeCache:
     _resolved_vfs: ResolvedVFS | None
     _SYNCOWNTASKNAME: str = 'sanguine.wholecache.sync'
 
-    def __init__(self, projectcfg: LocalProjectConfig, tmp: TmpPath) -> None:
+    def __init__(self, projectcfg: LocalProjectConfig, tmp: TmpPath, precomputeretrievers: bool = False) -> None:
+        # precomputeretrievers: precompute while loading, see precompute_retrievers()
         self._project_config = projectcfg
         try:
             with open(self._cache_data_fname(), 'r') as f:
@@ -29,7 +31,8 @@ class WholeCache:
         rootmodpackdir = GithubModpack(projectcfg.root_modpack).folder(projectcfg.github_root_dir)
         self.available = AvailableFiles(projectcfg.github_username, projectcfg.cache_dir, tmp.tmpdir,
                                         projectcfg.github_root_dir, rootmodpackdir,
-                                        projectcfg.download_dirs, projectcfg.github_folders(), self._cache_data)
+                                        projectcfg.download_dirs, projectcfg.github_folders(), self._cache_data,
+                                        precomputeretrievers, extracted_blob_cache_for(projectcfg))
 
         folderstocache: FolderListToCache = projectcfg.active_source_vfs_folders()
         self._source_vfs_cache = FolderCache(projectcfg.cache_dir, 'vfs', folderstocache)
@@ -54,14 +57,18 @@ class WholeCache:
         return self._source_vfs_cache.all_files()
 
     def file_retrievers_by_hash(self, h: bytes) -> list[FileRetriever]:  # resolved as fully as feasible
+        # returned list is shared memo state of AvailableFiles, and MUST NOT be modified
         return self.available.file_retrievers_by_hash(h)
 
+    def precompute_retrievers(self) -> None:  # for callers looking up retrievers for most of the files
+        self.available.precompute_retrievers()
+
     def archive_stats(self) -> dict[bytes, tuple[int, int]]:  # hash -> (n,total_size)
         return self.available.archive_stats()
 
     def resolved_vfs(self) -> ResolvedVFS:
         if self._resolved_vfs is None:
-            self._resolved_vfs = self._project_config.mod_manager_config.resolve_vfs(self.all_source_vfs_files())
+            self._resolved_vfs = self._load_or_resolve_vfs()
         return self._resolved_vfs
 
     def stats_of_interest(self) -> list[str]:
@@ -69,6 +76,7 @@ class WholeCache:
                 + ['sanguine.wholecache.'])
 
     def done(self) -> None:
+        self.available.done()
         with open(self._cache_data_fname(), 'w') as f:
             # noinspection PyTypeChecker
             json.dump(self._cache_data, f, indent=2, cls=SanguineJsonEncoder)
@@ -84,6 +92,38 @@ class WholeCache:
     def _start_sync_own_task_func(self) -> None:
         pass  # do nothing, this task is necessary only to synchronize
 
+    def _resolved_vfs_fname(self) -> str:  # alongside 'vfs' FolderCache
+        return self._project_config.cache_dir + 'foldercache.vfs.resolved.pickle'
+
+    def _load_or_resolve_vfs(self) -> ResolvedVFS:
+        # resolving depends only on file paths (in all_source_vfs_files() order) and resolve_vfs_params()
+        mmcfg = self._project_config.mod_manager_config
+        files = list(self.all_source_vfs_files())
+        params = mmcfg.resolve_vfs_params()
+        if params is None:
+            return mmcfg.resolve_vfs(files)
+
+        paths = [f.file_path for f in files]
+        fname = self._resolved_vfs_fname()
+        if os.path.isfile(fname):
+            try:
+                with open(fname, 'rb') as rf:
+                    (oldparams, oldpaths, targetids, modpriorities, targets) = pickle.load(rf)
+                if oldparams == params and oldpaths == paths:
+                    info('WholeCache: using cached ResolvedVFS')
+                    return ResolvedVFS(files, targetids, modpriorities, targets)
+            except Exception as e:
+                warn('WholeCache: cannot load cached ResolvedVFS from {}: {}'.format(fname, e))
+
+        out = mmcfg.resolve_vfs(files)
+        targetids, modpriorities, targets = out.compact_arrays()
+        tmpfname = fname + '.tmp'
+        with open(tmpfname, 'wb') as wf:
+            # noinspection PyTypeChecker
+            pickle.dump((params, paths, targetids, modpriorities, targets), wf)
+        os.replace(tmpfname, fname)
+        return out
+
     def _cache_data_fname(self) -> str:
         return self._project_config.cache_dir + 'wholecache.cachedata.json'
 
@@ -1,20 +1,27 @@
+import hashlib
+import io
 import logging
 import re
+import shutil
 import traceback
 
+import sanguine.tasks as tasks
 from sanguine.cache.available_files import AvailableFiles
-from sanguine.cache.folder_cache import FolderCache
 from sanguine.cache.whole_cache import WholeCache
+from sanguine.cache.extracted_blob_cache import ExtractedBlobCache, extracted_blob_cache_for
 from sanguine.common import *
 from sanguine.gitdata.project_json import (ProjectJson, ProjectMod, ProjectInstaller,
                                            ProjectExtraArchive, ProjectExtraArchiveFile, ProjectModTool,
                                            ProjectModPatch)
 from sanguine.gitdata.stable_json import to_stable_json, write_stable_json
-from sanguine.helpers.archives import Archive, FileInArchive, archive_plugin_for
-from sanguine.helpers.arinstallers import ArInstaller, ArInstallerDetails, all_arinstaller_plugins
+from sanguine.helpers.archives import (Archive, FileInArchive, archive_plugin_for, clear_archive_indexes,
+                                      extract_with_listing)
+from sanguine.helpers.arinstallers import (ArInstaller, ArInstallerDetails, all_arinstaller_plugins,
+                                           arinstaller_plugin_by_name)
 from sanguine.helpers.file_retriever import (FileRetriever, ArchiveFileRetriever,
                                              GithubFileRetriever, ZeroFileRetriever)
 from sanguine.helpers.globaltools import GlobalToolPluginBase, all_global_tool_plugins, CouldBeProducedByGlobalTool
+from sanguine.helpers.materialize import materialize_file
 from sanguine.helpers.modtools import all_mod_tool_plugins, ModToolGuessParam, ModToolGuessDiff
 from sanguine.helpers.patches import patch_plugins_for
 from sanguine.helpers.project_config import LocalProjectConfig
@@ -189,20 +196,20 @@ class _ModInProgress:
             modifiedsincestats.add(self.name, len(aic.modified_since_install))
         unknownstats.add(self.name, len(self.unknown_files))
 
-    def _process_aic_clearing_remaining_after(self, cfg: LocalProjectConfig, srccache: FolderCache,
+    def _process_aic_clearing_remaining_after(self, cfg: LocalProjectConfig, srcfiles: dict[str, FileOnDisk],
                                               aic: ArInstallerDetails):
         for f in aic.files:
             mf = ModFile(self.name, f)
             if __debug__:
                 src = cfg.modfile_to_source_vfs(mf)
-                srcfile = srccache.file_by_path(src)
+                srcfile = srcfiles.get(src)
                 assert srcfile is not None
                 if aic.files[f].file_hash != truncate_file_hash(srcfile.file_hash):
                     pass
             if f in self.remaining_after_install_from:  # might have already been deleted if identical file is present in multiple archives
                 del self.remaining_after_install_from[f]
 
-    def _inter_dependency(self, cfg: LocalProjectConfig, srccache: FolderCache,
+    def _inter_dependency(self, cfg: LocalProjectConfig, srcfiles: dict[str, FileOnDisk],
                           ar0: tuple[ArInstaller, ArInstallerDetails],
                           ar1: tuple[ArInstaller, ArInstallerDetails]) -> tuple[bool, bool]:
         aoverb = 0
@@ -215,7 +222,7 @@ class _ModInProgress:
                 continue
             mf = ModFile(self.name, cf)
             src = cfg.modfile_to_source_vfs(mf)
-            srcfile = srccache.file_by_path(src)
+            srcfile = srcfiles.get(src)
             assert srcfile is not None
             if files0[cf].file_hash == truncate_file_hash(srcfile.file_hash):
                 aoverb += 1
@@ -223,7 +230,8 @@ class _ModInProgress:
                 bovera += 1
         return aoverb, bovera
 
-    def resolve_unique(self, cfg: LocalProjectConfig, itf: _IgnoredTargetFiles, srccache: FolderCache) -> None:
+    def resolve_unique(self, cfg: LocalProjectConfig, itf: _IgnoredTargetFiles,
+                       srcfiles: dict[str, FileOnDisk]) -> None:  # srcfiles: only this mod's files, by path
         assert self.required_archives is None
         assert self.install_from is None
         assert self.remaining_after_install_from is None
@@ -255,7 +263,7 @@ class _ModInProgress:
                             aic.ignored.add(f)
                         elif not f in self.archive_files:
                             src = cfg.modfile_to_source_vfs(mf)
-                            srcfile = srccache.file_by_path(src)
+                            srcfile = srcfiles.get(src)
                             if srcfile is None:
                                 assert f not in aic.skip
                                 aic.skip.add(f)
@@ -272,7 +280,7 @@ class _ModInProgress:
                                     aic.modified_since_install[f] = fia
                         else:
                             src = cfg.modfile_to_source_vfs(mf)
-                            srcfile = srccache.file_by_path(src)
+                            srcfile = srcfiles.get(src)
                             assert srcfile is not None
                             if fia.file_hash == truncate_file_hash(srcfile.file_hash):
                                 assert f not in aic.files
@@ -289,13 +297,13 @@ class _ModInProgress:
         if len(self.install_from) == 1:
             ar0: tuple[ArInstaller, ArInstallerDetails] = self.install_from[0]
             _, aic = ar0
-            self._process_aic_clearing_remaining_after(cfg, srccache, aic)
+            self._process_aic_clearing_remaining_after(cfg, srcfiles, aic)
         elif len(self.install_from) > 1:
             dependencies: set[tuple[int, int]] = set()
             for i in range(len(self.install_from)):
                 for j in range(i + 1, len(self.install_from)):
                     assert j != i
-                    ioverj, joveri = self._inter_dependency(cfg, srccache, self.install_from[i], self.install_from[j])
+                    ioverj, joveri = self._inter_dependency(cfg, srcfiles, self.install_from[i], self.install_from[j])
                     if ioverj:
                         dependencies.add((i, j))
                     if joveri:
@@ -326,7 +334,7 @@ class _ModInProgress:
             self.install_from = newsif
 
             for _, arx in self.install_from:
-                self._process_aic_clearing_remaining_after(cfg, srccache, arx)
+                self._process_aic_clearing_remaining_after(cfg, srcfiles, arx)
 
         if __debug__:
             fromarch: set[str] = set(self.remaining_after_install_from.keys())
@@ -341,6 +349,16 @@ class _ModInProgress:
                 assert False
             assert len(fromarch.intersection(self.archive_files)) == len(fromarch)
 
+    def resolved_state(self) -> tuple[Any, ...]:  # whatever resolve_unique() has set, to be returned from workers
+        # remaining_after_install_from is a subset of archive_files, so only keys go back
+        return (self.required_archives, self.install_from, list(self.remaining_after_install_from),
+                self.zero_files)
+
+    def set_resolved_state(self, state: tuple[Any, ...]) -> None:
+        assert self.required_archives is None
+        (self.required_archives, self.install_from, remaining, self.zero_files) = state
+        self.remaining_after_install_from = {f: self.archive_files[f] for f in remaining}
+
     def _num_skips(self) -> bool:
         out = 0
         for _, arext in self.install_from:
@@ -404,10 +422,250 @@ class _ModsInProgress:
     def all_retrievers(self) -> Iterable[tuple[bytes, list[FileRetriever]]]:
         return self._all_retrievers.items()
 
-    def resolve_unique(self, srccache: FolderCache) -> None:
+    def start_resolve_unique_tasks(self, parallel: tasks.Parallel, modnames: list[str],
+                                   srcfilesbymod: dict[str, dict[str, FileOnDisk]]) -> None:
+        # mods are independent at this stage, so they're resolved in batches, in worker processes;
+        #   Archives are published only once, and both mods and results refer to them by hash
         itf = _IgnoredTargetFiles(self._cfg)
-        for mod in self.mods:
-            self.mods[mod].resolve_unique(self._cfg, itf, srccache)
+        for plugin in all_arinstaller_plugins():
+            plugin.set_cache_dir(self._cfg.cache_dir)
+        archives: dict[bytes, Archive] = {}
+        for m in modnames:
+            for arh, (ar, _) in self.mods[m].known_archives.items():
+                archives[arh] = ar
+        pub = tasks.SharedPublication(parallel, (self._cfg, itf, _arinstaller_data_for_publication(), archives))
+        pubparam = tasks.make_shared_publication_param(pub)
+        for i in range(0, len(modnames), _MODS_PER_RESOLVE_TASK):
+            batch = modnames[i:i + _MODS_PER_RESOLVE_TASK]
+            resolvetaskname = 'sanguine.togithub.resolve.{}'.format(i)
+            resolvetask = tasks.Task(resolvetaskname, _resolve_unique_task_func,
+                                     (pubparam, [_pickle_with_archive_refs(self.mods[m]) for m in batch],
+                                      [srcfilesbymod.get(m, {}) for m in batch]),
+                                     [])
+            parallel.add_task(resolvetask)
+            ownresolvetaskname = 'sanguine.togithub.ownresolve.{}'.format(i)
+            ownresolvetask = tasks.OwnTask(ownresolvetaskname,
+                                           lambda _, out: self._resolve_unique_own_task_func(out), None,
+                                           [resolvetaskname])
+            parallel.add_task(ownresolvetask)
+
+    def _resolve_unique_own_task_func(self, out: list[tuple[str, bytes]]) -> None:
+        for modname, state in out:
+            assert modname in self.mods
+            self.mods[modname].set_resolved_state(
+                _unpickle_with_archive_refs(state, self._available.archive_by_hash))
+
+
+### resolve_unique() in worker processes
+
+_MODS_PER_RESOLVE_TASK = 16
+_arinstaller_data_loaded_from: tasks.SharedPubParam | None = None  # per-process
+
+
+def _arinstaller_data_for_publication() -> dict[str, Any]:
+    # same stable_json form as in known-arinstaller-*-data.json, so plugins can load it via got_loaded_data()
+    return {plugin.name(): to_stable_json(plugin.data_for_saving()) for plugin in all_arinstaller_plugins()
+            if plugin.extra_data_factory() is not None}
+
+
+def _resolve_unique_task_func(
+        param: tuple[tasks.SharedPubParam, list[bytes], list[dict[str, FileOnDisk]]]) -> list[tuple[str, bytes]]:
+    global _arinstaller_data_loaded_from
+    (pubparam, pickledmods, srcfiles) = param
+    (cfg, itf, arinstdata, archives) = tasks.from_publication(pubparam)
+    if tasks.current_proc_num() >= 0 and _arinstaller_data_loaded_from != pubparam:
+        # worker process: arinstaller plugins didn't get their data yet (in master, incl. dbg_serialize, they did)
+        for name, data in arinstdata.items():
+            arinstaller_plugin_by_name(name).got_loaded_data(data)
+        for plugin in all_arinstaller_plugins():
+            plugin.set_cache_dir(cfg.cache_dir)
+        _arinstaller_data_loaded_from = pubparam
+    assert len(pickledmods) == len(srcfiles)
+    out = []
+    for i in range(len(pickledmods)):
+        mod: _ModInProgress = _unpickle_with_archive_refs(pickledmods[i], archives.get)
+        mod.resolve_unique(cfg, itf, srcfiles[i])
+        out.append((mod.name, _pickle_with_archive_refs(mod.resolved_state())))
+    return out
+
+
+### incremental togithub: per-mod results of resolve_unique() are persisted, keyed by per-mod fingerprints
+# Only resolve_unique() results are reused; stages after it depend on other mods (required_archives,
+#   global tools working over whole ResolvedVFS), and are cheap enough to be re-run for all the mods
+
+_MOD_CACHE_VERSION = 1  # to be incremented whenever _ModInProgress or resolve_unique() logic changes
+
+
+def _mod_cache_fname(cfg: LocalProjectConfig) -> str:
+    return cfg.cache_dir + 'togithub.mods.pickle'
+
+
+def _mod_fingerprint_salt(cfg: LocalProjectConfig) -> bytes:
+    # whatever affects all the mods
+    return as_json([_MOD_CACHE_VERSION, cfg.root_modpack_config().ignored_file_patterns,
+                    cfg.mod_manager_config.resolve_vfs_params(),
+                    sorted(plugin.name() for plugin in all_arinstaller_plugins())]).encode('utf-8')
+
+
+def _mod_fingerprint(salt: bytes, mod: _ModInProgress, srcfiles: dict[str, FileOnDisk]) -> bytes:
+    # source files (path, hash, size) and retrievers for them (which include relevant archive catalog entries)
+    h = hashlib.sha256(salt)
+    for fpath in sorted(srcfiles):
+        f = srcfiles[fpath]
+        h.update(fpath.encode('utf-8'))
+        h.update(f.file_hash)
+        h.update(str(f.file_size).encode('ascii'))
+    for intramod in sorted(mod.archive_files):
+        h.update(intramod.encode('utf-8'))
+        for r in mod.archive_files[intramod]:
+            h.update(as_json(r).encode('utf-8'))
+    for intramod in sorted(mod.github_files):
+        h.update(intramod.encode('utf-8'))
+        for r in mod.github_files[intramod]:
+            h.update(as_json(r).encode('utf-8'))
+    return h.digest()
+
+
+class _ArchiveRefPickler(pickle.Pickler):
+    # Archives are large, and are always available from AvailableFiles, so only their hashes are stored
+    def persistent_id(self, obj: Any) -> Any:
+        if isinstance(obj, Archive):
+            return obj.archive_hash
+        return None
+
+
+class _ArchiveRefUnpickler(pickle.Unpickler):
+    _archive_by_hash: Callable[[bytes], Archive | None]
+
+    def __init__(self, f: typing.BinaryIO, archivebyhash: Callable[[bytes], Archive | None]) -> None:
+        super().__init__(f)
+        self._archive_by_hash = archivebyhash
+
+    def persistent_load(self, pid: Any) -> Any:
+        ar = self._archive_by_hash(pid)
+        if ar is None:
+            raise pickle.UnpicklingError('archive {} is not available'.format(to_json_hash(pid)))
+        return ar
+
+
+def _pickle_with_archive_refs(obj: Any) -> bytes:
+    b = io.BytesIO()
+    _ArchiveRefPickler(b).dump(obj)
+    return b.getvalue()
+
+
+def _unpickle_with_archive_refs(data: bytes, archivebyhash: Callable[[bytes], Archive | None]) -> Any:
+    return _ArchiveRefUnpickler(io.BytesIO(data), archivebyhash).load()
+
+
+def _load_mod_cache(cfg: LocalProjectConfig) -> dict[str, tuple[bytes, bytes]]:  # modname -> (fingerprint, pickled)
+    fname = _mod_cache_fname(cfg)
+    if not os.path.isfile(fname):
+        return {}
+    return read_dict_from_pickled_file(fname)
+
+
+def _save_mod_cache(cfg: LocalProjectConfig, modcache: dict[str, tuple[bytes, bytes]]) -> None:
+    fname = _mod_cache_fname(cfg)
+    tmpfname = fname + '.tmp'
+    with open(tmpfname, 'wb') as wf:
+        # noinspection PyTypeChecker
+        pickle.dump(modcache, wf)
+    os.replace(tmpfname, fname)
+
+
+### patches
+
+class _PatchCandidate:
+    mod_name: str
+    installer_idx: int  # index in _ModInProgress.install_from
+    intramod: str
+    modified: FileInArchive  # original, as it was in the archive
+    real_path: str
+
+    def __init__(self, modname: str, installeridx: int, intramod: str, modified: FileInArchive,
+                 realpath: str) -> None:
+        self.mod_name = modname
+        self.installer_idx = installeridx
+        self.intramod = intramod
+        self.modified = modified
+        self.real_path = realpath
+
+
+def _patch_original_fname(origcachedir: str, fia: FileInArchive) -> str:
+    # keyed by (truncated) file hash, extension is kept just in case patch plugins look at it
+    return origcachedir + fia.file_hash.hex() + os.path.splitext(fia.intra_path)[1]
+
+
+def _patch_archive_task_func(
+        param: tuple[str, bytes, list[_PatchCandidate], str, str, ExtractedBlobCache | None, str]) -> list[
+    tuple[_PatchCandidate, str, Any]]:
+    # originals are stored only in blobcache if it is enabled (patch plugins get their own copies in tmpdir,
+    #   with the original extension), and in origcachedir otherwise
+    (arfilepath, arh, candidates, origcachedir, listingcachedir, blobcache, tmpdir) = param
+    origdir = tmpdir + 'originals\\' if blobcache is not None else origcachedir
+    toextract: list[_PatchCandidate] = []
+    for c in candidates:
+        origfname = _patch_original_fname(origdir, c.modified)
+        if os.path.isfile(origfname):
+            continue
+        if blobcache is not None and blobcache.fetch(c.modified.file_hash, c.modified.file_size, origfname):
+            continue
+        toextract.append(c)
+    if len(toextract) > 0:
+        os.makedirs(tmpdir, exist_ok=True)
+        arplg = archive_plugin_for(arfilepath)
+        inarpaths = sorted(set(c.modified.intra_path for c in toextract))
+        extracted = extract_with_listing(arplg, arfilepath, arh, inarpaths, tmpdir, listingcachedir)
+        assert len(extracted) == len(inarpaths)
+        for i in range(len(inarpaths)):
+            if extracted[i] is not None:
+                for c in toextract:
+                    if c.modified.intra_path == inarpaths[i]:
+                        origfname = _patch_original_fname(origdir, c.modified)
+                        if os.path.isfile(origfname):
+                            continue
+                        if blobcache is not None:
+                            blobcache.put(c.modified.file_hash, extracted[i])
+                            # no hardlinks, as patch plugins must not be able to damage extracted[i]
+                            materialize_file(extracted[i], origfname, allowhardlinks=False)
+                        else:
+                            tmpfname = origfname + '.tmp.' + str(os.getpid())
+                            shutil.copyfile(extracted[i], tmpfname)
+                            os.replace(tmpfname, origfname)
+
+    out: list[tuple[_PatchCandidate, str, Any]] = []
+    for c in candidates:
+        origfname = _patch_original_fname(origdir, c.modified)
+        if not os.path.isfile(origfname):
+            continue  # not extracted
+        for pplg in patch_plugins_for(c.intramod):
+            try:
+                patch = pplg.patch(origfname, c.real_path)
+                if patch is not None:
+                    out.append((c, pplg.name(), patch))
+                    break
+            except Exception as e:
+                warn('Exception while patching {}: {}'.format(c.intramod, e))
+                warn(traceback.format_exc())
+    return out
+
+
+def _apply_patches_own_task_func(mip: _ModsInProgress, out: list[tuple[_PatchCandidate, str, Any]]) -> None:
+    for c, pluginname, patch in out:
+        ff = c.intramod
+        mod = mip.mods[c.mod_name]
+        if ff not in mod.unknown_files:
+            debug('Patch found for {}, but it is not unknown anymore, ignoring', ff)
+            continue
+        info('Patch found for {}'.format(ff))
+        aic = mod.install_from[c.installer_idx][1]
+        assert ff in aic.modified_since_install
+        del aic.modified_since_install[ff]
+        assert ff in aic.skip
+        aic.skip.remove(ff)
+        mod.unknown_files.remove(ff)
+        mod.patched[ff] = (pluginname, patch)
 
 
 class _ToolFinder:
@@ -445,6 +703,7 @@ def togithub(cfg: LocalProjectConfig, wcache: WholeCache) -> None:
     toolsfinder: _ToolFinder = _ToolFinder(cfg, wcache.resolved_vfs())
 
     info('Stage 0: collecting retrievers')
+    wcache.precompute_retrievers()  # we'll look up retrievers for all the VFS files
     mip = _ModsInProgress(cfg, wcache.available)
     nzero = 0
     nzerostats = _ExtStats()
@@ -452,8 +711,12 @@ def togithub(cfg: LocalProjectConfig, wcache: WholeCache) -> None:
     toolstats: dict[str, _ExtStats] = {}
     nignored = 0
     itf = _IgnoredTargetFiles(cfg)
+    srcfilesbymod: dict[str, dict[str, FileOnDisk]] = {}
     for f in wcache.all_source_vfs_files():
         mf = cfg.parse_source_vfs(f.file_path)
+        if mf.mod not in srcfilesbymod:
+            srcfilesbymod[mf.mod] = {}
+        srcfilesbymod[mf.mod][f.file_path] = f
 
         target = cfg.mod_manager_config.modfile_to_target_vfs(mf)
         ignored = itf.ignored(target)
@@ -505,7 +768,33 @@ def togithub(cfg: LocalProjectConfig, wcache: WholeCache) -> None:
 
     ### processing unique retrievers, resolving per-mod install files, etc.
     info('Stage 1: resolve_unique()...')
-    mip.resolve_unique(wcache._source_vfs_cache)
+    salt = _mod_fingerprint_salt(cfg)
+    fingerprints: dict[str, bytes] = {modname: _mod_fingerprint(salt, mod, srcfilesbymod.get(modname, {}))
+                                      for modname, mod in mip.mods.items()}
+    oldmodcache = _load_mod_cache(cfg)
+    newmodcache: dict[str, tuple[bytes, bytes]] = {}
+    toresolve: list[str] = []
+    for modname in mip.mods:
+        cached = oldmodcache.get(modname)
+        if cached is not None and cached[0] == fingerprints[modname]:
+            try:
+                restored: _ModInProgress = _unpickle_with_archive_refs(cached[1], wcache.available.archive_by_hash)
+                assert restored.name == modname
+                mip.mods[modname] = restored
+                newmodcache[modname] = cached
+                continue
+            except Exception as e:
+                warn('togithub: cannot restore cached mod {}: {}, will re-process it'.format(modname, e))
+        toresolve.append(modname)
+    info('{} mod(s) unchanged since last run, {} mod(s) to process'.format(len(mip.mods) - len(toresolve),
+                                                                          len(toresolve)))
+    if len(toresolve) > 0:
+        with tasks.Parallel(None, taskstatsofinterest=['sanguine.togithub.']) as parallel:
+            mip.start_resolve_unique_tasks(parallel, toresolve, srcfilesbymod)
+            parallel.run([])
+    for modname in toresolve:
+        newmodcache[modname] = (fingerprints[modname], _pickle_with_archive_refs(mip.mods[modname]))
+    _save_mod_cache(cfg, newmodcache)  # before the stages below modify mods
 
     info('Stage 2: using already-required archives...')
     required_archives = {}
@@ -614,52 +903,65 @@ def togithub(cfg: LocalProjectConfig, wcache: WholeCache) -> None:
     info('{} unknown mod files could have been produced by tools'.format(ntools))
 
     info('Trying to find possible patches...')
-    with TmpPath(cfg.tmp_dir) as tmp:
-        for mod in mip.mods.values():
-            for arinst, aic in mod.install_from:
-                for ff in list(aic.modified_since_install.keys()):
-                    if not ff in mod.unknown_files:
-                        continue  # TODO: double-check that we don't want to do anything about such strange (usually spurious) files
-
-                    modified: FileInArchive = aic.modified_since_install[ff]
-                    inarpath = modified.intra_path
-
-                    patchplugins = patch_plugins_for(ff)
-                    if patchplugins is None:
-                        continue
-
-                    mf = ModFile(mod.name, ff)
-                    realpath = cfg.modfile_to_source_vfs(mf)
-                    assert realpath is not None
-
-                    arh = arinst.archive.archive_hash
-                    ar = wcache.available.archive_by_hash(arh)
-                    if ar is not None:
-                        assert ar.archive_hash == arh
-                        arfiles: list[FileOnDisk] = wcache.available.downloaded_file_by_hash(arh)
-                        if arfiles is None:
-                            continue
-                        arfile = arfiles[0]  # if there is more than one, any will do
-                        arplg = archive_plugin_for(arfile.file_path)
-                        extracted = arplg.extract(arfile.file_path, [inarpath], tmp.tmpdir)
-                        assert len(extracted) == 1
-                        if extracted[0] is not None:
-                            extracted = extracted[0]
-                            for pplg in patchplugins:
-                                try:
-                                    patch = pplg.patch(extracted, realpath)
-                                    if patch is not None:
-                                        info('Patch found for {}'.format(ff))
-                                        assert ff in aic.modified_since_install
-                                        del aic.modified_since_install[ff]
-                                        assert ff in aic.skip
-                                        aic.skip.remove(ff)
-                                        mod.unknown_files.remove(ff)
-                                        mod.patched[ff] = (pplg.name(), patch)
-                                        break
-                                except Exception as e:
-                                    warn('Exception while patching {}: {}'.format(ff, e))
-                                    warn(traceback.format_exc())
+    # candidates are grouped by archive, so each archive is opened only once, and all its members are extracted
+    #   in one go; archives are processed in parallel; originals are cached by hash across runs
+    patchcandidates: dict[bytes, list[_PatchCandidate]] = {}
+    for mod in mip.mods.values():
+        candidateffs: set[str] = set()  # the same ff may be modified_since_install for several installers
+        for iinst in range(len(mod.install_from)):
+            arinst, aic = mod.install_from[iinst]
+            for ff in aic.modified_since_install.keys():
+                if not ff in mod.unknown_files:
+                    continue  # TODO: double-check that we don't want to do anything about such strange (usually spurious) files
+                if patch_plugins_for(ff) is None:
+                    continue
+                if ff in candidateffs:
+                    continue  # only the first installer is tried
+                candidateffs.add(ff)
+
+                mf = ModFile(mod.name, ff)
+                realpath = cfg.modfile_to_source_vfs(mf)
+                assert realpath is not None
+
+                modified: FileInArchive = aic.modified_since_install[ff]
+                arh = arinst.archive.archive_hash
+                if arh not in patchcandidates:
+                    patchcandidates[arh] = []
+                patchcandidates[arh].append(_PatchCandidate(mod.name, iinst, ff, modified, realpath))
+
+    patchtasks: list[tuple[str, bytes, list[_PatchCandidate]]] = []
+    for arh, candidates in patchcandidates.items():
+        ar = wcache.available.archive_by_hash(arh)
+        if ar is None:
+            continue
+        assert ar.archive_hash == arh
+        arfiles: list[FileOnDisk] = wcache.available.downloaded_file_by_hash(arh)
+        if arfiles is None:
+            continue
+        patchtasks.append((arfiles[0].file_path, arh, candidates))  # if there is more than one, any will do
+
+    if len(patchtasks) > 0:
+        origcachedir = cfg.cache_dir + 'patchoriginals\\'  # only if blob cache is disabled
+        listingcachedir = cfg.cache_dir + 'archivelistings\\'
+        blobcache = extracted_blob_cache_for(cfg)
+        if blobcache is None:
+            os.makedirs(origcachedir, exist_ok=True)
+        with TmpPath(cfg.tmp_dir) as tmp:
+            with tasks.Parallel(None, taskstatsofinterest=['sanguine.togithub.']) as parallel:
+                for i in range(len(patchtasks)):
+                    arfilepath, arh, candidates = patchtasks[i]
+                    patchtaskname = 'sanguine.togithub.patch.{}'.format(i)
+                    patchtask = tasks.Task(patchtaskname, _patch_archive_task_func,
+                                           (arfilepath, arh, candidates, origcachedir, listingcachedir,
+                                            blobcache, tmp.tmpdir + str(i) + '\\'), [])
+                    parallel.add_task(patchtask)
+                    ownpatchtask = tasks.OwnTask('sanguine.togithub.ownpatch.{}'.format(i),
+                                                 lambda _, out: _apply_patches_own_task_func(mip, out), None,
+                                                 [patchtaskname])
+                    parallel.add_task(ownpatchtask)
+                parallel.run([])
+        if blobcache is not None:
+            blobcache.trim()  # no workers anymore
 
     ninstallfrom = 0
     # info('per-mod stats:')
@@ -756,3 +1058,4 @@ def togithub(cfg: LocalProjectConfig, wcache: WholeCache) -> None:
 
     jdata = to_stable_json(pj)
     write_stable_json(cfg.this_modpack_folder() + "project.json", jdata)
+    clear_archive_indexes()  # indexes are built once per togithub run (in master and in each worker)
@@ -3,11 +3,10 @@ import codecs as _codecs
 import hashlib as _hashlib
 import json
 import pickle
+from array import array as _array
 from bisect import bisect_right as _bisect_right
 from stat import S_ISREG, S_ISLNK
 
-import chardet
-
 # noinspection PyUnresolvedReferences
 from sanguine.install.install_checks import check_sanguine_prerequisites
 from sanguine.install.install_common import *
@@ -117,24 +116,55 @@ class ModFile:
 
 
 class ResolvedVFS:
-    _source_to_target: dict[str, str]  # full path to relpath
-    _target_files: dict[str, list[FileOnDisk]]  # relpath to list of files
-
-    def __init__(self, sourcetotarget: dict[str, str], targetfiles: dict[str, list[FileOnDisk]]) -> None:
-        self._source_to_target = sourcetotarget
-        self._target_files = targetfiles
+    # compact representation: arrays below are indexed by file index (position in _files)
+    _files: list[FileOnDisk]
+    _target_ids: _array  # array('l'): file index -> index in _targets
+    _mod_priorities: _array  # array('l'): file index -> mod priority; files for the same target are ordered by it
+    _targets: list[str]  # unique relpaths
+    _target_by_path: dict[str, int] | None  # lazy, relpath -> target id
+    _source_to_target: dict[str, int] | None  # lazy, full path -> target id
+    _by_target: list[list[int]] | None  # lazy, target id -> file indexes, ordered by mod priority
+
+    def __init__(self, files: list[FileOnDisk], targetids: _array, modpriorities: _array,
+                 targets: list[str]) -> None:
+        assert len(files) == len(targetids) == len(modpriorities)
+        self._files = files
+        self._target_ids = targetids
+        self._mod_priorities = modpriorities
+        self._targets = targets
+        self._target_by_path = None
+        self._source_to_target = None
+        self._by_target = None
 
     def all_source_files(self) -> Iterable[str]:
-        return self._source_to_target.keys()
+        return (f.file_path for f in self._files)
 
     def all_target_files(self) -> Iterable[str]:
-        return self._target_files.keys()
+        return self._targets
 
     def source_to_target(self, path: str) -> str:
-        return self._source_to_target[path]
+        if self._source_to_target is None:
+            self._source_to_target = {self._files[i].file_path: self._target_ids[i] for i in range(len(self._files))}
+        return self._targets[self._source_to_target[path]]
 
     def files_for_target(self, relpath: str) -> list[FileOnDisk]:
-        return self._target_files[relpath]
+        if self._by_target is None:
+            self._build_by_target()
+        return [self._files[i] for i in self._by_target[self._target_by_path[relpath]]]
+
+    def compact_arrays(self) -> tuple[_array, _array, list[str]]:  # for caching, see WholeCache
+        return self._target_ids, self._mod_priorities, self._targets
+
+    def _build_by_target(self) -> None:
+        self._target_by_path = {self._targets[i]: i for i in range(len(self._targets))}
+        bytarget: list[list[int]] = [[] for _ in range(len(self._targets))]
+        for i, tid in enumerate(self._target_ids):
+            bytarget[tid].append(i)
+        for fidxs in bytarget:
+            if len(fidxs) > 1:
+                fidxs.sort(key=self._mod_priorities.__getitem__)
+                assert len(set(self._mod_priorities[i] for i in fidxs)) == len(fidxs)
+        self._by_target = bytarget
 
 
 ### Hashing
@@ -281,15 +311,38 @@ def unused_config_warning(where: str, cfg: ConfigData, known: list[str]) -> None
 
 # open_3rdparty_txt_file_with_encoding() is defined in sanguine.install.install_common.py
 
-def open_3rdparty_txt_file_autodetect(fname: str) -> typing.TextIO:
-    n = min(32, os.path.getsize(fname))
-    with open(fname, 'rb') as fb:
-        raw = fb.read(n)
+_detected_encodings: dict[str, tuple[int, float, str]] = {}  # fname -> (size, mtime, encoding)
+
 
+def _detect_3rdparty_txt_encoding(raw: bytes) -> str:
+    # cheap checks first, chardet (which is slow both to import and to run) only as a last resort
     if raw.startswith(_codecs.BOM_UTF8):
-        enc = 'utf-8-sig'
+        return 'utf-8-sig'
+    if raw.startswith(_codecs.BOM_UTF16_LE) or raw.startswith(_codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    if raw.isascii():
+        return 'utf-8'  # superset of ascii, so non-ascii chars further down the file are still decoded
+    try:
+        _codecs.getincrementaldecoder('utf-8')().decode(raw, final=False)  # raw may end in the middle of a char
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    import chardet
+    return chardet.detect(raw)['encoding']
+
+
+def open_3rdparty_txt_file_autodetect(fname: str) -> typing.TextIO:
+    st = os.stat(fname)
+    cached = _detected_encodings.get(fname)
+    if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime:
+        enc = cached[2]
     else:
-        enc = chardet.detect(raw)['encoding']
+        n = min(32, st.st_size)
+        with open(fname, 'rb') as fb:
+            raw = fb.read(n)
+        enc = _detect_3rdparty_txt_encoding(raw)
+        _detected_encodings[fname] = (st.st_size, st.st_mtime, enc)
     return open(fname, 'rt', encoding=enc, errors='replace')
 
 
@@ -95,7 +95,8 @@ def _found_origin_plugin(plugin: FileOriginPluginBase):
     _file_origin_plugins[plugin.name()] = plugin
 
 
-load_plugins('plugins/fileorigin/', FileOriginPluginBase, lambda plugin: _found_origin_plugin(plugin))
+load_plugins('plugins/fileorigin/', FileOriginPluginBase, lambda plugin: _found_origin_plugin(plugin),
+             ['name'])
 
 
 def file_origins_for_file(fpath: str) -> list[FileOrigin] | None:
@@ -1,16 +1,19 @@
+import sys
+from bisect import bisect_left
+
 from sanguine.common import *
 from sanguine.helpers.plugin_handler import load_plugins
 
 
 class FileInArchive:
     file_hash: bytes
-    intra_path: str
+    intra_path: str  # interned, see intern_archive_intra_path()
     file_size: int
 
     def __init__(self, file_hash: bytes, file_size: int, intra_path: str) -> None:
         self.file_hash = file_hash
         self.file_size = file_size
-        self.intra_path = intra_path
+        self.intra_path = intern_archive_intra_path(intra_path)
 
 
 class Archive:
@@ -27,6 +30,39 @@ class Archive:
         self.by = by
 
 
+class ArchiveMember:
+    intra_path: str  # normalized, see normalize_archive_intra_path()
+    file_size: int
+    solid_block: int  # -1 if member is not in a solid block (or archiver doesn't tell)
+
+    def __init__(self, intra_path: str, file_size: int, solid_block: int) -> None:
+        self.intra_path = intra_path
+        self.file_size = file_size
+        self.solid_block = solid_block
+
+
+class ArchiveListing:
+    members: list[ArchiveMember]  # in archive order
+    by_intra_path: dict[str, ArchiveMember]
+
+    def __init__(self, members: list[ArchiveMember]) -> None:
+        self.members = members
+        self.by_intra_path = {m.intra_path: m for m in members}
+
+    def plan(self, listoffiles: list[str]) -> tuple[list[str], list[str]]:
+        # returns (files to extract, grouped by solid block and in archive order within block, missing files)
+        order = {m.intra_path: i for i, m in enumerate(self.members)}
+        found: list[str] = []
+        missing: list[str] = []
+        for f in listoffiles:
+            (found if f in self.by_intra_path else missing).append(f)
+        found.sort(key=lambda f: (self.by_intra_path[f].solid_block, order[f]))
+        return found, missing
+
+    def solid_blocks_for(self, listoffiles: list[str]) -> set[int]:
+        return {self.by_intra_path[f].solid_block for f in listoffiles if f in self.by_intra_path} - {-1}
+
+
 class ArchivePluginBase(ABC):
     @abstractmethod
     def extensions(self) -> list[str]:
@@ -40,6 +76,33 @@ class ArchivePluginBase(ABC):
     def extract_all(self, archive: str, targetpath: str) -> None:
         pass
 
+    def extract_all_and_hash(self, archive: str, targetpath: str) -> dict[str, tuple[int, bytes]] | None:
+        # optional: extract_all() which hashes files while writing them, to avoid reading them back;
+        #   returns os.path.normcase(extracted path) -> (size, hash), or None if not supported by the plugin
+        return None
+
+    def hash_all(self, archive: str) -> list[tuple[str, int, bytes]] | None:
+        # optional: [(intra_path, size, hash)] of all the files, without extracting them to disk at all;
+        #   None if not supported by the plugin
+        return None
+
+    def extract_with_hash(self, archive: str, arhash: bytes, listoffiles: list[str],
+                          targetpath: str) -> list[str | None]:
+        # same as extract(), for callers which know archive hash; plugins keeping per-archive state
+        #   (such as BSA index) may cache it by hash, so that it is shared by all copies of the archive
+        return self.extract(archive, listoffiles, targetpath)
+
+    def list_members(self, archive: str) -> list[ArchiveMember] | None:
+        # optional: for archivers where extraction is expensive to start (external tools),
+        #   see archive_listing(); None if not supported by the plugin
+        return None
+
+    def extract_planned(self, archive: str, listoffiles: list[str], targetpath: str,
+                        listing: ArchiveListing) -> list[str | None]:
+        # same as extract(), but with a listing at hand, so files missing from the archive
+        #   can be skipped without asking the archiver, and present ones need no checks after extraction
+        return self.extract(archive, listoffiles, targetpath)
+
     @staticmethod
     def unarchived_list_helper(archive: str, listoffiles: list[str], targetpath: str) -> list[str | None]:
         out: list[str | None] = []
@@ -51,6 +114,15 @@ class ArchivePluginBase(ABC):
                 out.append(None)
         return out
 
+    @staticmethod
+    def planned_list_helper(archive: str, listoffiles: list[str], targetpath: str,
+                            missing: list[str]) -> list[str | None]:
+        # archiver has already succeeded, so everything which is in the listing is there
+        for f in missing:
+            warn('{} NOT FOUND in {}'.format(f, archive))
+        missingset = set(missing)
+        return [None if f in missingset else targetpath + f for f in listoffiles]
+
     @staticmethod
     def prepare_file_spec(listoffiles: list[str], targetpath: str) -> str:
         if len(listoffiles) == 1:
@@ -76,7 +148,8 @@ def _found_archive_plugin(plugin: ArchivePluginBase) -> None:
         _archive_exts.append(ext)
 
 
-load_plugins('plugins/archive/', ArchivePluginBase, lambda plugin: _found_archive_plugin(plugin))
+load_plugins('plugins/archive/', ArchivePluginBase, lambda plugin: _found_archive_plugin(plugin),
+             ['extensions'])
 
 
 def archive_plugin_for(path: str) -> ArchivePluginBase:
@@ -93,3 +166,129 @@ def all_archive_plugins_extensions() -> list[str]:
 def normalize_archive_intra_path(fpath: str):
     assert is_short_file_path(fpath.lower())
     return fpath.lower()
+
+
+def intern_archive_intra_path(intra_path: str) -> str:
+    # the same intra-archive paths repeat over and over across archives (different versions of the same mod,
+    #   'textures\\...', 'meshes\\...', etc.), so we keep only one str object per distinct path.
+    # As a side benefit, comparing interned strings for equality is mostly an identity check.
+    # Pickling (both pickled_cache and returning from tasks) preserves sharing within one pickled object.
+    return sys.intern(intra_path)
+
+
+### ArchiveListing cache: persistent, by archive hash, so the same archive is never listed twice across runs
+
+_archive_listings: dict[bytes, ArchiveListing] = {}  # per-process, archive_hash -> ArchiveListing
+
+
+def _archive_listing_fname(cachedir: str, arhash: bytes) -> str:
+    return cachedir + arhash.hex() + '.listing.pickle'
+
+
+def archive_listing(plugin: ArchivePluginBase, archive: str, arhash: bytes, cachedir: str) -> ArchiveListing | None:
+    # None if plugin doesn't support listing
+    found = _archive_listings.get(arhash)
+    if found is not None:
+        return found
+    fname = _archive_listing_fname(cachedir, arhash)
+    if os.path.isfile(fname):
+        try:
+            with open(fname, 'rb') as rf:
+                out = pickle.load(rf)
+            _archive_listings[arhash] = out
+            return out
+        except Exception as e:
+            warn('error loading {}: {}, will re-list archive'.format(fname, e))
+
+    members = plugin.list_members(archive)
+    if members is None:
+        return None
+    out = ArchiveListing(members)
+    _archive_listings[arhash] = out
+    os.makedirs(cachedir, exist_ok=True)
+    tmpfname = fname + '.tmp.' + str(os.getpid())  # several processes may list the same archive
+    with open(tmpfname, 'wb') as wf:
+        pickle.dump(out, wf)
+    os.replace(tmpfname, fname)
+    return out
+
+
+def extract_with_listing(plugin: ArchivePluginBase, archive: str, arhash: bytes, listoffiles: list[str],
+                         targetpath: str, listingcachedir: str | None) -> list[str | None]:
+    listing = archive_listing(plugin, archive, arhash, listingcachedir) if listingcachedir is not None else None
+    if listing is None:
+        return plugin.extract_with_hash(archive, arhash, listoffiles, targetpath)
+    return plugin.extract_planned(archive, listoffiles, targetpath, listing)
+
+
+### ArchiveIndex: shared by all arinstaller plugins while guessing
+
+class ArchiveIndex:
+    archive: Archive
+    by_intra_path: dict[str, FileInArchive]
+    sorted_intra_paths: list[str]
+    sorted_files: list[FileInArchive]  # same order as sorted_intra_paths
+    by_file_hash: dict[bytes, list[FileInArchive]]  # truncated hash -> files
+    _matched_for: Any  # modfiles object (compared by identity) which _matched was calculated for
+    _matched: dict[str, list[FileInArchive]] | None
+
+    def __init__(self, archive: Archive) -> None:
+        self.archive = archive
+        self.by_intra_path = {}
+        self.by_file_hash = {}
+        for fia in archive.files:
+            self.by_intra_path[fia.intra_path] = fia
+            if fia.file_hash not in self.by_file_hash:
+                self.by_file_hash[fia.file_hash] = [fia]
+            else:
+                self.by_file_hash[fia.file_hash].append(fia)
+        self.sorted_files = sorted(archive.files, key=lambda f: f.intra_path)
+        self.sorted_intra_paths = [f.intra_path for f in self.sorted_files]
+        self._matched_for = None
+        self._matched = None
+
+    def all_starting_with(self, prefix: str) -> list[FileInArchive]:
+        # all strings starting with prefix are within [prefix, prefix_with_last_char_incremented)
+        if prefix == '':
+            return self.sorted_files
+        start = bisect_left(self.sorted_intra_paths, prefix)
+        end = bisect_left(self.sorted_intra_paths, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        return self.sorted_files[start:end]
+
+    def modfile_matches(self, modfiles: dict[str, list[Any]]) -> dict[str, list[FileInArchive]]:
+        # modpath -> files within this archive with the same hash; modfiles values are lists of ArchiveFileRetriever
+        #   (not imported here to avoid circular import), all with the same file_hash
+        # all the plugins are called with the same modfiles for the same archive, so the last result is kept
+        if self._matched_for is modfiles:
+            return self._matched
+        out: dict[str, list[FileInArchive]] = {}
+        for modpath, rlist in modfiles.items():
+            found = self.by_file_hash.get(truncate_file_hash(rlist[0].file_hash))
+            if found is not None:
+                out[modpath] = found
+        self._matched_for = modfiles
+        self._matched = out
+        return out
+
+    @staticmethod
+    def root_for(intra_path: str, relpath: str) -> str | None:  # suffix match at path component boundary
+        if not intra_path.endswith(relpath):
+            return None
+        root = intra_path[:-len(relpath)]
+        return root if root == '' or root.endswith('\\') else None
+
+
+_archive_indexes: dict[bytes, ArchiveIndex] = {}  # per-process, archive_hash -> ArchiveIndex
+
+
+def archive_index(archive: Archive) -> ArchiveIndex:
+    found = _archive_indexes.get(archive.archive_hash)
+    if found is not None and len(found.sorted_files) == len(archive.files):
+        return found
+    out = ArchiveIndex(archive)
+    _archive_indexes[archive.archive_hash] = out
+    return out
+
+
+def clear_archive_indexes() -> None:
+    _archive_indexes.clear()
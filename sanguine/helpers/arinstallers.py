@@ -75,6 +75,9 @@ class ArInstallerPluginBase(ABC):
     def add_extra_data(self, arh: bytes, data: Any | None | Exception) -> None:
         pass
 
+    def set_cache_dir(self, cachedir: str) -> None:  # for plugins which want to keep their own caches across runs
+        pass
+
 
 _arinstaller_plugins: dict[str, ArInstallerPluginBase] = {}
 
@@ -84,7 +87,8 @@ def _found_arinstaller_plugin(plugin: ArInstallerPluginBase) -> None:
     _arinstaller_plugins[plugin.name()] = plugin  # order is preserved since Python 3.6 or so
 
 
-load_plugins('plugins/arinstaller/', ArInstallerPluginBase, lambda plugin: _found_arinstaller_plugin(plugin))
+load_plugins('plugins/arinstaller/', ArInstallerPluginBase, lambda plugin: _found_arinstaller_plugin(plugin),
+             ['name'])
 
 
 def all_arinstaller_plugins() -> Iterable[ArInstallerPluginBase]:
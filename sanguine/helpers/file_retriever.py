@@ -1,5 +1,4 @@
 import hashlib
-import shutil
 import tempfile
 
 from sanguine.common import *
@@ -81,7 +80,12 @@ class GithubFileRetriever(FileRetriever):
 
     def fetch(self, available: "AvailableFiles", targetfpath: str):
         assert is_normalized_file_path(targetfpath)
-        shutil.copyfile(self._full_path(), targetfpath)
+        materializer = available.materializer()
+        if materializer.from_known(self.file_hash, targetfpath):
+            return
+        # no hardlinks: source is a file in git working copy, it must not change when target is modified
+        materializer.from_file(self._full_path(), targetfpath, self.file_size, allowhardlinks=False)
+        materializer.add_produced(self.file_hash, targetfpath)
 
     def fetch_for_reading(self, available: "AvailableFiles", tmpdirpath: str) -> str:
         return self._full_path()
@@ -139,7 +143,9 @@ class ArchiveFileRetriever(FileRetriever):
         return self.single_archive_retrievers[0].archive_hash
 
     def fetch(self, available: "AvailableFiles", targetfpath: str) -> None:
-        assert False  # should not be called directly, only via archive aggregation
+        # slow for many files, which should be fetched via archive aggregation instead
+        assert is_normalized_file_path(targetfpath)
+        available.fetch_archived_file(self, targetfpath)
 
     def fetch_for_reading(self, available: "AvailableFiles", tmpdirpath: str) -> str:
         assert False  # should not be called directly, only via archive aggregation
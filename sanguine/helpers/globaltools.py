@@ -50,7 +50,8 @@ def _found_global_tool_plugin(plugin: GlobalToolPluginBase) -> None:
     _global_tool_plugins.append(plugin)
 
 
-load_plugins('plugins/globaltool/', GlobalToolPluginBase, lambda plugin: _found_global_tool_plugin(plugin))
+load_plugins('plugins/globaltool/', GlobalToolPluginBase, lambda plugin: _found_global_tool_plugin(plugin),
+             ['name', 'supported_games', 'extensions'])
 
 
 def all_global_tool_plugins(gameuniverse: str) -> list[GlobalToolPluginBase]:
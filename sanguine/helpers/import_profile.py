@@ -0,0 +1,101 @@
+"""
+Startup import-time profiling: runs a fresh interpreter with -X importtime, so that the numbers are those of a cold
+start (as for master, and for each spawned worker), and parses its per-module breakdown.
+"""
+import subprocess
+import sys
+
+from sanguine.common import *
+
+# what sanguine-rose.py imports at startup
+MASTER_STARTUP_MODULES: list[str] = ['sanguine.common', 'sanguine.helpers.project_config', 'sanguine.tasks',
+                                     'sanguine.cache.whole_cache', 'sanguine.commands.togithub']
+# what a worker needs to unpickle task functions and their params
+WORKER_STARTUP_MODULES: list[str] = ['sanguine.common', 'sanguine.tasks', 'sanguine.cache.whole_cache']
+
+MASTER_IMPORT_BUDGET: float = 1.5  # seconds
+WORKER_IMPORT_BUDGET: float = 1.0
+
+
+class ImportTime:
+    module: str
+    self_time: float  # seconds
+    cumulative_time: float
+    depth: int  # nesting level, 0 for top-level imports
+
+    def __init__(self, module: str, selftime: float, cumulativetime: float, depth: int) -> None:
+        self.module = module
+        self.self_time = selftime
+        self.cumulative_time = cumulativetime
+        self.depth = depth
+
+
+def _parse_importtime_line(ln: str) -> ImportTime | None:
+    # 'import time:       123 |        456 |   sanguine.common'
+    prefix = 'import time:'
+    if not ln.startswith(prefix):
+        return None
+    fields = ln[len(prefix):].split('|')
+    if len(fields) != 3:
+        return None
+    try:
+        selfus = int(fields[0])
+        cumus = int(fields[1])
+    except ValueError:
+        return None  # header line
+    name = fields[2].rstrip()
+    stripped = name.lstrip(' ')
+    depth = (len(name) - len(stripped) - 1) // 2
+    return ImportTime(stripped, selfus / 1e6, cumus / 1e6, depth)
+
+
+def profile_imports(modules: list[str]) -> tuple[float, list[ImportTime]]:
+    # returns (total time of top-level imports, all the imports in the order they were completed)
+    rootdir = os.path.abspath(os.path.split(os.path.abspath(__file__))[0] + '/../..')
+    code = ';'.join(['import ' + m for m in modules])
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=rootdir,
+                          capture_output=True, text=True)
+    raise_if_not(proc.returncode == 0, lambda: 'profile_imports(): failed to import {}: {}'.format(
+        modules, proc.stderr[-2000:]))
+    out: list[ImportTime] = []
+    for ln in proc.stderr.splitlines():
+        it = _parse_importtime_line(ln)
+        if it is not None:
+            out.append(it)
+    total = sum(it.cumulative_time for it in out if it.depth == 0)
+    return total, out
+
+
+def log_import_profile(title: str, modules: list[str], top: int = 25) -> float:
+    total, imports = profile_imports(modules)
+    info('{}: {:.3f}s total for {}'.format(title, total, modules))
+    info('-> top {} by self time:'.format(top))
+    for it in sorted(imports, key=lambda x: -x.self_time)[:top]:
+        info('--> {}: self={:.3f}s cumulative={:.3f}s'.format(it.module, it.self_time, it.cumulative_time))
+    info('-> top {} by cumulative time:'.format(top))
+    for it in sorted(imports, key=lambda x: -x.cumulative_time)[:top]:
+        info('--> {}: cumulative={:.3f}s self={:.3f}s'.format(it.module, it.cumulative_time, it.self_time))
+    return total
+
+
+def check_import_budgets(nruns: int = 3) -> bool:
+    # first run may include compiling .pyc's, so it is not counted; best of nruns after that
+    ok = True
+    for title, modules, budget in [('master', MASTER_STARTUP_MODULES, MASTER_IMPORT_BUDGET),
+                                   ('worker', WORKER_STARTUP_MODULES, WORKER_IMPORT_BUDGET)]:
+        profile_imports(modules)
+        best = min(profile_imports(modules)[0] for _ in range(nruns))
+        if best > budget:
+            alert('Import budget exceeded for {}: {:.3f}s > {:.3f}s'.format(title, best, budget))
+            log_import_profile('Import profile for ' + title, modules)
+            ok = False
+        else:
+            info('Import budget ok for {}: {:.3f}s <= {:.3f}s'.format(title, best, budget))
+    return ok
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        sys.exit(0 if check_import_budgets() else 1)
+    log_import_profile('Import profile for master', MASTER_STARTUP_MODULES)
+    log_import_profile('Import profile for worker', WORKER_STARTUP_MODULES)
@@ -0,0 +1,131 @@
+"""
+Materializing target files. When the bytes of a target file already exist on the same filesystem,
+reflinking (copy-on-write clone, where the filesystem supports it) or hardlinking instead of copying.
+Copying is always the fallback.
+"""
+import shutil
+import sys
+
+from sanguine.common import *
+
+
+class MaterializeMethod(IntEnum):
+    Copy = 0
+    Reflink = 1
+    Hardlink = 2
+
+
+_FICLONE = 0x40049409  # Linux ioctl, supported by btrfs, XFS (with reflink=1), bcachefs, etc.
+
+
+def _try_reflink(src: str, target: str) -> bool:
+    if not sys.platform.startswith('linux'):
+        return False  # FICLONE is Linux-only; elsewhere, it is hardlinks or copying
+    import fcntl
+    try:
+        with open(src, 'rb') as rf, open(target, 'wb') as wf:
+            fcntl.ioctl(wf.fileno(), _FICLONE, rf.fileno())
+        return True
+    except OSError:
+        if os.path.isfile(target):
+            os.remove(target)
+        return False
+
+
+def _same_device(src: str, target: str) -> bool:
+    try:
+        return os.lstat(src).st_dev == os.lstat(os.path.split(target)[0]).st_dev
+    except OSError:
+        return False
+
+
+def materialize_file(src: str, target: str, allowhardlinks: bool = True) -> MaterializeMethod:
+    # NB: hardlinked target shares bytes with src, so in-place modification of either one changes both;
+    #     allowhardlinks=False where this is not acceptable
+    assert src != target
+    targetdir = os.path.split(target)[0]
+    os.makedirs(targetdir, exist_ok=True)
+    if os.path.isfile(target):
+        os.remove(target)
+    if _same_device(src, target):
+        if _try_reflink(src, target):
+            return MaterializeMethod.Reflink
+        if allowhardlinks:
+            try:
+                os.link(src, target)
+                return MaterializeMethod.Hardlink
+            except OSError:
+                pass  # e.g. FAT32, or too many links
+    shutil.copyfile(src, target)
+    return MaterializeMethod.Copy
+
+
+class Materializer:
+    # known_files: file_hash -> files with verified hash (from FolderCache, or AvailableFiles.downloaded_file_by_hash());
+    #              they're never hardlinked, as they must stay intact when target is modified.
+    # Targets produced so far are remembered too, and further targets with the same bytes are hardlinked
+    #   to them if allow_hardlinks (that's where deploying files duplicated across mods saves most,
+    #   as there is no copy-on-write cloning on NTFS)
+    _known_files: Callable[[bytes], list[FileOnDisk] | None]
+    _produced: dict[bytes, FileOnDisk]
+    allow_hardlinks: bool
+    stats: dict[MaterializeMethod, tuple[int, int]]  # method -> (nfiles, nbytes)
+
+    def __init__(self, knownfiles: Callable[[bytes], list[FileOnDisk] | None], allowhardlinks: bool = True) -> None:
+        self._known_files = knownfiles
+        self._produced = {}
+        self.allow_hardlinks = allowhardlinks
+        self.stats = {}
+
+    def from_file(self, src: str, target: str, size: int, allowhardlinks: bool | None = None) -> MaterializeMethod:
+        # allowhardlinks overrides self.allow_hardlinks, for sources which must stay intact
+        method = materialize_file(src, target, self.allow_hardlinks if allowhardlinks is None else allowhardlinks)
+        self._add_stats(method, size)
+        return method
+
+    def from_known(self, filehash: bytes, target: str) -> bool:
+        # returns False if there is no suitable known file, it is up to caller to produce target then
+        produced = self._produced.get(filehash)
+        if produced is not None and produced.file_path != target and self._is_still_valid(produced):
+            self.from_file(produced.file_path, target, produced.file_size)
+            self.add_produced(filehash, target)
+            return True
+        known = self._known_files(filehash)
+        if known is None:
+            return False
+        for f in known:
+            if f.file_path == target or not self._is_still_valid(f):
+                continue
+            self.from_file(f.file_path, target, f.file_size, allowhardlinks=False)
+            self.add_produced(filehash, target)
+            return True
+        return False
+
+    def add_produced(self, filehash: bytes, target: str) -> None:
+        # target must have been just produced with filehash bytes, by us or by somebody else (e.g. extraction)
+        if filehash in self._produced and self._is_still_valid(self._produced[filehash]):
+            return
+        try:
+            st = os.lstat(target)
+        except OSError:
+            return
+        self._produced[filehash] = FileOnDisk(filehash, st.st_mtime, target, st.st_size)
+
+    def log_stats(self) -> None:
+        for method in MaterializeMethod:
+            if method in self.stats:
+                n, nbytes = self.stats[method]
+                info('Materializer: {}: {} file(s), {:.1f}M'.format(method.name, n, nbytes / 1048576))
+
+    def _add_stats(self, method: MaterializeMethod, size: int) -> None:
+        n, nbytes = self.stats.get(method, (0, 0))
+        self.stats[method] = (n + 1, nbytes + size)
+
+    @staticmethod
+    def _is_still_valid(f: FileOnDisk) -> bool:
+        # hash was verified when the file was cached (or produced); size and mtime tell us it didn't change since
+        try:
+            st = os.lstat(f.file_path)
+        except OSError:
+            return False
+        return st.st_size == f.file_size and st.st_mtime == f.file_modified
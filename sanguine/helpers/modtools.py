@@ -44,7 +44,8 @@ def _found_mod_tool_plugin(plugin: ModToolPluginBase) -> None:
     _mod_tool_plugins.append(plugin)
 
 
-load_plugins('plugins/modtool/', ModToolPluginBase, lambda plugin: _found_mod_tool_plugin(plugin))
+load_plugins('plugins/modtool/', ModToolPluginBase, lambda plugin: _found_mod_tool_plugin(plugin),
+             ['name', 'supported_games'])
 
 
 def all_mod_tool_plugins(gameuniverse: str) -> list[ModToolPluginBase]:
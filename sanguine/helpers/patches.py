@@ -30,7 +30,8 @@ def _found_patch_plugin(plugin: PatchPluginBase) -> None:
         _patch_plugins_per_ext[ext].append(plugin)
 
 
-load_plugins('plugins/patch/', PatchPluginBase, lambda plugin: _found_patch_plugin(plugin))
+load_plugins('plugins/patch/', PatchPluginBase, lambda plugin: _found_patch_plugin(plugin),
+             ['name', 'extensions'])
 
 
 def patch_plugins_for(path: str) -> list[PatchPluginBase] | None:
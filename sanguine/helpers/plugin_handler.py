@@ -1,25 +1,141 @@
 import glob
+import hashlib
 import importlib
 import inspect
+import sys
+import tempfile
+import time
 
 from sanguine.common import *
 
+### manifest: per plugin dir, allows to register plugins without importing them
+# _manifest.json: {'version': 1, 'modules': [{'module': str, 'sha256': str,
+#                                            'plugins': [{'class': str, 'manifest': {method: value}}]}]}
+# manifest methods are argument-less methods returning JSON-able constants (name(), extensions(), ...),
+#   which registries call right when plugin is found; everything else imports plugin module on first use.
+# _manifest.json in plugin dir is committed, and is NEVER written at runtime (package dir may be read-only,
+#   e.g. in frozen bundles); if it doesn't match plugin sources, it is a cache miss: plugins are imported as before,
+#   and the refreshed manifest goes to per-user cache dir, see _cached_manifest_path().
+# To re-generate committed manifests after changing plugins: python -m sanguine.helpers.plugin_handler regenerate
 
-def load_plugins(plugindir: str, basecls: Any, found: Callable[[Any], None]) -> None:
+_MANIFEST_FNAME = '_manifest.json'
+_MANIFEST_VERSION = 1
+
+_registered_plugin_dirs: list[tuple[str, Any, list[str]]] = []  # (plugindir, basecls, manifestmethods)
+
+
+class _LazyPlugin:
+    _lazy_module: str
+    _lazy_class: str
+    _lazy_manifest: dict[str, Any]
+    _lazy_plugin: Any
+
+    def __init__(self, modulename: str, clsname: str, manifest: dict[str, Any], plugin: Any = None) -> None:
+        self._lazy_module = modulename
+        self._lazy_class = clsname
+        self._lazy_manifest = manifest
+        self._lazy_plugin = plugin
+
+    def __getattr__(self, name: str) -> Any:  # only called for attributes not found in the usual way
+        if name.startswith('_lazy_'):
+            raise AttributeError(name)  # e.g. during unpickling, before __init__()
+        if self._lazy_plugin is None and name in self._lazy_manifest:
+            val = self._lazy_manifest[name]
+            return lambda: val
+        return getattr(self._lazy_real_plugin(), name)
+
+    def __reduce__(self) -> tuple:
+        return _LazyPlugin, (self._lazy_module, self._lazy_class, self._lazy_manifest, self._lazy_plugin)
+
+    def __repr__(self) -> str:
+        return '_LazyPlugin({}.{}{})'.format(self._lazy_module, self._lazy_class,
+                                             '' if self._lazy_plugin is not None else ', not loaded yet')
+
+    def _lazy_real_plugin(self) -> Any:
+        if self._lazy_plugin is None:
+            t0 = time.perf_counter()
+            module = importlib.import_module(self._lazy_module)
+            self._lazy_plugin = getattr(module, self._lazy_class)()
+            debug('plugin_handler: lazily loaded {}.{} in {:.3f}s', self._lazy_module, self._lazy_class,
+                  time.perf_counter() - t0)
+        return self._lazy_plugin
+
+
+def _module_sha256(py: str) -> str:
+    with open(py, 'rb') as rf:
+        return hashlib.sha256(rf.read().replace(b'\r\n', b'\n')).hexdigest()  # git may convert line endings
+
+
+def _read_manifest(manifestpath: str) -> list[dict[str, Any]] | None:
+    try:
+        with open(manifestpath, 'rt', encoding='utf-8') as rf:
+            manifest = json.load(rf)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != _MANIFEST_VERSION:
+        return None
+    return manifest.get('modules')
+
+
+def _is_manifest_up_to_date(modules: list[dict[str, Any]], pys: dict[str, str],
+                            manifestmethods: list[str]) -> bool:
+    if [m['module'] for m in modules] != list(pys.keys()):
+        return False
+    for m in modules:
+        if m['sha256'] != _module_sha256(pys[m['module']]):
+            return False
+        for p in m['plugins']:
+            if sorted(p['manifest'].keys()) != sorted(manifestmethods):
+                return False
+    return True
+
+
+def _write_manifest(manifestpath: str, modules: list[dict[str, Any]]) -> None:
+    try:
+        os.makedirs(os.path.split(manifestpath)[0], exist_ok=True)
+        tmppath = manifestpath + '.tmp'
+        with open(tmppath, 'wt', encoding='utf-8') as wf:
+            json.dump({'version': _MANIFEST_VERSION, 'modules': modules}, wf, indent=1)
+            wf.write('\n')
+        os.replace(tmppath, manifestpath)
+    except OSError as e:
+        warn('plugin_handler: cannot write {}: {}, plugins will be loaded eagerly next time too'.format(
+            manifestpath, e))
+
+
+### load_plugins()
+
+def _plugin_dir_path(plugindir: str) -> str:
     # plugindir is relative to the path of this very file
-    thisdir = os.path.split(os.path.abspath(__file__))[0] + '\\..\\'
-    # print(thisdir)
-    sortedpys = sorted([py for py in glob.glob(thisdir + plugindir + '*.py')])
+    return os.path.split(os.path.abspath(__file__))[0] + '\\..\\' + plugindir
+
+
+def _cached_manifest_path(plugindir: str) -> str:
+    cachedir = os.environ.get('LOCALAPPDATA') or tempfile.gettempdir()
+    return cachedir + '\\sanguine\\plugin-manifests\\' + plugindir.replace('/', '.') + _MANIFEST_FNAME
+
+
+def _plugin_modules(plugindir: str) -> dict[str, str]:  # module name -> .py path, sorted by module name
+    sortedpys = sorted([py for py in glob.glob(_plugin_dir_path(plugindir) + '*.py')])
+    out: dict[str, str] = {}
     for py in sortedpys:
         # print(py)
         modulename = os.path.splitext(os.path.split(py)[1])[0]
         if modulename == '__init__' or modulename.startswith('_'):
             continue
+        out['sanguine.' + plugindir.replace('/', '.') + modulename] = py
+    return out
+
+
+def _load_plugins_eagerly(pys: dict[str, str], basecls: Any, found: Callable[[Any], None],
+                          manifestmethods: list[str]) -> list[dict[str, Any]]:
+    modules: list[dict[str, Any]] = []
+    for modulename, py in pys.items():
         # print(modulename)
-        module = importlib.import_module('sanguine.' + plugindir.replace('/', '.') + modulename)
-        ok = False
+        module = importlib.import_module(modulename)
+        plugins: list[dict[str, Any]] = []
         for name, obj in inspect.getmembers(module):
-            if inspect.isclass(obj):
+            if inspect.isclass(obj) and obj.__module__ == module.__name__:  # not the ones imported from elsewhere
                 cls = obj
                 mro = inspect.getmro(cls)
                 if len(mro) >= 2:
@@ -27,6 +143,60 @@ def load_plugins(plugindir: str, basecls: Any, found: Callable[[Any], None]) ->
                     if parent is basecls:
                         plugin = cls()
                         found(plugin)
-                        ok = True
-        if not ok:
+                        plugins.append({'class': name,
+                                        'manifest': {mm: getattr(plugin, mm)() for mm in manifestmethods}})
+        if len(plugins) == 0:
             warn('no class derived from ' + str(basecls) + ' found in ' + py)
+        modules.append({'module': modulename, 'sha256': _module_sha256(py), 'plugins': plugins})
+    return modules
+
+
+def load_plugins(plugindir: str, basecls: Any, found: Callable[[Any], None],
+                 manifestmethods: list[str] | None = None) -> None:
+    # if manifestmethods is not None, found() may get a lazy stand-in for the plugin, see _LazyPlugin;
+    #   found() itself is allowed to call only manifestmethods without importing plugin module
+    pys = _plugin_modules(plugindir)
+    if manifestmethods is None:
+        _load_plugins_eagerly(pys, basecls, found, [])
+        return
+
+    _registered_plugin_dirs.append((plugindir, basecls, manifestmethods))
+    t0 = time.perf_counter()
+    for manifestpath in (_plugin_dir_path(plugindir) + _MANIFEST_FNAME, _cached_manifest_path(plugindir)):
+        modules = _read_manifest(manifestpath)
+        if modules is not None and _is_manifest_up_to_date(modules, pys, manifestmethods):
+            n = 0
+            for m in modules:
+                for p in m['plugins']:
+                    found(_LazyPlugin(m['module'], p['class'], p['manifest']))
+                    n += 1
+            debug('plugin_handler: {} plugin(s) from {} registered lazily via {} in {:.3f}s', n, plugindir,
+                  manifestpath, time.perf_counter() - t0)
+            return
+
+    cachedpath = _cached_manifest_path(plugindir)
+    info('plugin_handler: manifest for {} is missing or outdated, loading plugins and caching it as {}'.format(
+        plugindir, cachedpath))
+    modules = _load_plugins_eagerly(pys, basecls, found, manifestmethods)
+    _write_manifest(cachedpath, modules)
+
+
+def regenerate_committed_manifests() -> None:
+    # explicit dev step, NOT to be called at runtime; covers plugin dirs whose registries are already imported
+    for plugindir, basecls, manifestmethods in _registered_plugin_dirs:
+        modules = _load_plugins_eagerly(_plugin_modules(plugindir), basecls, lambda _: None, manifestmethods)
+        manifestpath = _plugin_dir_path(plugindir) + _MANIFEST_FNAME
+        _write_manifest(manifestpath, modules)
+        info('plugin_handler: re-generated {}'.format(manifestpath))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] != 'regenerate':
+        alert('usage: python -m sanguine.helpers.plugin_handler regenerate')
+        sys.exit(1)
+    for registry in ('sanguine.helpers.archives', 'sanguine.helpers.arinstallers', 'sanguine.helpers.patches',
+                     'sanguine.helpers.modtools', 'sanguine.helpers.globaltools', 'sanguine.helpers.project_config',
+                     'sanguine.gitdata.file_origin'):
+        importlib.import_module(registry)
+    # running as __main__, this module is a separate copy from the one registries have used
+    importlib.import_module('sanguine.helpers.plugin_handler').regenerate_committed_manifests()
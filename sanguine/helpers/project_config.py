@@ -88,6 +88,9 @@ class ModManagerConfig:
     def resolve_vfs(self, sourcevfs: Iterable[FileOnDisk]) -> ResolvedVFS:
         pass
 
+    def resolve_vfs_params(self) -> Any:  # JSON-able; everything resolve_vfs() depends on, except for file paths
+        return None  # None means that resolve_vfs() results are not cacheable
+
     @abstractmethod
     def parse_source_vfs(self, path: str) -> ModFile:
         pass
@@ -118,7 +121,8 @@ def _found_plugin(plugin: ModManagerPluginBase):
     _modmanager_plugins.append(plugin)
 
 
-load_plugins('plugins/modmanager/', ModManagerPluginBase, lambda plugin: _found_plugin(plugin))
+load_plugins('plugins/modmanager/', ModManagerPluginBase, lambda plugin: _found_plugin(plugin),
+             ['mod_manager_name'])
 
 
 def _find_config(name: str) -> ModManagerConfig | None:
@@ -247,6 +251,7 @@ class LocalProjectConfig:
     download_dirs: list[str]
     cache_dir: str
     tmp_dir: str
+    extracted_cache_max_bytes: int  # 0 if extracted blob cache is disabled
     github_root_dir: str
     all_modpack_configs: dict[str, GithubModpackConfig]
     this_modpack: str
@@ -259,8 +264,8 @@ class LocalProjectConfig:
         with (open_3rdparty_txt_file_autodetect(jsonconfigfname) as f):
             jsonconfig = json5.loads(f.read())
             unused_config_warning(jsonconfigfname, jsonconfig,
-                                  ['modmanager', 'downloads', 'cache', 'tmp', 'githubroot', 'modpack',
-                                   'githubusername'] + _all_config_names())
+                                  ['modmanager', 'downloads', 'cache', 'tmp', 'extractedcachemb', 'githubroot',
+                                   'modpack', 'githubusername'] + _all_config_names())
 
             raise_if_not('modmanager' in jsonconfig, "'modmanager' must be present in config")
             modmanager = jsonconfig['modmanager']
@@ -296,6 +301,11 @@ class LocalProjectConfig:
             self.tmp_dir = config_dir_path(jsonconfig.get('tmp', self.config_dir + '.\\sanguine.tmp\\'),
                                            self.config_dir,
                                            jsonconfig)
+            extractedcachemb = jsonconfig.get('extractedcachemb', 0)
+            raise_if_not(isinstance(extractedcachemb, int) and extractedcachemb >= 0,
+                         lambda: "'extractedcachemb' in config must be a non-negative integer, got " + repr(
+                             extractedcachemb))
+            self.extracted_cache_max_bytes = extractedcachemb * 1048576
 
             self.github_root_dir = config_dir_path(jsonconfig.get('githubroot', '.\\'), self.config_dir,
                                                    jsonconfig)
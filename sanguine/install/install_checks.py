@@ -9,9 +9,9 @@ import sys
 #                    2. may use only those sanguine modules which are specifically designated as install-friendly
 from sanguine.install.install_common import *
 
-REQUIRED_PIP_MODULES = ['json5', 'bethesda-structs', 'pywin32', 'certifi', 'pyinstaller', 'chardet']
+REQUIRED_PIP_MODULES = ['json5', 'bethesda-structs', 'pywin32', 'certifi', 'pyinstaller', 'chardet', 'lz4']
 PIP2PYTHON_MODULE_NAME_REMAPPING = {'bethesda-structs': 'bethesda_structs', 'pywin32': ['win32api', 'win32file'],
-                                    'pyinstaller': []}
+                                    'pyinstaller': [], 'lz4': 'lz4.frame'}
 
 
 def _is_module_installed(module: str) -> bool:
@@ -1,7 +1,11 @@
+import json
 import logging
+import os
 # import logging.handlers
+import sys
 import time
 from collections.abc import Callable
+from typing import Any, TextIO
 
 
 def _sanguine_patch_record(record: logging.LogRecord) -> None:
@@ -115,7 +119,7 @@ _console_handler.setFormatter(_SanguineFormatter())
 
 _logger.addHandler(_console_handler)
 
-_logger_file_handler: logging.StreamHandler | None = None
+_logger_file_handler: logging.Handler | None = None
 
 _started: float = time.perf_counter()
 
@@ -136,19 +140,88 @@ class _HtmlFileHandler(logging.FileHandler):
         self.stream.write('<div class="info">[STARTING LOGGING]: {}</div>\n'.format(time.asctime()))
 
 
+_JSONL_LOG_BUFFER_SIZE: int = 1048576
+_JSONL_LOG_ROTATE_BYTES: int = 64 * 1048576
+_JSONL_LOG_ROTATE_BACKUPS: int = 3
+
+
+class _JsonLinesFileHandler(logging.Handler):
+    # one JSON list per line: [levelno, from_start, prefix, msg, pathname, lineno]
+    # compared to _HtmlFileHandler: no per-record formatting or flushing (only for WARNING and above),
+    #   and size-based rotation to fpath.1, fpath.2, ...
+    # log_file_to_html() converts it to the same HTML as _HtmlFileHandler produces
+    _fpath: str
+    _stream: TextIO
+    _written: int
+
+    def __init__(self, fpath: str) -> None:
+        super().__init__()
+        self._fpath = fpath
+        self._open('w')
+
+    def _open(self, mode: str) -> None:
+        self._stream = open(self._fpath, mode, encoding='utf-8', buffering=_JSONL_LOG_BUFFER_SIZE)
+        self._written = 0
+
+    def _rotate(self) -> None:
+        self._stream.close()
+        try:
+            for i in range(_JSONL_LOG_ROTATE_BACKUPS - 1, 0, -1):
+                src = '{}.{}'.format(self._fpath, i)
+                if os.path.isfile(src):
+                    os.replace(src, '{}.{}'.format(self._fpath, i + 1))
+            os.replace(self._fpath, self._fpath + '.1')
+            mode = 'w'
+        except OSError:  # e.g. one of the files is opened in a viewer (Windows); keep writing to the same file
+            mode = 'a'
+        self._open(mode)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            _sanguine_patch_record(record)
+            line = json.dumps([record.levelno, round(record.sanguine_from_start, 3), record.sanguine_prefix,
+                               record.getMessage(), record.pathname, record.lineno], ensure_ascii=False) + '\n'
+            self._stream.write(line)
+            self._written += len(line)  # in characters, but it is only for rotation, so precision doesn't matter
+            if record.levelno >= logging.WARNING:
+                self._stream.flush()
+            if self._written >= _JSONL_LOG_ROTATE_BYTES:
+                self._rotate()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        if not self._stream.closed:
+            self._stream.flush()
+
+    def close(self) -> None:
+        if not self._stream.closed:
+            self._stream.close()
+        super().close()
+
+
+def _is_jsonl_log(fpath: str) -> bool:
+    return fpath.endswith('.jsonl')
+
+
 _ex_logging: bool = False
 
 
 def add_file_logging(fpath: str) -> None:
+    # backend depends on file extension: .jsonl for compact buffered rotating log, anything else for HTML
     global _logger, _logger_file_handler
     assert _logger_file_handler is None
     try:
-        _logger_file_handler = _HtmlFileHandler(fpath)
-        _logger_file_handler.setLevel(logging.DEBUG if __debug__ else logging.INFO)
-        _logger_file_handler.setFormatter(_SanguineHtmlFileFormatter())
-        if _ex_logging:
-            assert isinstance(_logger_file_handler.formatter, _SanguineHtmlFileFormatter)
-            _logger_file_handler.formatter.enable_ex_logging()
+        if _is_jsonl_log(fpath):
+            _logger_file_handler = _JsonLinesFileHandler(fpath)
+            _logger_file_handler.setLevel(logging.DEBUG if __debug__ else logging.INFO)
+        else:
+            _logger_file_handler = _HtmlFileHandler(fpath)
+            _logger_file_handler.setLevel(logging.DEBUG if __debug__ else logging.INFO)
+            _logger_file_handler.setFormatter(_SanguineHtmlFileFormatter())
+            if _ex_logging:
+                assert isinstance(_logger_file_handler.formatter, _SanguineHtmlFileFormatter)
+                _logger_file_handler.formatter.enable_ex_logging()
         _logger.addHandler(_logger_file_handler)
     except OSError as e:
         alert('Exception {} while trying to enable file logging, will continue without file logging'.format(e))
@@ -159,21 +232,82 @@ def enable_ex_logging() -> None:
     global _console_handler, _logger_file_handler, _ex_logging
     assert isinstance(_console_handler.formatter, _SanguineFormatter)
     _console_handler.formatter.enable_ex_logging()
-    if _logger_file_handler is not None:
+    if _logger_file_handler is not None and not isinstance(_logger_file_handler, _JsonLinesFileHandler):
         assert isinstance(_logger_file_handler.formatter, _SanguineHtmlFileFormatter)
         _logger_file_handler.formatter.enable_ex_logging()
     _ex_logging = True
 
 
+def log_file_to_html(jsonlpath: str, htmlpath: str, ex: bool = True) -> int:
+    # offline converter for _JsonLinesFileHandler logs, including rotated ones; returns number of records
+    fpaths = ['{}.{}'.format(jsonlpath, i) for i in range(_JSONL_LOG_ROTATE_BACKUPS, 0, -1)] + [jsonlpath]
+    handler = _HtmlFileHandler(htmlpath)
+    formatter = _SanguineHtmlFileFormatter()
+    if ex:
+        formatter.enable_ex_logging()
+    handler.setFormatter(formatter)
+    n = 0
+    try:
+        for fpath in fpaths:
+            if not os.path.isfile(fpath):
+                continue
+            with open(fpath, 'r', encoding='utf-8') as rf:
+                for line in rf:
+                    if not line.strip():
+                        continue
+                    levelno, fromstart, prefix, msg, pathname, lineno = json.loads(line)
+                    rec = logging.makeLogRecord({'levelno': levelno, 'levelname': logging.getLevelName(levelno),
+                                                 'msg': msg, 'pathname': pathname,
+                                                 'filename': os.path.basename(pathname), 'lineno': lineno,
+                                                 'sanguine_when': fromstart + logging_started(),
+                                                 'sanguine_prefix': prefix})
+                    handler.emit(rec)
+                    n += 1
+    finally:
+        handler.close()
+    return n
+
+
 def add_logging_handler(handler: logging.StreamHandler) -> None:
     global _logger
     _logger.addHandler(handler)
 
 
-_logging_hook: Callable[[logging.LogRecord], None] | None = None
+def remove_inherited_logging_handlers() -> None:
+    # for child processes: forked ones inherit master's console and file handlers (including buffered
+    #   _JsonLinesFileHandler), and all the logging from children must go via master anyway.
+    #   Handlers are NOT flushed or closed here, as it would write master's buffered records from the child
+    global _logger, _logger_file_handler
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+    _logger_file_handler = None
+
+
+### call sites
+
+LogCallSite = tuple[str, int, str]  # (filename, lineno, funcname), same as Logger.findCaller() returns
+
+_call_sites: dict[tuple[Any, int], LogCallSite] = {}  # (code, lasti) -> call site
+
 
+def log_call_site(stacklevel: int) -> LogCallSite:
+    # cheap replacement for Logger.findCaller(): no stack walk, and line number is resolved once per call site
+    f = sys._getframe(stacklevel + 1)
+    key = (f.f_code, f.f_lasti)
+    site = _call_sites.get(key)
+    if site is None:
+        site = (f.f_code.co_filename, f.f_lineno, f.f_code.co_name)
+        _call_sites[key] = site
+    return site
 
-def set_logging_hook(newhook: Callable[[logging.LogRecord], None] | None) -> Callable[[logging.LogRecord], None] | None:
+
+# hook(levelno, msg, args, site); if args is non-empty, message is msg.format(*args)
+LoggingHook = Callable[[int, str, tuple, LogCallSite], None]
+
+_logging_hook: LoggingHook | None = None
+
+
+def set_logging_hook(newhook: LoggingHook | None) -> LoggingHook | None:
     global _logging_hook
     oldhook = _logging_hook
     _logging_hook = newhook
@@ -195,20 +329,22 @@ def log_record_skip_console(record: logging.LogRecord) -> None:
     _logger_file_handler.emit(record)
 
 
-def _make_log_record(level, msg: str) -> logging.LogRecord:
+def make_log_record(level, msg: str) -> logging.LogRecord:
     global _logger
-    fn, lno, func, sinfo = _logger.findCaller(False, stacklevel=3)
-    rec = _logger.makeRecord(_logger.name, level, fn, lno, msg, (), None, func, None, sinfo)
+    fn, lno, func = log_call_site(1)
+    rec = _logger.makeRecord(_logger.name, level, fn, lno, msg, (), None, func, None, None)
     rec.sanguine_when = time.perf_counter()
     rec.sanguine_prefix = ''
     return rec
 
 
-def make_log_record(level, msg: str) -> logging.LogRecord:  # different stacklevel than _make_log_record
+def make_log_record_from_site(level, msg: str, args: tuple, site: LogCallSite, when: float) -> logging.LogRecord:
     global _logger
-    fn, lno, func, sinfo = _logger.findCaller(False, stacklevel=2)
-    rec = _logger.makeRecord(_logger.name, level, fn, lno, msg, (), None, func, None, sinfo)
-    rec.sanguine_when = time.perf_counter()
+    if args:
+        msg = msg.format(*args)
+    fn, lno, func = site
+    rec = _logger.makeRecord(_logger.name, level, fn, lno, msg, (), None, func, None, None)
+    rec.sanguine_when = when
     rec.sanguine_prefix = ''
     return rec
 
@@ -223,46 +359,57 @@ def log_with_level(level: int, msg: str) -> None:
         return
     global _logging_hook
     if _logging_hook is not None:
-        _logging_hook(_make_log_record(level, msg))
+        _logging_hook(level, msg, (), log_call_site(1))
         return
     global _logger
     _logger.log(level, msg, stacklevel=2)
 
 
-def debug(msg: str) -> None:
+# debug(), info(), and perf_warn() can be called either with a ready-to-use msg, or with a format string and args,
+#   as in debug('done task {}', name). In the latter case, level is checked before any work, and the string
+#   is formatted only if the message is going to be emitted; when logging via hook, formatting happens
+#   in the logging thread, and not in the caller's (often hot) loop
+
+def debug(msg: str, *args) -> None:
     if not __debug__:
         return
+    global _logger
+    if not _logger.isEnabledFor(logging.DEBUG):
+        return
     global _logging_hook
     if _logging_hook is not None:
-        _logging_hook(_make_log_record(logging.DEBUG, msg))
+        _logging_hook(logging.DEBUG, msg, args, log_call_site(1))
         return
-    global _logger
-    _logger.debug(msg, stacklevel=2)
+    _logger.debug(msg.format(*args) if args else msg, stacklevel=2)
 
 
-def info(msg: str) -> None:
+def info(msg: str, *args) -> None:
     global _logger
+    if not _logger.isEnabledFor(logging.INFO):
+        return
     global _logging_hook
     if _logging_hook is not None:
-        _logging_hook(_make_log_record(logging.INFO, msg))
+        _logging_hook(logging.INFO, msg, args, log_call_site(1))
         return
-    _logger.info(msg, stacklevel=2)
+    _logger.info(msg.format(*args) if args else msg, stacklevel=2)
 
 
-def perf_warn(msg: str) -> None:
+def perf_warn(msg: str, *args) -> None:
     global _logger
+    if not _logger.isEnabledFor(_PERFWARN_LEVEL_NUM):
+        return
     global _logging_hook
     if _logging_hook is not None:
-        _logging_hook(_make_log_record(_PERFWARN_LEVEL_NUM, msg))
+        _logging_hook(_PERFWARN_LEVEL_NUM, msg, args, log_call_site(1))
         return
     # noinspection PyUnresolvedReferences
-    _logger.perf_warn(msg, stacklevel=2)
+    _logger.perf_warn(msg.format(*args) if args else msg, stacklevel=2)
 
 
 def warn(msg: str) -> None:
     global _logging_hook
     if _logging_hook is not None:
-        _logging_hook(_make_log_record(logging.WARN, msg))
+        _logging_hook(logging.WARN, msg, (), log_call_site(1))
         return
     global _logger
     _logger.warning(msg, stacklevel=2)
@@ -271,7 +418,7 @@ def warn(msg: str) -> None:
 def alert(msg: str) -> None:
     global _logging_hook
     if _logging_hook is not None:
-        _logging_hook(_make_log_record(logging.ERROR, msg))
+        _logging_hook(logging.ERROR, msg, (), log_call_site(1))
         return
     global _logger
     _logger.error(msg, stacklevel=2)
@@ -280,14 +427,22 @@ def alert(msg: str) -> None:
 def critical(msg: str) -> None:
     global _logging_hook
     if _logging_hook is not None:
-        _logging_hook(_make_log_record(logging.CRITICAL, msg))
+        _logging_hook(logging.CRITICAL, msg, (), log_call_site(1))
         return
     global _logger
     _logger.critical(msg, stacklevel=2)
 
 
-def info_or_perf_warn(pwarn: bool, msg: str) -> None:
+def info_or_perf_warn(pwarn: bool, msg: str, *args) -> None:
     if pwarn:
-        perf_warn(msg)
+        perf_warn(msg, *args)
+    else:
+        info(msg, *args)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'tohtml':
+        nrec = log_file_to_html(sys.argv[2], sys.argv[3])
+        print('{} record(s) converted'.format(nrec))
     else:
-        info(msg)
+        print('usage: {} tohtml <sanguine.log.jsonl> <sanguine.log.html>'.format(sys.argv[0]))
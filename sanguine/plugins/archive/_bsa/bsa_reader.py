@@ -0,0 +1,204 @@
+"""
+Indexed reader for BSA archives (Oblivion: v103; FO3/FNV/Skyrim LE: v104; Skyrim SE: v105). Only directory and file
+records are parsed into BsaIndex, members are then read by seeking to them, so that extracting one member
+from a multi-GB BSA costs the same as extracting it from a small one.
+"""
+import hashlib
+import struct
+import zlib
+
+from sanguine.common import *
+
+_BSA_MAGIC = b'BSA\x00'
+_BSA_SUPPORTED_VERSIONS = (103, 104, 105)
+_BSA_HEADER = struct.Struct('<4sIIIIIIIHH')
+_BSA_FOLDER_RECORD = struct.Struct('<QII')
+_BSA_FOLDER_RECORD_105 = struct.Struct('<QIIQ')
+_BSA_FILE_RECORD = struct.Struct('<QII')
+
+_ARCHIVE_FLAG_DIR_NAMES = 0x1
+_ARCHIVE_FLAG_FILE_NAMES = 0x2
+_ARCHIVE_FLAG_COMPRESSED = 0x4
+_ARCHIVE_FLAG_EMBEDDED_NAMES = 0x100  # meaningful only for v104+
+_FILE_SIZE_COMPRESSION_TOGGLE = 0x40000000
+_FILE_SIZE_MASK = 0x3FFFFFFF
+
+_BSA_BLOCK_SIZE = 1048576
+
+
+class BsaFileEntry:
+    intra_path: str  # lowercased, '\\'-separated, same as FileInArchive.intra_path
+    offset: int
+    stored_size: int  # including embedded name and original size, if any
+    compressed: bool
+
+    def __init__(self, intra_path: str, offset: int, stored_size: int, compressed: bool) -> None:
+        self.intra_path = intra_path
+        self.offset = offset
+        self.stored_size = stored_size
+        self.compressed = compressed
+
+
+class BsaIndex:
+    # doesn't store archive path, as the same index (cached by archive hash) is good for any copy of the archive
+    version: int
+    embedded_names: bool
+    files: list[BsaFileEntry]  # sorted by offset
+    by_intra_path: dict[str, BsaFileEntry]
+
+    def __init__(self, version: int, embeddednames: bool, files: list[BsaFileEntry]) -> None:
+        self.version = version
+        self.embedded_names = embeddednames
+        self.files = sorted(files, key=lambda e: e.offset)
+        self.by_intra_path = {e.intra_path: e for e in self.files}
+
+    def extract(self, archive: str, listoffiles: list[str], targetpath: str) -> list[str | None]:
+        entries: list[BsaFileEntry] = []
+        for f in listoffiles:
+            e = self.by_intra_path.get(f.lower())
+            if e is None:
+                warn('{} NOT FOUND in {}'.format(f, archive))
+            else:
+                entries.append(e)
+        extracted = {e.intra_path for e, _, _ in self._extract_entries(archive, entries, targetpath, False)}
+        return [targetpath + f.lower() if f.lower() in extracted else None for f in listoffiles]
+
+    def extract_all(self, archive: str, targetpath: str) -> None:
+        self._extract_entries(archive, self.files, targetpath, False)
+
+    def extract_all_and_hash(self, archive: str, targetpath: str) -> dict[str, tuple[int, bytes]]:
+        return {os.path.normcase(targetpath + e.intra_path): (fsize, h) for e, fsize, h in
+                self._extract_entries(archive, self.files, targetpath, True)}
+
+    def hash_all(self, archive: str) -> list[tuple[str, int, bytes]]:  # [(intra_path, size, sha256)], nothing written
+        out = []
+        with open(archive, 'rb') as rf:
+            for e in self.files:
+                h = hashlib.sha256()
+                fsize = 0
+                for bb in self._member_chunks(rf, e):
+                    h.update(bb)
+                    fsize += len(bb)
+                out.append((e.intra_path, fsize, h.digest()))
+        return out
+
+    def _extract_entries(self, archive: str, entries: list[BsaFileEntry], targetpath: str,
+                         hashing: bool) -> list[tuple[BsaFileEntry, int, bytes | None]]:
+        out = []
+        with open(archive, 'rb') as rf:
+            for e in sorted(entries, key=lambda x: x.offset):  # reading archive sequentially
+                fpath = targetpath + e.intra_path
+                os.makedirs(os.path.split(fpath)[0], exist_ok=True)
+                h = hashlib.sha256() if hashing else None
+                fsize = 0
+                with open(fpath, 'wb') as wf:
+                    for bb in self._member_chunks(rf, e):
+                        wf.write(bb)
+                        if h is not None:
+                            h.update(bb)
+                        fsize += len(bb)
+                out.append((e, fsize, h.digest() if h is not None else None))
+        return out
+
+    def _member_chunks(self, rf, e: BsaFileEntry) -> Iterable[bytes]:
+        rf.seek(e.offset)
+        remaining = e.stored_size
+        if self.embedded_names:
+            n = rf.read(1)[0]
+            rf.seek(n, 1)
+            remaining -= n + 1
+        if not e.compressed:
+            while remaining > 0:
+                bb = rf.read(min(remaining, _BSA_BLOCK_SIZE))
+                raise_if_not(len(bb) > 0, lambda: 'BSA: unexpected EOF while reading {}'.format(e.intra_path))
+                remaining -= len(bb)
+                yield bb
+            return
+
+        (origsize,) = struct.unpack('<I', rf.read(4))
+        remaining -= 4
+        if self.version >= 105:
+            try:
+                import lz4.frame  # in REQUIRED_PIP_MODULES, but BSA reader may be reached without install checks
+            except ImportError:
+                alert('BSA: lz4 is required for v{} BSAs, please run sanguine-install-dependencies.py'.format(
+                    self.version))
+                raise
+            decompressor = lz4.frame.LZ4FrameDecompressor()
+        else:
+            decompressor = zlib.decompressobj()
+        nout = 0
+        while remaining > 0:
+            bb = rf.read(min(remaining, _BSA_BLOCK_SIZE))
+            raise_if_not(len(bb) > 0, lambda: 'BSA: unexpected EOF while reading {}'.format(e.intra_path))
+            remaining -= len(bb)
+            out = decompressor.decompress(bb)
+            nout += len(out)
+            if out:
+                yield out
+        if self.version < 105:
+            out = decompressor.flush()
+            nout += len(out)
+            if out:
+                yield out
+        raise_if_not(nout == origsize, lambda: 'BSA: size mismatch for {}: {} != {}'.format(
+            e.intra_path, nout, origsize))
+
+
+def read_bsa_index(archive: str) -> BsaIndex | None:  # None if this BSA flavor is not supported
+    with open(archive, 'rb') as rf:
+        hdr = rf.read(_BSA_HEADER.size)
+        if len(hdr) < _BSA_HEADER.size:
+            return None
+        (magic, version, folderoffset, flags, nfolders, nfiles, _, totalfilenamelen, _,
+         _) = _BSA_HEADER.unpack(hdr)
+        if magic != _BSA_MAGIC or version not in _BSA_SUPPORTED_VERSIONS:
+            return None
+        if (flags & _ARCHIVE_FLAG_DIR_NAMES) == 0 or (flags & _ARCHIVE_FLAG_FILE_NAMES) == 0:
+            return None  # cannot match members by name
+
+        rf.seek(folderoffset)
+        folderrec = _BSA_FOLDER_RECORD_105 if version >= 105 else _BSA_FOLDER_RECORD
+        counts = [folderrec.unpack(rf.read(folderrec.size))[1] for _ in range(nfolders)]
+
+        # file record blocks follow folder records, in the same order
+        records: list[tuple[str, int, int]] = []  # (folder, size, offset)
+        for count in counts:
+            namelen = rf.read(1)[0]
+            folder = rf.read(namelen).rstrip(b'\x00').decode('cp1252').lower()
+            for _ in range(count):
+                _, size, offset = _BSA_FILE_RECORD.unpack(rf.read(_BSA_FILE_RECORD.size))
+                records.append((folder, size, offset))
+        raise_if_not(len(records) == nfiles, lambda: 'BSA: {} file records in {}, {} expected'.format(
+            len(records), archive, nfiles))
+
+        names = rf.read(totalfilenamelen).split(b'\x00')
+        raise_if_not(len(names) >= nfiles, lambda: 'BSA: not enough file names in {}'.format(archive))
+
+    defaultcompressed = (flags & _ARCHIVE_FLAG_COMPRESSED) != 0
+    files: list[BsaFileEntry] = []
+    for (folder, size, offset), name in zip(records, names):
+        fname = name.decode('cp1252').lower()
+        intra = fname if folder in ('', '.') else folder + '\\' + fname
+        compressed = defaultcompressed != ((size & _FILE_SIZE_COMPRESSION_TOGGLE) != 0)
+        files.append(BsaFileEntry(intra, offset, size & _FILE_SIZE_MASK, compressed))
+    return BsaIndex(version, version >= 104 and (flags & _ARCHIVE_FLAG_EMBEDDED_NAMES) != 0, files)
+
+
+### per-process cache of BsaIndexes
+
+_bsa_indexes: dict[bytes | tuple[str, int, float], BsaIndex | None] = {}
+
+
+def bsa_index(archive: str, arhash: bytes | None = None) -> BsaIndex | None:
+    # cached by archive hash when caller knows it, otherwise by (path, size, mtime)
+    if arhash is not None:
+        key = arhash
+    else:
+        st = os.stat(archive)
+        key = (os.path.abspath(archive), st.st_size, st.st_mtime)
+    if key in _bsa_indexes:
+        return _bsa_indexes[key]
+    out = read_bsa_index(archive)
+    _bsa_indexes[key] = out
+    return out
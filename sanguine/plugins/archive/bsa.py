@@ -1,7 +1,6 @@
-from bethesda_structs.archive import BSAArchive
-
 from sanguine.common import *
 from sanguine.helpers.archives import ArchivePluginBase
+from sanguine.plugins.archive._bsa.bsa_reader import bsa_index
 
 
 class BsaArchivePlugin(ArchivePluginBase):
@@ -9,18 +8,55 @@ class BsaArchivePlugin(ArchivePluginBase):
         return ['.bsa']
 
     def extract(self, archive: str, listoffiles: list[str], targetpath: str) -> list[str | None]:
+        return self._extract(archive, None, listoffiles, targetpath)
+
+    def extract_with_hash(self, archive: str, arhash: bytes, listoffiles: list[str],
+                          targetpath: str) -> list[str | None]:
+        return self._extract(archive, arhash, listoffiles, targetpath)
+
+    def extract_all(self, archive: str, targetpath: str) -> None:
+        info('Extracting all from {}...'.format(archive))
+        idx = bsa_index(archive)
+        if idx is not None:
+            idx.extract_all(archive, targetpath)
+        else:
+            BsaArchivePlugin._extract_all_via_bethesda_structs(archive, targetpath)
+        info('Extraction done')
+
+    def extract_all_and_hash(self, archive: str, targetpath: str) -> dict[str, tuple[int, bytes]] | None:
+        idx = bsa_index(archive)
+        if idx is None:
+            return None
+        info('Extracting and hashing all from {}...'.format(archive))
+        out = idx.extract_all_and_hash(archive, targetpath)
+        info('Extraction done')
+        return out
+
+    def hash_all(self, archive: str) -> list[tuple[str, int, bytes]] | None:
+        idx = bsa_index(archive)
+        if idx is None:
+            return None
+        info('Hashing all in {}...'.format(archive))
+        out = idx.hash_all(archive)
+        info('Hashing done')
+        return out
+
+    @staticmethod
+    def _extract(archive: str, arhash: bytes | None, listoffiles: list[str], targetpath: str) -> list[str | None]:
         info('Extracting {} file(s) from {}...'.format(len(listoffiles), archive))
-        bsa = BSAArchive.parse_file(archive)
-        # names = bsa.container.file_names
-        # print(names)
-        # cannot extract partially, have to extract the whole thing
-        bsa.extract(targetpath)
-        out = ArchivePluginBase.unarchived_list_helper(archive, listoffiles, targetpath)
+        idx = bsa_index(archive, arhash)
+        if idx is not None:
+            out = idx.extract(archive, listoffiles, targetpath)
+        else:
+            # cannot extract partially, have to extract the whole thing
+            BsaArchivePlugin._extract_all_via_bethesda_structs(archive, targetpath)
+            out = ArchivePluginBase.unarchived_list_helper(archive, listoffiles, targetpath)
         info('Extraction done')
         return out
 
-    def extract_all(self, archive: str, targetpath: str) -> None:
-        info('Extracting all from {}...'.format(archive))
+    @staticmethod
+    def _extract_all_via_bethesda_structs(archive: str, targetpath: str) -> None:
+        # fallback for BSA flavors not supported by bsa_reader
+        from bethesda_structs.archive import BSAArchive
         bsa = BSAArchive.parse_file(archive)
         bsa.extract(targetpath)
-        info('Extraction done')
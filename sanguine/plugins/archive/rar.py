@@ -3,7 +3,7 @@
 import subprocess
 
 from sanguine.common import *
-from sanguine.helpers.archives import ArchivePluginBase
+from sanguine.helpers.archives import ArchivePluginBase, ArchiveMember, ArchiveListing, normalize_archive_intra_path
 
 
 def _unrar_exe() -> str:
@@ -27,6 +27,45 @@ class RarArchivePlugin(ArchivePluginBase):
         info('Extraction done')
         return out
 
+    def extract_planned(self, archive: str, listoffiles: list[str], targetpath: str,
+                        listing: ArchiveListing) -> list[str | None]:
+        found, missing = listing.plan(listoffiles)
+        info('Extracting {} file(s) from {}{}...'.format(len(found), archive,
+                                                         ' (solid)' if listing.solid_blocks_for(found) else ''))
+        assert is_normalized_dir_path(targetpath)
+
+        if len(found) > 0:
+            filespec = ArchivePluginBase.prepare_file_spec(found, targetpath)
+            syscall = [_unrar_exe(), 'x', archive, filespec, targetpath]
+            info(' '.join(syscall))
+            subprocess.check_call(syscall)
+
+        out = ArchivePluginBase.planned_list_helper(archive, listoffiles, targetpath, missing)
+        info('Extraction done')
+        return out
+
+    def list_members(self, archive: str) -> list[ArchiveMember] | None:
+        # 'lt': technical listing, 'Key: Value' lines; solid rar is one solid stream, which we report as block 0
+        syscall = [_unrar_exe(), 'lt', archive]
+        listing = subprocess.run(syscall, check=True, capture_output=True, encoding='utf-8', errors='replace').stdout
+        out: list[ArchiveMember] = []
+        solid = False
+        member: dict[str, str] = {}
+        for ln in listing.splitlines() + ['']:
+            k, sep, v = ln.strip().partition(': ')
+            if k == 'Details':
+                solid = 'solid' in v.split(', ')
+            elif k == 'Name':
+                member = {'Name': v}
+            elif sep and len(member) > 0:
+                member[k] = v
+            elif ln.strip() == '' and len(member) > 0:
+                if member.get('Type') == 'File':
+                    out.append(ArchiveMember(normalize_archive_intra_path(member['Name'].replace('/', '\\')),
+                                             int(member.get('Size', '0')), 0 if solid else -1))
+                member = {}
+        return out
+
     def extract_all(self, archive: str, targetpath: str) -> None:
         info('Extracting all from {}...'.format(archive))
 
@@ -4,7 +4,7 @@ import os.path
 import subprocess
 
 from sanguine.common import *
-from sanguine.helpers.archives import ArchivePluginBase
+from sanguine.helpers.archives import ArchivePluginBase, ArchiveMember, ArchiveListing, normalize_archive_intra_path
 
 
 def _7z_exe() -> str:
@@ -29,6 +29,47 @@ class SevenzArchivePlugin(ArchivePluginBase):
         info('Extraction done')
         return out
 
+    def extract_planned(self, archive: str, listoffiles: list[str], targetpath: str,
+                        listing: ArchiveListing) -> list[str | None]:
+        found, missing = listing.plan(listoffiles)
+        info('Extracting {} file(s) ({} solid block(s)) from {}...'.format(len(found),
+                                                                         len(listing.solid_blocks_for(found)),
+                                                                         archive))
+        assert is_normalized_dir_path(targetpath)
+
+        if len(found) > 0:
+            filespec = ArchivePluginBase.prepare_file_spec(found, targetpath)
+            syscall = [_7z_exe(), 'x', '-o' + targetpath, archive, filespec]
+            info(' '.join(syscall))
+            subprocess.check_call(syscall)
+
+        out = ArchivePluginBase.planned_list_helper(archive, listoffiles, targetpath, missing)
+        info('Extraction done')
+        return out
+
+    def list_members(self, archive: str) -> list[ArchiveMember] | None:
+        # -slt: one 'Key = Value' block per member, separated by empty lines, after '----------' line
+        syscall = [_7z_exe(), 'l', '-slt', '-sccUTF-8', archive]
+        listing = subprocess.run(syscall, check=True, capture_output=True, encoding='utf-8', errors='replace').stdout
+        out: list[ArchiveMember] = []
+        started = False
+        block: dict[str, str] = {}
+        for ln in listing.splitlines() + ['']:
+            if not started:
+                started = ln.strip() == '----------'
+                continue
+            if ln.strip() == '':
+                if 'Path' in block and block.get('Folder') != '+' and not block.get('Attributes', '').startswith('D'):
+                    out.append(ArchiveMember(normalize_archive_intra_path(block['Path'].replace('/', '\\')),
+                                             int(block.get('Size') or 0),
+                                             int(block['Block']) if block.get('Block') else -1))
+                block = {}
+                continue
+            k, sep, v = ln.partition(' = ')
+            if sep:
+                block[k] = v
+        return out
+
     def extract_all(self, archive: str, targetpath: str) -> None:
         info('Extracting all from {}...'.format(archive))
 
@@ -1,8 +1,88 @@
+import hashlib
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 from sanguine.common import *
 from sanguine.helpers.archives import ArchivePluginBase
 
+### multithreaded extraction
+# zip members are compressed independently, and zlib releases GIL, so several threads, each with its own
+#   ZipFile over the same archive, can extract (and hash) different ranges of members concurrently
+
+_ZIP_MAX_THREADS: int = 4  # we're usually running within one of Parallel processes already
+_ZIP_MIN_BYTES_PER_THREAD: int = 16 * 1048576
+_ZIP_BLOCK_SIZE: int = 1048576
+_WINDOWS_ILLEGAL_CHARS_TABLE = str.maketrans(':<>|"?*', '_______')
+
+
+def _member_target_path(targetpath: str, name: str) -> str:
+    # same sanitizing as ZipFile.extract() does: no drive letters, no absolute paths, no '..'
+    arcname = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in ('', os.path.curdir, os.path.pardir))
+    if os.path.sep == '\\':
+        arcname = arcname.translate(_WINDOWS_ILLEGAL_CHARS_TABLE)
+    return targetpath + arcname
+
+
+def _extract_members(archive: str, infos: list[zipfile.ZipInfo], targetpath: str,
+                     hashing: bool) -> list[tuple[str, int, bytes | None]]:
+    # returns [(path, size, sha256 | None)]
+    out = []
+    with zipfile.ZipFile(archive) as z:
+        for zi in infos:
+            fpath = _member_target_path(targetpath, zi.filename)
+            if zi.is_dir():
+                os.makedirs(fpath, exist_ok=True)
+                continue
+            os.makedirs(os.path.split(fpath)[0], exist_ok=True)
+            h = hashlib.sha256() if hashing else None
+            fsize = 0
+            with z.open(zi) as rf, open(fpath, 'wb') as wf:
+                while True:
+                    bb = rf.read(_ZIP_BLOCK_SIZE)
+                    if not bb:
+                        break
+                    wf.write(bb)
+                    if h is not None:
+                        h.update(bb)
+                    fsize += len(bb)
+            assert fsize == zi.file_size
+            out.append((fpath, fsize, h.digest() if h is not None else None))
+    return out
+
+
+def _split_into_ranges(infos: list[zipfile.ZipInfo]) -> list[list[zipfile.ZipInfo]]:
+    # contiguous ranges (in archive order, to keep reads mostly sequential) of roughly equal uncompressed size
+    total = sum(zi.file_size for zi in infos)
+    nthreads = max(1, min(_ZIP_MAX_THREADS, os.cpu_count() or 1, total // _ZIP_MIN_BYTES_PER_THREAD, len(infos)))
+    if nthreads == 1:
+        return [infos]
+    ranges: list[list[zipfile.ZipInfo]] = [[]]
+    perthread = total / nthreads
+    acc = 0
+    for zi in sorted(infos, key=lambda x: x.header_offset):
+        if acc >= perthread * len(ranges) and len(ranges) < nthreads:
+            ranges.append([])
+        ranges[-1].append(zi)
+        acc += zi.file_size
+    return ranges
+
+
+def _extract_members_mt(archive: str, infos: list[zipfile.ZipInfo], targetpath: str,
+                        hashing: bool) -> list[tuple[str, int, bytes | None]]:
+    ranges = _split_into_ranges(infos)
+    if len(ranges) == 1:
+        return _extract_members(archive, infos, targetpath, hashing)
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(_extract_members, archive, r, targetpath, hashing) for r in ranges]
+        out = []
+        for fut in futures:
+            out += fut.result()
+    return out
+
 
 class ZipArchivePlugin(ArchivePluginBase):
     def extensions(self) -> list[str]:
@@ -10,29 +90,38 @@ class ZipArchivePlugin(ArchivePluginBase):
 
     def extract(self, archive: str, listoffiles: list[str], targetpath: str) -> list[str | None]:
         info('Extracting {} file(s) from {}...'.format(len(listoffiles), archive))
-        z = zipfile.ZipFile(archive)
-        names = {n.lower(): n for n in z.namelist()}
-        lof_normalized = []
+        with zipfile.ZipFile(archive) as z:
+            infos = {zi.filename.lower(): zi for zi in z.infolist()}
+        requested = []
         for f in listoffiles:
             normf = f.replace('\\', '/')
-            if __debug__ and normf not in names:
-                assert False
-            lof_normalized.append(names[normf])
-        out = []
-        for f in lof_normalized:
-            z.extract(f, path=targetpath)
-            if os.path.isfile(targetpath + f):
-                out.append(targetpath + f)
-            else:
-                warn('{} NOT EXTRACTED from {}'.format(f, archive))
-                out.append(None)
-        z.close()
-        print('Extraction done')
+            zi = infos.get(normf)
+            if zi is None:
+                assert not __debug__
+                warn('{} NOT FOUND in {}'.format(f, archive))
+            requested.append(zi)
+        extracted = _extract_members_mt(archive, list({zi.filename: zi for zi in requested if zi is not None}.values()),
+                                        targetpath, False)
+        bypath = {fpath for fpath, _, _ in extracted}
+        out: list[str | None] = []
+        for zi in requested:
+            fpath = _member_target_path(targetpath, zi.filename) if zi is not None else None
+            out.append(fpath if fpath in bypath else None)
+        info('Extraction done')
         return out
 
     def extract_all(self, archive: str, targetpath: str) -> None:
         info('Extracting all from {}...'.format(archive))
-        z = zipfile.ZipFile(archive)
-        z.extractall(targetpath)
-        z.close()
+        with zipfile.ZipFile(archive) as z:
+            infos = z.infolist()
+        _extract_members_mt(archive, infos, targetpath, False)
+        info('Extraction done')
+
+    def extract_all_and_hash(self, archive: str, targetpath: str) -> dict[str, tuple[int, bytes]] | None:
+        info('Extracting and hashing all from {}...'.format(archive))
+        with zipfile.ZipFile(archive) as z:
+            infos = z.infolist()
+        out = {os.path.normcase(fpath): (fsize, h) for fpath, fsize, h in
+               _extract_members_mt(archive, infos, targetpath, True)}
         info('Extraction done')
+        return out
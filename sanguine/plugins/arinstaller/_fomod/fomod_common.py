@@ -1,11 +1,9 @@
 """
 Common FOMOD data structures (ModuleConfig.xml will be parsed to them using fomod_parser)
 """
-from bisect import bisect_left
-
 from sanguine.common import *
 from sanguine.gitdata.stable_json import StableJsonFlags
-from sanguine.helpers.archives import Archive, FileInArchive
+from sanguine.helpers.archives import Archive, FileInArchive, ArchiveIndex, archive_index
 from sanguine.helpers.arinstallers import ArInstaller
 
 
@@ -64,39 +62,19 @@ class FomodSrcDst:
 
 
 class ArchiveForFomodFilesAndFolders:
-    arfiles: dict[str, FileInArchive] = {}
-    arfiles4folders: list[tuple[str, FileInArchive]] = []
+    # thin wrapper over shared ArchiveIndex, which is built only once per archive
+    arfiles: dict[str, FileInArchive]
+    _index: ArchiveIndex
 
     def __init__(self, archive: Archive) -> None:
-        self.arfiles = {}
-        self.arfiles4folders = []
-        for f in archive.files:
-            self.arfiles[f.intra_path] = f
-            self.arfiles4folders.append((f.intra_path, f))
-        self.arfiles4folders.sort(key=lambda x: x[0])
+        self._index = archive_index(archive)
+        self.arfiles = self._index.by_intra_path
 
     def for_all_starting_with(self, src: str, f: Callable[[str, FileInArchive], None]) -> None:
-        found = bisect_left(self.arfiles4folders, src, key=lambda x: x[0])
-        if found == len(self.arfiles4folders):
-            return
-        assert 0 <= found < len(self.arfiles4folders)
-        assert src < self.arfiles4folders[found][0]
-        assert found == len(self.arfiles4folders) - 1 or self.arfiles4folders[found + 1][0] > src
-        idx = found
-        while True:
-            if idx == len(self.arfiles4folders):
-                break
-            fsrc = self.arfiles4folders[idx][0]
-            if not fsrc.startswith(src):
-                break
-
-            af = self.arfiles4folders[idx][1]
-            assert af.intra_path == fsrc
-
-            remainder = af.intra_path[len(src):]
-            f(remainder, af)
-
-            idx += 1
+        lsrc = len(src)
+        for af in self._index.all_starting_with(src):
+            assert af.intra_path.startswith(src)
+            f(af.intra_path[lsrc:], af)
 
 
 class FomodFilesAndFolders:
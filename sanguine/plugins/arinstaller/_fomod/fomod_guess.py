@@ -3,7 +3,15 @@ FOMOD guessing. Really complicated. Replaying all scenarios (a.k.a. forks) from
   (already parsed by fomod_parser) ModuleConfig.xml using _FomodGuessFakeUI, and then replaying
   again using FomodAutoinstallFakeUI
 Tries to keep number of forks in check separating independent selections from forks
+Search is branch-and-bound: forks are expanded and scored best-first by their coverage upper bounds
+  (against a specific archive), and whatever cannot beat the best fork found so far, is not expanded at all
+Exhaustive simulation results depend only on ModuleConfig.xml, so they're memoized (both in-process and on disk);
+  pruned ones depend on the archive, so for them only replays are memoized
 """
+import hashlib as _hashlib
+import heapq
+
+from sanguine.gitdata.stable_json import to_stable_json
 from sanguine.helpers.file_retriever import ArchiveFileRetriever
 from sanguine.plugins.arinstaller._fomod.fomod_common import *
 from sanguine.plugins.arinstaller._fomod.fomod_engine import FomodEngine, FomodEnginePluginSelector, \
@@ -201,7 +209,7 @@ def _find_required_xofs(ar4: ArchiveForFomodFilesAndFolders, fomodroot: str,
     fomodroot1 = '' if fomodroot == '' else fomodroot + '\\'
 
     xofs: dict[str, list[tuple[FomodInstallerSelection, FileInArchive]]] = {}
-    allcandidates: list[tuple[FomodInstallerSelection, FomodFilesAndFolders]] = true_or_false_plugins
+    allcandidates: list[tuple[FomodInstallerSelection, FomodFilesAndFolders]] = true_or_false_plugins.copy()
     for oof in one_of_plugins:
         allcandidates += oof
     for instsel, ff in allcandidates:
@@ -282,105 +290,334 @@ class _ProcessedFork:
         # self.engplugins=engplugins
 
 
-def fomod_guess(fomodroot: str, modulecfg: FomodModuleConfig, archive: Archive,
-                modfiles: dict[str, list[ArchiveFileRetriever]]) -> tuple[ArInstaller, int] | None:
-    processed_forks: list[_ProcessedFork] = []
-    remaining_forks: list[_FomodGuessFork] = [_FomodGuessFork([])]
-    info('Running simulations for FOMOD installer {}...'.format(modulecfg.module_name))
-    # if 'clear map' in modulecfg.module_name.lower():
-    #    pass
+### memo of simulations
 
-    nmodfiles = 0
-    for f, retr in modfiles.items():
-        for r in retr:
-            if r.archive_hash() == archive.archive_hash:
-                nmodfiles += 1
-                break  # for r
+_FOMOD_MEMO_VERSION = 2  # to be incremented whenever _ProcessedFork or simulation logic changes
 
-    while len(remaining_forks) > 0:
-        startingfork = remaining_forks[0]
-        remaining_forks = remaining_forks[1:]
-        fakeui = _FomodGuessFakeUI(startingfork)
-        engine = FomodEngine(modulecfg)
-        engine.select_no_radio_hack = True
-        engselections, _ = engine.run(
-            fakeui)  # we cannot use engfiles from GuessFakeUI run, need to re-run using AutoplayFakeUI to ensure correct order
-        processed_forks.append(
-            _ProcessedFork(fakeui.current_fork.true_or_false_plugins, fakeui.current_fork.one_of_plugins,
-                           engselections))
-        remaining_forks += fakeui.requested_forks
-        if len(processed_forks) + len(remaining_forks) > 50000:
-            alert('Too many simulations for {}, skipping'.format(modulecfg.module_name))
-            return None
-    info('{}: {} fork(s) found'.format(modulecfg.module_name, len(processed_forks)))
-
-    best_arinstaller: ArInstaller | None = None
-    best_coverage: int = 0
-    best_desired: int | None = None
+type _FomodReplays = dict[frozenset[FomodInstallerSelection], tuple[list[FomodInstallerSelection], FomodFilesAndFolders]]
+
+
+class _FomodGuessMemo:
+    forks: list[_ProcessedFork] | None  # None if never simulated exhaustively (pruned, or too many forks)
+    too_many_forks: bool
+    replays: _FomodReplays  # FomodAutoinstallFakeUI replays, selections -> engine.run() results
+    dirty: bool
+
+    def __init__(self, forks: list[_ProcessedFork] | None, toomanyforks: bool, replays: _FomodReplays) -> None:
+        self.forks = forks
+        self.too_many_forks = toomanyforks
+        self.replays = replays
+        self.dirty = False
+
+
+_fomod_guess_memos: dict[str, _FomodGuessMemo] = {}  # per-process, module config hash -> memo
+
+
+def _module_config_hash(modulecfg: FomodModuleConfig) -> str:
+    jsonstr = json.dumps(to_stable_json(modulecfg), sort_keys=True, separators=(',', ':'))
+    return _hashlib.sha256(jsonstr.encode('utf-8')).hexdigest()
+
+
+def _memo_fname(cachedir: str, cfghash: str) -> str:
+    return cachedir + 'fomodguess\\' + cfghash + '.pickle'
+
+
+def _load_memo(cachedir: str | None, cfghash: str) -> _FomodGuessMemo | None:
+    found = _fomod_guess_memos.get(cfghash)
+    if found is not None or cachedir is None:
+        return found
+    fname = _memo_fname(cachedir, cfghash)
+    if not os.path.isfile(fname):
+        return None
+    try:
+        with open(fname, 'rb') as rf:
+            data = pickle.load(rf)
+    except Exception as e:
+        warn('FOMOD: error loading {}: {}, will re-run simulations'.format(fname, e))
+        return None
+    if data[0] != _FOMOD_MEMO_VERSION:
+        return None
+    (_, forks, toomanyforks, replays) = data
+    memo = _FomodGuessMemo(forks, toomanyforks, replays)
+    _fomod_guess_memos[cfghash] = memo
+    return memo
+
+
+def _save_memo_if(cachedir: str | None, cfghash: str, memo: _FomodGuessMemo) -> None:
+    if cachedir is None or not memo.dirty:
+        return
+    fname = _memo_fname(cachedir, cfghash)
+    os.makedirs(os.path.split(fname)[0], exist_ok=True)
+    tmpfname = fname + '.tmp.' + str(os.getpid())  # the same FOMOD may be guessed in several processes at once
+    with open(tmpfname, 'wb') as wf:
+        # noinspection PyTypeChecker
+        pickle.dump((_FOMOD_MEMO_VERSION, memo.forks, memo.too_many_forks, memo.replays), wf)
+    os.replace(tmpfname, fname)
+    memo.dirty = False
+
+
+def _simulate_fork(modulecfg: FomodModuleConfig,
+                   startingfork: _FomodGuessFork) -> tuple[_ProcessedFork, list[_FomodGuessFork]]:
+    # returns processed fork, and forks requested while processing it
+    fakeui = _FomodGuessFakeUI(startingfork)
+    engine = FomodEngine(modulecfg)
+    engine.select_no_radio_hack = True
+    engselections, _ = engine.run(
+        fakeui)  # we cannot use engfiles from GuessFakeUI run, need to re-run using AutoplayFakeUI to ensure correct order
+    return (_ProcessedFork(fakeui.current_fork.true_or_false_plugins, fakeui.current_fork.one_of_plugins,
+                           engselections),
+            fakeui.requested_forks)
+
+
+def _replay(memo: _FomodGuessMemo, modulecfg: FomodModuleConfig,
+            selections: set[FomodInstallerSelection]) -> tuple[list[FomodInstallerSelection], FomodFilesAndFolders]:
+    key = frozenset(selections)
+    found = memo.replays.get(key)
+    if found is not None:
+        return found
+    # re-running FomodEngine with autoplay to ensure correct file overwrite order
+    autoplay = FomodAutoinstallFakeUI(list(selections))
+    engine2 = FomodEngine(modulecfg)
+    engselections, engfiles = engine2.run(autoplay)
+    autoplay.check_done()
+    memo.replays[key] = (engselections, engfiles)
+    memo.dirty = True
+    return engselections, engfiles
+
+
+### branch-and-bound
+
+_FOMOD_MAX_FORKS = 50000
+
+
+class _FomodCoverageBounds:
+    # upper bounds on coverage which a fork may achieve
+    # installed files are always a subset of (required + all conditional + files of selected plugins),
+    #   and each installed file is a winner within its own plugin, so union of per-plugin matches is a valid bound
+    always: set[str]
+    by_selection: dict[FomodInstallerSelection, set[str]]
+    _duplicates: set[FomodInstallerSelection]
+    _fomodroot: str
+    _ar4: ArchiveForFomodFilesAndFolders
+    _modfiles: dict[str, list[ArchiveFileRetriever]]
+
+    def __init__(self, modulecfg: FomodModuleConfig, fomodroot: str, ar4: ArchiveForFomodFilesAndFolders,
+                 modfiles: dict[str, list[ArchiveFileRetriever]]) -> None:
+        self._fomodroot = fomodroot
+        self._ar4 = ar4
+        self._modfiles = modfiles
+        self.always = self._matching(modulecfg.required)
+        for cond in modulecfg.conditional_file_installs:
+            self.always |= self._matching(cond.files)
+        self.by_selection = {}
+        self._duplicates = set()
+        for istep in modulecfg.install_steps:
+            for grp in istep.groups:
+                for plugin in grp.plugins:
+                    sel = FomodInstallerSelection(istep.name, grp.name, plugin.name)
+                    if sel in self.by_selection:  # duplicate names, have to merge to keep the bound valid
+                        self.by_selection[sel] |= self._matching(plugin.files)
+                        self._duplicates.add(sel)
+                    else:
+                        self.by_selection[sel] = self._matching(plugin.files)
+
+    def _matching(self, ff: FomodFilesAndFolders | None) -> set[str]:
+        if ff is None:
+            return set()
+        out: set[str] = set()
+        for fpath, _, fia in ff.all_files(self._fomodroot, self._ar4):
+            retr = self._modfiles.get(fpath)
+            if retr is not None and truncate_file_hash(retr[0].file_hash) == fia.file_hash:
+                out.add(fpath)
+        return out
+
+    def fork_bound(self, pf: _ProcessedFork) -> int:
+        covered = self.always.copy()
+        for sel in pf.engselections:
+            covered |= self.by_selection.get(sel, set())
+        for sel, _ in pf.tofs:
+            covered |= self.by_selection.get(sel, set())
+        for oof in pf.oofs:
+            for sel, _ in oof:
+                covered |= self.by_selection.get(sel, set())
+        return len(covered)
+
+    def partial_fork_bound(self, fork: _FomodGuessFork) -> int:
+        # optimistic: every plugin which is not (yet) deselected in this fork, may end up selected
+        deselected = {sel for sel, val in fork.start_step if val is False and sel not in self._duplicates}
+        covered = self.always.copy()
+        for sel, matching in self.by_selection.items():
+            if sel not in deselected:
+                covered |= matching
+        return len(covered)
+
+
+class _FomodGuessBest:
+    arinstaller: ArInstaller | None
+    coverage: int
+    desired: int | None
+
+    def __init__(self) -> None:
+        self.arinstaller = None
+        self.coverage = 0
+        self.desired = None
+
+    def can_be_beaten_with(self, bound: int) -> bool:
+        # candidate wins only with n > coverage, or with n == coverage and ndesired < desired;
+        #   as ndesired >= n, the latter is impossible when desired == coverage
+        # also, with n == 0 candidate cannot pass n > ndesired / 2 check
+        return not (bound == 0 or bound < self.coverage or (bound == self.coverage and self.desired == self.coverage))
+
+    def is_ideal(self, modfiles: dict[str, list[ArchiveFileRetriever]]) -> bool:
+        return len(modfiles) == self.desired == self.coverage
+
+
+def _score_fork(memo: _FomodGuessMemo, modulecfg: FomodModuleConfig, archive: Archive, fomodroot: str,
+                ar4: ArchiveForFomodFilesAndFolders, modfiles: dict[str, list[ArchiveFileRetriever]],
+                pf: _ProcessedFork, bound: int, best: _FomodGuessBest) -> None:
+    selected_plugins: set[FomodInstallerSelection] = set(pf.engselections)
+    known: dict[FomodInstallerSelection, FomodFilesAndFolders] = {}
+    for sel, tof in pf.tofs:
+        assert sel not in known
+        if tof is not None:
+            known[sel] = tof
+    for oof in pf.oofs:
+        for sel, of in oof:
+            if sel in known:
+                assert False
+            if of is not None:
+                known[sel] = of
+    required_xofs: set[FomodInstallerSelection] = set(
+        _find_required_xofs(ar4, fomodroot, modfiles, pf.tofs, pf.oofs))
+
+    '''
+    # gathering properly ordered selections
+    selections: list[FomodInstallerSelection] = []
+    # files: FomodFilesAndFolders = pf.engplugins.copy()
+    for istep in modulecfg.install_steps:
+        for group in istep.groups:
+            for plugin in group.plugins:
+                sel = FomodInstallerSelection(istep.name, group.name, plugin.name)
+                if sel in required_xofs:
+                    if sel in known:
+                        assert known[sel] is not None
+                        selections.append(sel)
+                        # files.merge(known[sel])
+                    else:
+                        selections.append(sel)
+                        # nothing to merge - it is empty (can happen as a result of empty entry in SelectExactlyOne)
+                elif sel in selected_plugins:
+                    selections.append(sel)
+                else:
+                    pass
+    '''
+
+    engselections, engfiles = _replay(memo, modulecfg, required_xofs | selected_plugins)
+
+    candidate: FomodArInstaller = FomodArInstaller(archive, fomodroot, engfiles, engselections)
+    n = 0
+    ndesired = 0
+    for fpath, fia in candidate.all_desired_files():
+        ndesired += 1
+        if fpath in modfiles and truncate_file_hash(modfiles[fpath][0].file_hash) == fia.file_hash:
+            n += 1
+    assert n <= bound
+    if n > (ndesired / 2):
+        if n > best.coverage or (
+                n == best.coverage and ndesired < best.desired):
+            best.coverage = n
+            best.arinstaller = candidate
+            best.desired = ndesired
+
+
+def _score_memoized_forks(memo: _FomodGuessMemo, modulecfg: FomodModuleConfig, archive: Archive, fomodroot: str,
+                          ar4: ArchiveForFomodFilesAndFolders, modfiles: dict[str, list[ArchiveFileRetriever]],
+                          bounds: _FomodCoverageBounds, best: _FomodGuessBest) -> None:
+    # best-first; sort is stable, so among equal bounds original fork order is preserved
+    bounded = sorted(((bounds.fork_bound(pf), pf) for pf in memo.forks), key=lambda x: -x[0])
     i = 0
-    ar4 = ArchiveForFomodFilesAndFolders(archive)
-    for pf in processed_forks:
+    for bound, pf in bounded:
+        if not best.can_be_beaten_with(bound):
+            debug('FOMOD: {}: pruned {} of {} fork(s)'.format(modulecfg.module_name, len(bounded) - i,
+                                                                len(bounded)))
+            break  # bounds are sorted, so nothing below can win either
         i += 1
         if i % 500 == 0:
             info('{}...'.format(i))
-        selected_plugins: set[FomodInstallerSelection] = set(pf.engselections)
-        known: dict[FomodInstallerSelection, FomodFilesAndFolders] = {}
-        for sel, tof in pf.tofs:
-            assert sel not in known
-            if tof is not None:
-                known[sel] = tof
-        for oof in pf.oofs:
-            for sel, of in oof:
-                if sel in known:
-                    assert False
-                if of is not None:
-                    known[sel] = of
-        required_xofs: set[FomodInstallerSelection] = set(
-            _find_required_xofs(ar4, fomodroot, modfiles, pf.tofs, pf.oofs))
-
-        '''
-        # gathering properly ordered selections
-        selections: list[FomodInstallerSelection] = []
-        # files: FomodFilesAndFolders = pf.engplugins.copy()
-        for istep in modulecfg.install_steps:
-            for group in istep.groups:
-                for plugin in group.plugins:
-                    sel = FomodInstallerSelection(istep.name, group.name, plugin.name)
-                    if sel in required_xofs:
-                        if sel in known:
-                            assert known[sel] is not None
-                            selections.append(sel)
-                            # files.merge(known[sel])
-                        else:
-                            selections.append(sel)
-                            # nothing to merge - it is empty (can happen as a result of empty entry in SelectExactlyOne)
-                    elif sel in selected_plugins:
-                        selections.append(sel)
-                    else:
-                        pass
-        '''
+        _score_fork(memo, modulecfg, archive, fomodroot, ar4, modfiles, pf, bound, best)
+        if best.is_ideal(modfiles):
+            break
 
-        # re-running FomodEngine with autoplay to ensure correct file overwrite order
-        autoplay = FomodAutoinstallFakeUI(list(required_xofs | selected_plugins))
-        engine2 = FomodEngine(modulecfg)
-        engselections, engfiles = engine2.run(autoplay)
-        autoplay.check_done()
 
-        candidate: FomodArInstaller = FomodArInstaller(archive, fomodroot, engfiles, engselections)
-        n = 0
-        ndesired = 0
-        for fpath, fia in candidate.all_desired_files():
-            ndesired += 1
-            if fpath in modfiles and truncate_file_hash(modfiles[fpath][0].file_hash) == fia.file_hash:
-                n += 1
-        if n > (ndesired / 2):
-            if n > best_coverage or (
-                    n == best_coverage and ndesired < best_desired):
-                best_coverage = n
-                best_arinstaller = candidate
-                best_desired = ndesired
-
-            if len(modfiles) == best_desired == best_coverage:  # ideal case found
+def _search_forks(memo: _FomodGuessMemo, modulecfg: FomodModuleConfig, archive: Archive, fomodroot: str,
+                  ar4: ArchiveForFomodFilesAndFolders, modfiles: dict[str, list[ArchiveFileRetriever]],
+                  bounds: _FomodCoverageBounds, best: _FomodGuessBest) -> bool:
+    # simulates and scores forks best-first by their partial bounds; partial forks which cannot beat the best
+    #   fork found so far, are dropped without expanding them
+    # returns False if there are too many forks even with pruning
+    info('Running simulations for FOMOD installer {}...'.format(modulecfg.module_name))
+    processed_forks: list[_ProcessedFork] = []
+    startingfork = _FomodGuessFork([])
+    remaining_forks: list[tuple[int, int, _FomodGuessFork]] = [  # heap of (-bound, seq, fork)
+        (-bounds.partial_fork_bound(startingfork), 0, startingfork)]
+    nforks = 1
+    npruned = 0
+    while len(remaining_forks) > 0:
+        negbound, _, fork = heapq.heappop(remaining_forks)
+        if not best.can_be_beaten_with(-negbound):
+            npruned += 1 + len(remaining_forks)  # it is a heap, so nothing remaining can win either
+            break
+        pf, requested = _simulate_fork(modulecfg, fork)
+        processed_forks.append(pf)
+        for rq in requested:
+            heapq.heappush(remaining_forks, (-bounds.partial_fork_bound(rq), nforks, rq))
+            nforks += 1
+
+        bound = bounds.fork_bound(pf)
+        if best.can_be_beaten_with(bound):
+            _score_fork(memo, modulecfg, archive, fomodroot, ar4, modfiles, pf, bound, best)
+            if best.is_ideal(modfiles):
+                npruned += len(remaining_forks)
                 break
 
-    return best_arinstaller, best_coverage
+        if len(processed_forks) + len(remaining_forks) > _FOMOD_MAX_FORKS:
+            stillpossible = [rf for rf in remaining_forks if best.can_be_beaten_with(-rf[0])]
+            npruned += len(remaining_forks) - len(stillpossible)
+            heapq.heapify(stillpossible)
+            remaining_forks = stillpossible
+            if len(processed_forks) + len(remaining_forks) > _FOMOD_MAX_FORKS:
+                alert('Too many simulations for {}, skipping'.format(modulecfg.module_name))
+                return False
+
+    info('{}: {} fork(s) simulated, {} pruned'.format(modulecfg.module_name, len(processed_forks), npruned))
+    if npruned == 0:  # exhaustive, good for any archive
+        memo.forks = processed_forks
+        memo.dirty = True
+    return True
+
+
+def fomod_guess(fomodroot: str, modulecfg: FomodModuleConfig, archive: Archive,
+                modfiles: dict[str, list[ArchiveFileRetriever]],
+                cachedir: str | None = None) -> tuple[ArInstaller, int] | None:
+    cfghash = _module_config_hash(modulecfg)
+    memo = _load_memo(cachedir, cfghash)
+    if memo is None:
+        memo = _FomodGuessMemo(None, False, {})
+        _fomod_guess_memos[cfghash] = memo
+    if memo.too_many_forks:
+        return None
+
+    best = _FomodGuessBest()
+    ar4 = ArchiveForFomodFilesAndFolders(archive)
+    bounds = _FomodCoverageBounds(modulecfg, fomodroot, ar4, modfiles)
+    if memo.forks is not None:
+        debug('FOMOD: using memoized simulations for {}'.format(modulecfg.module_name))
+        _score_memoized_forks(memo, modulecfg, archive, fomodroot, ar4, modfiles, bounds, best)
+    elif not _search_forks(memo, modulecfg, archive, fomodroot, ar4, modfiles, bounds, best):
+        memo.too_many_forks = True
+        memo.dirty = True
+        _save_memo_if(cachedir, cfghash, memo)
+        return None
+
+    _save_memo_if(cachedir, cfghash, memo)
+    return best.arinstaller, best.coverage
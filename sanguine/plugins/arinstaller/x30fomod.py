@@ -95,12 +95,14 @@ class FomodArInstallerPlugin(ArInstallerPluginBase):
     extra_data: dict[bytes, _FomodArInstallerPluginExtraData] | None
     no_extra_data: list[bytes]
     exceptions: dict[bytes, str]
+    cache_dir: str | None
 
     def __init__(self):
         super().__init__()
         self.extra_data = None
         self.no_extra_data = []
         self.exceptions = {}
+        self.cache_dir = None
 
     def name(self) -> str:
         return 'FOMOD'
@@ -114,7 +116,7 @@ class FomodArInstallerPlugin(ArInstallerPluginBase):
         bestguess = None
         bestn = None
         for root, modulecfg in instdata.module_configs.items():
-            guess0 = fomod_guess(root, modulecfg, archive, modfiles)
+            guess0 = fomod_guess(root, modulecfg, archive, modfiles, self.cache_dir)
             if guess0 is not None:
                 guess, n = guess0
                 if bestguess is None or n > bestn:
@@ -135,6 +137,9 @@ class FomodArInstallerPlugin(ArInstallerPluginBase):
     def extra_data_factory(self) -> ExtraArchiveDataFactory | None:
         return FomodExtraArchiveDataFactory()
 
+    def set_cache_dir(self, cachedir: str) -> None:
+        self.cache_dir = cachedir
+
     def add_extra_data(self, arh: bytes, data: _FomodArInstallerPluginExtraData | None | Exception) -> None:
         if data is None:
             self.no_extra_data.append(truncate_file_hash(arh))
@@ -4,7 +4,7 @@ BAIN installer. In practice very rare, mostly superseded by FOMOD
 import re
 
 from sanguine.common import *
-from sanguine.helpers.archives import Archive, FileInArchive
+from sanguine.helpers.archives import Archive, FileInArchive, archive_index
 from sanguine.helpers.arinstallers import ArInstallerPluginBase, ArInstaller, ExtraArchiveDataFactory
 from sanguine.helpers.file_retriever import ArchiveFileRetriever
 
@@ -87,25 +87,18 @@ class BainArInstallerPlugin(ArInstallerPluginBase):
             return None
 
         srch = FastSearchOverPartialStrings([(bf, True) for bf in bainfolders])
-        for modpath, rlist in modfiles.items():
-            if __debug__:
-                r0 = rlist[0]
-                for r in rlist:
-                    assert r.file_hash == r0.file_hash
-
+        for modpath, fias in archive_index(archive).modfile_matches(modfiles).items():
             unique_folder = None
-            for r in rlist:
-                assert isinstance(r, ArchiveFileRetriever)
-                if r.archive_hash() == archive.archive_hash:
-                    inarrpath = r.single_archive_retrievers[0].file_in_archive.intra_path
-                    found = srch.find_val_for_str(inarrpath)
-                    if found is not None and found[1]:
-                        assert inarrpath.startswith(found[0])
-                        if unique_folder is None:
-                            unique_folder = found[0]
-                        else:
-                            unique_folder = False
-                            break
+            for fia in fias:
+                inarrpath = fia.intra_path
+                found = srch.find_val_for_str(inarrpath)
+                if found is not None and found[1]:
+                    assert inarrpath.startswith(found[0])
+                    if unique_folder is None:
+                        unique_folder = found[0]
+                    else:
+                        unique_folder = False
+                        break
 
             if unique_folder is not None and unique_folder is not False:
                 assert isinstance(unique_folder, str)
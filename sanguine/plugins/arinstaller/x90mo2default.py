@@ -5,7 +5,7 @@ Almost the same as SimpleUnpack installer, just copying non-data files to the ro
 Very unusually for plugins, relies on another plugin ('SIMPLEUNPACK' one).
 """
 from sanguine.common import *
-from sanguine.helpers.archives import Archive, FileInArchive
+from sanguine.helpers.archives import Archive, FileInArchive, archive_index
 from sanguine.helpers.arinstallers import ArInstallerPluginBase, ArInstaller, ExtraArchiveDataFactory
 from sanguine.helpers.file_retriever import ArchiveFileRetriever
 from sanguine.plugins.arinstaller.x99simpleunpack import SimpleUnpackArInstaller, SimpleUnpackArInstallerPlugin
@@ -23,8 +23,8 @@ class Mo2DefaultArInstaller(SimpleUnpackArInstaller):
         assert self.install_from_root.endswith('data\\')
         xtrapath = self.install_from_root[:-len('data\\')]
         lxtrapath = len(xtrapath)
-        for fia in self.archive.files:
-            if fia.intra_path.startswith(xtrapath) and not fia.intra_path.startswith(self.install_from_root):
+        for fia in archive_index(self.archive).all_starting_with(xtrapath):
+            if not fia.intra_path.startswith(self.install_from_root):
                 out.append((fia.intra_path[lxtrapath:], fia))
         return out
 
@@ -52,10 +52,11 @@ class Mo2DefaultArInstallerPlugin(ArInstallerPluginBase):
         if not simpleinst.install_from_root.endswith('data\\'):
             return None
 
-        candidate = Mo2DefaultArInstaller.from_root(archive, simpleinst.install_from_root)
-        nsimple = sum(1 for _ in simpleinst.all_desired_files())
-        ncandidate = sum(1 for _ in candidate.all_desired_files())
-        return candidate if ncandidate > nsimple else None
+        # candidate adds files under xtrapath which are not under install_from_root, so no need to list them all
+        xtrapath = simpleinst.install_from_root[:-len('data\\')]
+        nsimple = len(archive_index(archive).all_starting_with(simpleinst.install_from_root))
+        nxtra = len(archive_index(archive).all_starting_with(xtrapath))
+        return Mo2DefaultArInstaller.from_root(archive, simpleinst.install_from_root) if nxtra > nsimple else None
 
     def got_loaded_data(self, data: Any) -> None:
         assert False
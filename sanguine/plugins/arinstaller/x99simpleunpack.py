@@ -4,7 +4,7 @@ Very unusually for plugins, it is being relied on by another plugin: MO2DEFAULT
 """
 
 from sanguine.common import *
-from sanguine.helpers.archives import Archive, FileInArchive
+from sanguine.helpers.archives import Archive, FileInArchive, ArchiveIndex, archive_index
 from sanguine.helpers.arinstallers import ArInstallerPluginBase, ArInstaller, ExtraArchiveDataFactory
 from sanguine.helpers.file_retriever import ArchiveFileRetriever
 
@@ -32,12 +32,9 @@ class SimpleUnpackArInstaller(ArInstaller):
         return 'SIMPLEUNPACK'
 
     def all_desired_files(self) -> Iterable[tuple[str, FileInArchive]]:  # list[relpath]
-        out: list[tuple[str, FileInArchive]] = []
         lifr = len(self.install_from_root)
-        for fia in self.archive.files:
-            if fia.intra_path.startswith(self.install_from_root):
-                out.append((fia.intra_path[lifr:], fia))
-        return out
+        return [(fia.intra_path[lifr:], fia) for fia in archive_index(self.archive).all_starting_with(
+            self.install_from_root)]
 
     def install_params(self) -> Any:
         return SimpleUnpackArInstallerInstallData(self.install_from_root)
@@ -50,22 +47,14 @@ class SimpleUnpackArInstallerPlugin(ArInstallerPluginBase):
     def guess_arinstaller_from_vfs(self, archive: Archive, modname: str,
                                    modfiles: dict[str, list[ArchiveFileRetriever]]) -> ArInstaller | None:
         candidate_roots: dict[str, int] = {}
-        for modpath, rlist in modfiles.items():
-            if __debug__:
-                r0 = rlist[0]
-                for r in rlist:
-                    assert r.file_hash == r0.file_hash
-            for r in rlist:
-                assert isinstance(r, ArchiveFileRetriever)
-                if r.archive_hash() == archive.archive_hash:
-                    inarrpath = r.single_archive_retrievers[0].file_in_archive.intra_path
-                    if inarrpath.endswith(modpath):
-                        candidate_root = inarrpath[:-len(modpath)]
-                        if candidate_root == '' or candidate_root.endswith('\\'):
-                            if candidate_root not in candidate_roots:
-                                candidate_roots[candidate_root] = 1
-                            else:
-                                candidate_roots[candidate_root] += 1
+        for modpath, fias in archive_index(archive).modfile_matches(modfiles).items():
+            for fia in fias:
+                candidate_root = ArchiveIndex.root_for(fia.intra_path, modpath)
+                if candidate_root is not None:
+                    if candidate_root not in candidate_roots:
+                        candidate_roots[candidate_root] = 1
+                    else:
+                        candidate_roots[candidate_root] += 1
 
         if len(candidate_roots) == 0:
             return None
@@ -1,3 +1,6 @@
+from array import array
+from bisect import bisect_left
+
 from sanguine.common import *
 from sanguine.helpers.modlist import ModList
 from sanguine.helpers.project_config import (ModManagerConfig, ModManagerPluginBase, config_dir_path,
@@ -112,51 +115,55 @@ class Mo2ProjectConfig(ModManagerConfig):
 
     def resolve_vfs(self, sourcevfs: Iterable[FileOnDisk]) -> ResolvedVFS:
         info('MO2: Starting resolving VFS...')
-
+        files = list(sourcevfs)
+        nsourcevfs = len(files)
+        paths = [f.file_path for f in files]
+        order = sorted(range(nsourcevfs), key=paths.__getitem__)
+        sortedpaths = [paths[i] for i in order]
+
+        # each mod folder owns a contiguous range of sortedpaths, and as folders never contain each other,
+        #   these ranges go in the same order as sorted folders, so one merge-style pass over both is enough
         allenabled = list(self.master_modlist.all_enabled())
-        modsrch = FastSearchOverPartialStrings(
-            [(self.mo2dir + 'overwrite\\', -1)] + [(self.mo2dir + 'mods\\' + allenabled[i].lower() + '\\', i) for i in
-                                                   range(len(allenabled))])
-
-        source_to_target: dict[str, str] = {}
-        target_files0: dict[str, list[tuple[int, FileOnDisk]]] = {}
-        nsourcevfs = 0
-        for f in sourcevfs:
-            mf = self.parse_source_vfs(f.file_path)
-            relpath = self.modfile_to_target_vfs(mf)
-            assert relpath is not None
-            nsourcevfs += 1
-
-            res = modsrch.find_val_for_str(f.file_path)
-            assert res is not None
-            _, modidx = res
-            assert isinstance(modidx, int)
-            if __debug__:
+        folders = sorted([(self.mo2dir + 'overwrite\\', -1)] + [(self.mo2dir + 'mods\\' + allenabled[i].lower() + '\\', i)
+                                                                for i in range(len(allenabled))])
+        targetids = array('l', [-1]) * nsourcevfs
+        modpriorities = array('l', [0]) * nsourcevfs
+        targets: list[str] = []
+        targetidx: dict[str, int] = {}
+        nresolved = 0
+        lo = 0
+        for folder, modidx in folders:
+            assert folder.endswith('\\')
+            start = bisect_left(sortedpaths, folder, lo)
+            end = bisect_left(sortedpaths, folder[:-1] + chr(ord(folder[-1]) + 1), start)
+            lfolder = len(folder)
+            for k in range(start, end):
+                intramod = sortedpaths[k][lfolder:]
+                # same as modfile_to_target_vfs(), inlined as it is called for each file
                 if modidx < 0:
-                    assert modidx == -1
-                    assert f.file_path.startswith(self.mo2dir + 'overwrite\\')
+                    relpath = intramod
+                elif intramod.startswith('root\\'):  # MO2 RootBuilder plugin
+                    relpath = intramod[len('root\\'):]
                 else:
-                    assert f.file_path.startswith(self.mo2dir + 'mods\\' + allenabled[modidx].lower() + '\\')
-
-            if relpath not in target_files0:
-                target_files0[relpath] = []
-            target_files0[relpath].append((modidx, f))
-
-            assert f.file_path not in source_to_target
-            source_to_target[f.file_path] = relpath
-
-        assert nsourcevfs == len(source_to_target)
-
-        target_files: dict[str, list[FileOnDisk]] = {}
-        for key, val in target_files0.items():
-            val = sorted(val, key=lambda x: x[0])
-            assert key not in target_files
-            target_files[key] = [f[1] for f in val]
-            assert (len(target_files[key]) == len(set(target_files[key])))
+                    relpath = 'data\\' + intramod
+                tid = targetidx.get(relpath)
+                if tid is None:
+                    tid = len(targets)
+                    targetidx[relpath] = tid
+                    targets.append(relpath)
+                i = order[k]
+                targetids[i] = tid
+                modpriorities[i] = modidx
+            nresolved += end - start
+            lo = end
+        raise_if_not(nresolved == nsourcevfs)  # all source vfs files are expected to be within known folders
 
         info('MO2: ResolvedVFS: {} files resolved, with {} overwrites'.format(nsourcevfs,
-                                                                              nsourcevfs - len(target_files)))
-        return ResolvedVFS(source_to_target, target_files)
+                                                                              nsourcevfs - len(targets)))
+        return ResolvedVFS(files, targetids, modpriorities, targets)
+
+    def resolve_vfs_params(self) -> Any:
+        return [self.mo2dir, list(self.master_modlist.all_enabled())]
 
     def parse_source_vfs(self, path: str) -> ModFile:
         assert is_normalized_file_path(path)
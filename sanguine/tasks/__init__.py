@@ -2,7 +2,8 @@
 
 from sanguine.tasks._tasks_common import *
 from sanguine.tasks._tasks_logging import _ChildProcessLogHandler
-from sanguine.tasks._tasks_parallel import Parallel
+from sanguine.tasks._tasks_parallel import (Parallel, ParallelStartMode, set_default_parallel_start_mode,
+                                            add_forkserver_preload)
 from sanguine.tasks._tasks_shared import (SharedReturn, SharedPublication, SharedPubParam,
                                           _pool_of_shared_returns, SharedReturnParam, from_publication,
                                           make_shared_publication_param, make_shared_return_param)
@@ -1,9 +1,11 @@
 import logging
 import time
+from collections import deque
 from multiprocessing import SimpleQueue
-from threading import Thread
+from threading import Thread, Lock
 
-from sanguine.install.install_logging import (log_record, log_record_skip_console, make_log_record)
+from sanguine.install.install_logging import (log_record, log_record_skip_console, make_log_record,
+                                              make_log_record_from_site, LogCallSite)
 from sanguine.tasks._tasks_common import current_proc_num
 
 
@@ -11,17 +13,87 @@ def create_logging_thread(logq: SimpleQueue, outlogq: SimpleQueue) -> Thread:
     return Thread(target=_logging_thread_func, args=(logq, outlogq))
 
 
+### compact log transport
+# logq item: (procnum, newsites: list[(siteid, site)], entries: list[(levelno, when, msg, args, siteid | site)])
+# call sites are sent only once per process; LogRecords are created only in the logging thread
+
+_LOG_BATCH_MAX_ENTRIES: int = 64
+_LOG_BATCH_MAX_DELAY: float = 0.05  # checked only when the next entry is added; flush() covers the rest
+_PLAIN_LOG_ARG_TYPES: frozenset[type] = frozenset((str, int, float, bool, bytes, type(None)))
+
+
+def _compact_log_args(msg: str, args: tuple) -> tuple[str, tuple]:
+    # args which may be unpicklable or modified before the batch is sent, are formatted right away
+    if args:
+        for a in args:
+            if type(a) not in _PLAIN_LOG_ARG_TYPES:
+                return msg.format(*args), ()
+    return msg, args
+
+
+def master_log_entry(logq: SimpleQueue, levelno: int, msg: str, args: tuple, site: LogCallSite) -> None:
+    # master is not batched (it has no natural flush points), but still avoids pickling LogRecords
+    msg, args = _compact_log_args(msg, args)
+    logq.put((-1, [], [(levelno, time.perf_counter(), msg, args, site)]))
+
+
+class LogBatcher:
+    _logq: SimpleQueue
+    _proc_num: int
+    _site_ids: dict[LogCallSite, int]
+    _new_sites: list[tuple[int, LogCallSite]]
+    _entries: list[tuple[int, float, str, tuple, int]]
+    _first_t: float
+    _lock: Lock  # workers may log from several threads
+
+    def __init__(self, logq: SimpleQueue, procnum: int) -> None:
+        self._logq = logq
+        self._proc_num = procnum
+        self._site_ids = {}
+        self._new_sites = []
+        self._entries = []
+        self._first_t = 0.
+        self._lock = Lock()
+
+    def add(self, levelno: int, msg: str, args: tuple, site: LogCallSite) -> None:
+        msg, args = _compact_log_args(msg, args)
+        t = time.perf_counter()
+        with self._lock:
+            siteid = self._site_ids.get(site)
+            if siteid is None:
+                siteid = len(self._site_ids)
+                self._site_ids[site] = siteid
+                self._new_sites.append((siteid, site))
+            if len(self._entries) == 0:
+                self._first_t = t
+            self._entries.append((levelno, t, msg, args, siteid))
+            if (len(self._entries) >= _LOG_BATCH_MAX_ENTRIES or levelno >= logging.WARNING
+                    or t - self._first_t > _LOG_BATCH_MAX_DELAY):
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if len(self._entries) == 0:
+            return
+        self._logq.put((self._proc_num, self._new_sites, self._entries))
+        self._new_sites = []
+        self._entries = []
+
+
 class _ChildProcessLogHandler(logging.StreamHandler):
-    logq: SimpleQueue
+    # only for whatever goes directly via logging module, bypassing our debug()/info()/...
+    batcher: LogBatcher
 
-    def __init__(self, logq: SimpleQueue) -> None:
+    def __init__(self, batcher: LogBatcher) -> None:
         super().__init__()
-        self.logq = logq
+        self.batcher = batcher
 
     def emit(self, record: logging.LogRecord) -> None:
         assert current_proc_num() >= 0
-        self.logq.put((current_proc_num(), time.perf_counter(), record))
-        # print(record.getMessage())
+        self.batcher.add(record.levelno, record.getMessage(), (), (record.pathname, record.lineno, record.funcName))
 
 
 _log_elapsed: float | None = None
@@ -59,6 +131,8 @@ class _LoggingThreadState:
     _log_outq: SimpleQueue
     _last_n_without_wait: int
     _last_n_with_spurious_wait: int
+    _pending: deque[tuple[int, float, logging.LogRecord]]  # already received, but not processed yet
+    _sites: dict[tuple[int, int], LogCallSite]  # (procnum, siteid) -> site
 
     def __init__(self, outlogq: SimpleQueue) -> None:
         self._state = 0
@@ -67,10 +141,15 @@ class _LoggingThreadState:
         self._log_outq = outlogq
         self._last_n_without_wait = 0
         self._last_n_with_spurious_wait = 0
+        self._pending = deque()
+        self._sites = {}
 
     def read_log_rec(self, logq: SimpleQueue) -> tuple | None | bool:
         assert self._state == 0 or self._state == 1
 
+        if len(self._pending) > 0:
+            return self._pending.popleft()  # NB: doesn't affect overload detection, we didn't touch logq
+
         wt0 = time.perf_counter()
         record = logq.get()
         dwt = time.perf_counter() - wt0
@@ -102,15 +181,17 @@ class _LoggingThreadState:
             return True
         assert isinstance(record, tuple)
 
-        (procnum, t, rec) = record
-        rec.sanguine_when = t
-        if procnum >= 0:
-            rec.sanguine_prefix = 'Process #{}: '.format(procnum + 1)
-
-        # rec.sanguine_prefix = '@{}:'.format(self._state) + (rec.sanguine_prefix if hasattr(rec,'sanguine_prefix') and rec.sanguine_prefix is not None else '')
-        # rec.msg = 'LOGTHREAD:' + rec.msg  # TODO: remove
-
-        return record
+        (procnum, newsites, entries) = record
+        for siteid, site in newsites:
+            self._sites[(procnum, siteid)] = site
+        prefix = 'Process #{}: '.format(procnum + 1) if procnum >= 0 else ''
+        for levelno, t, msg, args, siteid in entries:
+            site = siteid if isinstance(siteid, tuple) else self._sites[(procnum, siteid)]
+            rec = make_log_record_from_site(levelno, msg, args, site, t)
+            rec.sanguine_prefix = prefix
+            self._pending.append((procnum, t, rec))
+        assert len(self._pending) > 0
+        return self._pending.popleft()
 
     def is_overloaded(self, threshold: int) -> bool:
         return self._last_n_without_wait >= threshold
@@ -1,14 +1,17 @@
 import heapq
 import logging
+import multiprocessing
 import time
 import traceback
 from multiprocessing import Queue as PQueue, SimpleQueue, Process, shared_memory
 from threading import Thread  # only for logging!
 
-from sanguine.install.install_logging import add_logging_handler, set_logging_hook
+from sanguine.install.install_logging import (add_logging_handler, LoggingHook, remove_inherited_logging_handlers,
+                                              set_logging_hook)
 from sanguine.tasks._tasks_common import *
-from sanguine.tasks._tasks_logging import (_ChildProcessLogHandler, create_logging_thread,
-                                           log_waited, log_elapsed, EndOfRegularLog, StopSkipping)
+from sanguine.tasks._tasks_logging import (_ChildProcessLogHandler, create_logging_thread, LogBatcher,
+                                           master_log_entry, log_waited, log_elapsed, EndOfRegularLog,
+                                           StopSkipping)
 from sanguine.tasks._tasks_shared import _pool_of_shared_returns, SharedReturnParam
 
 
@@ -44,33 +47,37 @@ def _process_nonown_tasks(tasks: list[list], dwait: float | None) -> tuple[Excep
         t0 = time.perf_counter()
         tp0 = time.process_time()
         if dwait is not None:
-            debug('after waiting for {:.2f}s, starting task {}'.format(dwait, task.name))
+            debug('after waiting for {:.2f}s, starting task {}', dwait, task.name)
             dwait = None
         else:
-            debug('starting task {}'.format(task.name))
+            debug('starting task {}', task.name)
         (ex, out) = _run_task(task, tplus[1:])
         if ex is not None:
             return ex, None  # for tplus
         elapsed = time.perf_counter() - t0
         cpu = time.process_time() - tp0
-        info('done task {}, cpu/elapsed={:.2f}/{:.2f}s'.format(task.name, cpu, elapsed))
+        info('done task {}, cpu/elapsed={:.2f}/{:.2f}s', task.name, cpu, elapsed)
         outtasks.append((task.name, (cpu, elapsed), out))
         # end of for tplus
     return None, outtasks
 
 
 def _proc_func(proc_num: int, globalinits: list[LambdaReplacement], inq: PQueue, outq: PQueue, logq) -> None:
+    logbatcher = LogBatcher(logq, proc_num)
     try:
         assert current_proc_num() == -1
         set_current_proc_num(proc_num)
 
-        add_logging_handler(_ChildProcessLogHandler(logq))
+        set_logging_hook(logbatcher.add)  # overrides hook inherited from master if forked
+        remove_inherited_logging_handlers()  # otherwise, if forked, we'd write to master's log file directly
+        add_logging_handler(_ChildProcessLogHandler(logbatcher))
         run_global_process_initializers(globalinits)
 
         debug('Process started')
         outq.put(ProcessStarted(proc_num))
         ex = None
         while True:
+            logbatcher.flush()  # before waiting, so nothing is stuck in the batch while we're idle
             waitt0 = time.perf_counter()
             msg = inq.get()
             if msg is None:
@@ -100,6 +107,50 @@ def _proc_func(proc_num: int, globalinits: list[LambdaReplacement], inq: PQueue,
         outq.put(e)
     _pool_of_shared_returns.cleanup()
     debug('exiting process')
+    logbatcher.flush()
+
+
+### start modes
+
+class ParallelStartMode(IntEnum):
+    Default = 0  # whatever multiprocessing uses by default on this platform
+    Spawn = 1  # each worker re-imports everything and replays global process initializers
+    Fork = 2  # workers inherit master's memory (copy-on-write), including already applied global initializers
+    Forkserver = 3  # workers are forked from a server process, which has preloaded sanguine modules
+
+
+_START_METHOD_NAMES: dict[ParallelStartMode, str] = {ParallelStartMode.Spawn: 'spawn',
+                                                     ParallelStartMode.Fork: 'fork',
+                                                     ParallelStartMode.Forkserver: 'forkserver'}
+_default_start_mode: ParallelStartMode = ParallelStartMode.Default
+# '__main__' is preloaded too, otherwise each forkserver child would re-import it (and everything it imports)
+_forkserver_preload: list[str] = ['__main__', 'sanguine.common', 'sanguine.tasks']
+
+
+def set_default_parallel_start_mode(mode: ParallelStartMode) -> None:  # for Parallels created without startmode
+    global _default_start_mode
+    _default_start_mode = mode
+
+
+def add_forkserver_preload(modules: list[str]) -> None:  # has effect only until the forkserver is started
+    global _forkserver_preload
+    for m in modules:
+        if m not in _forkserver_preload:
+            _forkserver_preload.append(m)
+
+
+def _mp_context(mode: ParallelStartMode) -> multiprocessing.context.BaseContext:
+    if mode == ParallelStartMode.Default:
+        return multiprocessing.get_context()
+    name = _START_METHOD_NAMES[mode]
+    if name not in multiprocessing.get_all_start_methods():
+        warn('Parallel: start method {} is not supported on this platform, using default {}'.format(
+            name, multiprocessing.get_start_method()))
+        return multiprocessing.get_context()
+    ctx = multiprocessing.get_context(name)
+    if name == 'forkserver':
+        ctx.set_forkserver_preload(_forkserver_preload)
+    return ctx
 
 
 class _TaskGraphNodeState(IntEnum):
@@ -228,6 +279,7 @@ class Parallel:
     _inqueues: list[PQueue]
     _procrunningconfirmed: list[bool]  # otherwise join() on a not running yet process may hang
     _logthread: Thread
+    _mp_ctx: multiprocessing.context.BaseContext
 
     _nprocesses: int
     _json_fname: str
@@ -248,7 +300,7 @@ class Parallel:
     _done_task_nodes: dict[str, tuple[_TaskGraphNode, Any]]  # name->(node,out)
     _pending_patterns: list[tuple[str, _TaskGraphNode]]  # pattern, node
     _dbg_serialize: bool
-    _old_logging_hook: Callable[[logging.LogRecord], None] | None | bool
+    _old_logging_hook: LoggingHook | None | bool
     _task_stats_srch: FastSearchOverPartialStrings
     _task_stats_data: dict[str, tuple[int, float, float]]
     _own_task_stats_data: dict[str, tuple[int, float, float]]
@@ -259,7 +311,7 @@ class Parallel:
     _last_log_stats_str: str | None
 
     def __init__(self, jsonfname: str | None, nproc: int = 0, dbg_serialize: bool = False,
-                 taskstatsofinterest: TaskStatsOfInterest = None) -> None:
+                 taskstatsofinterest: TaskStatsOfInterest = None, startmode: ParallelStartMode | None = None) -> None:
         # dbg_serialize allows debugging non-own Tasks
         assert current_proc_num() == -1
 
@@ -270,7 +322,9 @@ class Parallel:
             self._nprocesses = os.cpu_count() - 1  # -1 for the master process
         assert self._nprocesses >= 0
         self._dbg_serialize = dbg_serialize
-        info('Parallel: using {} processes...'.format(self._nprocesses))
+        self._mp_ctx = _mp_context(startmode if startmode is not None else _default_start_mode)
+        info('Parallel: using {} processes, start method {}...'.format(self._nprocesses,
+                                                                       self._mp_ctx.get_start_method()))
         self._json_fname = jsonfname
         self._json_weights = {}
         self._updated_json_weights = {}
@@ -311,25 +365,29 @@ class Parallel:
 
     def __enter__(self) -> "Parallel":
         increment_parallel_count()
-        self._old_logging_hook = set_logging_hook(lambda rec: self._logq.put((-1, time.perf_counter(), rec)))
+        self._old_logging_hook = set_logging_hook(
+            lambda levelno, msg, args, site: master_log_entry(self._logq, levelno, msg, args, site))
         self._processes = []
         self._process_requests = []
         # but not as keeping simplistic processesload[i] == 2 (it disbalances end of processing way too much)
         self._inqueues = []
         self._procrunningconfirmed = []  # otherwise join() on a not running yet process may hang
-        self._outq = PQueue()
-        self._logq = SimpleQueue()
+        self._outq = self._mp_ctx.Queue()
+        self._logq = self._mp_ctx.SimpleQueue()
         self._out_logq = SimpleQueue()
-        self._logthread = create_logging_thread(self._logq, self._out_logq)
-        self._logthread.start()
+        # forked workers inherit global initializers already applied in master, no need to replay them
+        globalinits = [] if self._mp_ctx.get_start_method() == 'fork' else get_global_process_initializers()
         for i in range(self._nprocesses):
-            inq = PQueue()
+            inq = self._mp_ctx.Queue()
             self._inqueues.append(inq)
-            p = Process(target=_proc_func, args=(i, get_global_process_initializers(), inq, self._outq, self._logq))
+            p = self._mp_ctx.Process(target=_proc_func, args=(i, globalinits, inq, self._outq, self._logq))
             self._processes.append(p)
             p.start()
             self._process_requests.append([])
             self._procrunningconfirmed.append(False)
+        # logging thread is started only after workers, so that fork() never happens while it holds a lock
+        self._logthread = create_logging_thread(self._logq, self._out_logq)
+        self._logthread.start()
         self._shutting_down = False
         self._has_joined = False
         assert len(self._process_requests) == len(self._processes)
@@ -555,17 +613,14 @@ class Parallel:
                 self._procrunningconfirmed[got.proc_num] = True
                 continue  # while True
 
-            strwait = '{:.2f}s'.format(dwait)
-            msgwarn = False
-            if dwait < 0.005:
-                strwait += '[MAIN THREAD SERIALIZATION]'
-                msgwarn = True
-
             (procnum, tasks) = got
 
+            mltimer.stage('results.logging')
+            msgwarn = dwait < 0.005
             info_or_perf_warn(msgwarn,
-                              'Parallel: after waiting for {}, received results of {} task(s) from process #{}'.format(
-                                  strwait, len(tasks), procnum + 1))
+                              'Parallel: after waiting for {:.2f}s{}, received results of {} task(s) from process #{}',
+                              dwait, '[MAIN THREAD SERIALIZATION]' if msgwarn else '', len(tasks), procnum + 1)
+            mltimer.stage('overhead')
 
             assert len(self._process_requests[procnum]) > 0
             self._process_requests[procnum] = self._process_requests[procnum][1:]
@@ -603,7 +658,7 @@ class Parallel:
         assert ch.task.name not in self._ready_task_nodes
         assert ch.task.name not in self._ready_own_task_nodes
         assert ch.task.name in self._pending_task_nodes
-        debug('Parallel: task {} is ready'.format(ch.task.name))
+        debug('Parallel: task {} is ready', ch.task.name)
         ch.state = _TaskGraphNodeState.Ready
         del self._pending_task_nodes[ch.task.name]
         if isinstance(ch.task, OwnTask):
@@ -622,8 +677,8 @@ class Parallel:
             (cput, taskt) = times
             assert procnum == expectedprocnum
             dt = time.perf_counter() - started
-            debug('Parallel: task {} from process #{} took elapsed/task/cpu={:.2f}/{:.2f}/{:.2f}s'.format(
-                taskname, procnum + 1, dt, taskt, cput))
+            debug('Parallel: task {} from process #{} took elapsed/task/cpu={:.2f}/{:.2f}/{:.2f}s',
+                  taskname, procnum + 1, dt, taskt, cput)
             self._update_task_stats(False, taskname, cpu=cput, elapsed=taskt)
             outt += taskt
 
@@ -648,7 +703,7 @@ class Parallel:
             return False, 0.
         taskpluses = []
         total_time = 0.
-        tasksstr = '['
+        tasknames = []
         t0 = time.perf_counter()
         i = 0
         tout = 0.
@@ -675,9 +730,8 @@ class Parallel:
 
             taskpluses.append(taskplus)
             total_time += node.own_weight
-            tasksstr += ',+' + node.task.name
+            tasknames.append(node.task.name)
 
-        tasksstr += ']'
         if len(taskpluses) == 0:
             return False, 0.
 
@@ -696,7 +750,7 @@ class Parallel:
         mltimer.stage('scheduler')
         # self.logq.put((-1,time.perf_counter(),make_log_record(logging.INFO, 'Parallel: assigned tasks {} to process #{}'.format(tasksstr, pidx + 1))))
         mltimer.stage('scheduler.logging')
-        info('Parallel: assigned tasks {} to process #{}'.format(tasksstr, pidx + 1))
+        info('Parallel: assigned tasks [{}] to process #{}', ',+'.join(tasknames), pidx + 1)
         if __debug__:  # pickle.dumps is expensive by itself
             debug('Parallel: request size: {}'.format(len(pickle.dumps(msg))))
         mltimer.stage('scheduler')
@@ -770,7 +824,7 @@ class Parallel:
         assert len(params) <= 3
 
         mltimer.stage('own-tasks.logging')
-        debug('Parallel: running own task {}'.format(ot.task.name))
+        debug('Parallel: running own task {}', ot.task.name)
         t0 = time.perf_counter()
         tp0 = time.process_time()
 
@@ -790,8 +844,7 @@ class Parallel:
         elapsed = time.perf_counter() - t0
         cpu = time.process_time() - tp0
         mltimer.stage('own-tasks.logging')
-        debug('Parallel: done own task {}, cpu/elapsed={:.2f}/{:.2f}s'.format(
-            ot.task.name, cpu, elapsed))
+        debug('Parallel: done own task {}, cpu/elapsed={:.2f}/{:.2f}s', ot.task.name, cpu, elapsed)
         towntask += elapsed
 
         mltimer.stage('scheduler')